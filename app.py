@@ -1,7 +1,45 @@
+import atexit
+import csv
+import hashlib
+import io
+import itertools
+import json
 import os
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import pickle
+import queue
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict, deque
+from functools import wraps
+from urllib.parse import urlencode
+from datetime import date, datetime, timedelta, time as time_of_day
+import click
+from flask import Flask, g, request, jsonify, make_response, abort, Response, has_app_context, has_request_context, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy import MetaData, Table, bindparam, case, delete, event, func, inspect, literal, literal_column, or_, select, text, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert, match as mysql_match
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+import socketio as socketio_lib
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder, same output
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional: without it responses are only ever gzipped
+    brotli = None
+try:
+    import openpyxl
+except ImportError:  # optional: without it exports are CSV only
+    openpyxl = None
 from flask_socketio import SocketIO, emit, join_room, leave_room
 
 ####################################################
@@ -20,9 +58,214 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///test.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool: DB_POOL_SIZE connections kept open, up to DB_MAX_OVERFLOW
+# more during bursts, waiting at most DB_POOL_TIMEOUT seconds for a free one.
+# Connections older than DB_POOL_RECYCLE seconds are replaced (keep it below
+# MySQL's wait_timeout) and, with DB_POOL_PRE_PING, checked before each use.
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 280))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')
 
-db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Optional read replica: GET/HEAD requests under /admin read from it; all
+# other requests, every write and every background job use DATABASE_URL.
+app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL', '')
+
+def engine_options(url):
+    options = {"pool_pre_ping": app.config['DB_POOL_PRE_PING'],
+               "pool_recycle": app.config['DB_POOL_RECYCLE']}
+    # In-memory SQLite runs on a single static connection: nothing to size.
+    if not (url.startswith("sqlite") and url.rstrip("/").split("/")[-1] in ("sqlite:", ":memory:")):
+        options.update(pool_size=app.config['DB_POOL_SIZE'],
+                       max_overflow=app.config['DB_MAX_OVERFLOW'],
+                       pool_timeout=app.config['DB_POOL_TIMEOUT'])
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+if app.config['DATABASE_REPLICA_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {
+        "replica": dict(engine_options(app.config['DATABASE_REPLICA_URL']), url=app.config['DATABASE_REPLICA_URL']),
+    }
+
+# List endpoint pagination / streaming
+app.config['DEFAULT_PAGE_SIZE'] = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+app.config['STREAM_BATCH_SIZE'] = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+
+# Bulk imports: rows per INSERT batch / transaction, per-row errors reported,
+# and the error count at which a streamed import stops reading (0: never)
+app.config['BULK_BATCH_SIZE'] = int(os.environ.get('BULK_BATCH_SIZE', 5000))
+app.config['BULK_MAX_ERRORS'] = int(os.environ.get('BULK_MAX_ERRORS', 1000))
+app.config['BULK_ABORT_AFTER_ERRORS'] = int(os.environ.get('BULK_ABORT_AFTER_ERRORS', 10000))
+
+# Chat history: page size, and the recent-message ring buffer kept per room
+# (CHAT_BUFFER_SIZE messages for up to CHAT_BUFFER_ROOMS rooms; 0 disables it)
+app.config['CHAT_PAGE_SIZE'] = int(os.environ.get('CHAT_PAGE_SIZE', 50))
+app.config['CHAT_BUFFER_SIZE'] = int(os.environ.get('CHAT_BUFFER_SIZE', 200))
+app.config['CHAT_BUFFER_ROOMS'] = int(os.environ.get('CHAT_BUFFER_ROOMS', 1000))
+
+# Chat room membership cache: rooms kept (LRU) and seconds before a room's
+# member set is reloaded, which bounds staleness across worker processes
+app.config['CHAT_MEMBERSHIP_ROOMS'] = int(os.environ.get('CHAT_MEMBERSHIP_ROOMS', 10000))
+app.config['CHAT_MEMBERSHIP_TTL'] = float(os.environ.get('CHAT_MEMBERSHIP_TTL', 60))
+
+# Chat group commit: emit messages immediately and persist them from a
+# background flusher in batches of CHAT_FLUSH_BATCH or every
+# CHAT_FLUSH_INTERVAL seconds. Senders wait up to CHAT_QUEUE_TIMEOUT seconds
+# when CHAT_QUEUE_MAX messages are already waiting. Every process writing
+# chat messages must run in the same mode.
+app.config['CHAT_GROUP_COMMIT'] = os.environ.get('CHAT_GROUP_COMMIT', '').lower() in ('1', 'true', 'yes')
+app.config['CHAT_FLUSH_BATCH'] = int(os.environ.get('CHAT_FLUSH_BATCH', 500))
+app.config['CHAT_FLUSH_INTERVAL'] = float(os.environ.get('CHAT_FLUSH_INTERVAL', 0.05))
+app.config['CHAT_QUEUE_MAX'] = int(os.environ.get('CHAT_QUEUE_MAX', 10000))
+app.config['CHAT_QUEUE_TIMEOUT'] = float(os.environ.get('CHAT_QUEUE_TIMEOUT', 5))
+app.config['CHAT_ID_BLOCK'] = int(os.environ.get('CHAT_ID_BLOCK', 1000))
+
+# Longest shift accepted, in hours; also bounds the index range scanned when
+# looking for shifts that overlap a new one
+app.config['SHIFT_MAX_HOURS'] = float(os.environ.get('SHIFT_MAX_HOURS', 24))
+
+# Background exports: EXPORT_WORKERS threads per process run queued jobs
+# (0 leaves them to `flask --app app export-worker`) and write files to
+# EXPORT_DIR, which must be shared by every process serving downloads.
+# Finished files are deleted after EXPORT_TTL_HOURS; running jobs without a
+# progress update for EXPORT_STALE_SECONDS are marked failed.
+app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR', os.path.join(app.instance_path, 'exports'))
+app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', 2))
+app.config['EXPORT_POLL_INTERVAL'] = float(os.environ.get('EXPORT_POLL_INTERVAL', 5))
+app.config['EXPORT_TTL_HOURS'] = float(os.environ.get('EXPORT_TTL_HOURS', 24))
+app.config['EXPORT_STALE_SECONDS'] = float(os.environ.get('EXPORT_STALE_SECONDS', 600))
+app.config['EXPORT_MAX_DAYS'] = int(os.environ.get('EXPORT_MAX_DAYS', 366))
+
+# Search results per page unless ?limit= asks for more (up to MAX_PAGE_SIZE)
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+
+# Socket.IO message queue shared by all worker processes, e.g. redis://host:6379/0
+# (amqp://, kafka:// and zmq+tcp:// work too). local:// is an in-process stand-in
+# for tests. Empty runs a single, self-contained process.
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+app.config['SOCKETIO_CHANNEL'] = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+
+# Response cache for read-mostly resources: entries kept and the largest body
+# cached, in bytes (RESPONSE_CACHE_ENTRIES=0 keeps only ETag/304 handling)
+app.config['RESPONSE_CACHE_ENTRIES'] = int(os.environ.get('RESPONSE_CACHE_ENTRIES', 256))
+app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 1024 * 1024))
+
+# Response compression: JSON/NDJSON/CSV bodies of at least COMPRESS_MIN_SIZE
+# bytes (and all streamed lists) are sent gzip or brotli encoded when the
+# client accepts it. COMPRESS_MIN_SIZE=0 disables compression.
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+app.config['BROTLI_QUALITY'] = int(os.environ.get('BROTLI_QUALITY', 4))
+
+# Dashboard counters: seconds a cached summary may be served (0 disables the
+# cache). DASHBOARD_CACHE_URL=redis://... shares the counters between workers.
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('DASHBOARD_CACHE_TTL', 30))
+app.config['DASHBOARD_CACHE_URL'] = os.environ.get('DASHBOARD_CACHE_URL', '')
+# Counter changes committed within DASHBOARD_PUSH_INTERVAL seconds are sent to
+# the Socket.IO "dashboard" room as one event (0 disables the push).
+app.config['DASHBOARD_PUSH_INTERVAL'] = float(os.environ.get('DASHBOARD_PUSH_INTERVAL', 1))
+
+# Audit trail: committed admin writes are queued (at most AUDIT_QUEUE_MAX
+# entries; beyond that entries are dropped and logged) and written to
+# activity_log in batches by a background flusher. Entries older than
+# AUDIT_RETENTION_DAYS are pruned every AUDIT_PRUNE_INTERVAL seconds
+# (AUDIT_RETENTION_DAYS=0 keeps everything).
+app.config['AUDIT_LOG'] = os.environ.get('AUDIT_LOG', '1').lower() in ('1', 'true', 'yes')
+app.config['AUDIT_FLUSH_BATCH'] = int(os.environ.get('AUDIT_FLUSH_BATCH', 500))
+app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+app.config['AUDIT_QUEUE_MAX'] = int(os.environ.get('AUDIT_QUEUE_MAX', 10000))
+app.config['AUDIT_RETENTION_DAYS'] = int(os.environ.get('AUDIT_RETENTION_DAYS', 365))
+app.config['AUDIT_PRUNE_INTERVAL'] = float(os.environ.get('AUDIT_PRUNE_INTERVAL', 3600))
+
+# Instrumentation: responses carry a Server-Timing header and /admin/metrics
+# serves per-route latency histograms. With QUERY_DETECTOR on, requests and
+# Socket.IO events that run one statement NPLUS1_THRESHOLD or more times, run
+# a statement slower than SLOW_QUERY_MS or take longer than SLOW_REQUEST_MS
+# are logged.
+app.config['QUERY_DETECTOR'] = os.environ.get('QUERY_DETECTOR', '').lower() in ('1', 'true', 'yes')
+app.config['NPLUS1_THRESHOLD'] = int(os.environ.get('NPLUS1_THRESHOLD', 10))
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+
+class RoutingSession(FlaskSession):
+    # Sends reads to the replica while session.info["use_replica"] is set;
+    # flushes (writes) always go to the primary.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get("use_replica") and not self._flushing:
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+
+@app.before_request
+def route_reads_to_replica():
+    if app.config['DATABASE_REPLICA_URL']:
+        db.session.info["use_replica"] = (request.method in ("GET", "HEAD")
+                                          and request.path.startswith("/admin/"))
+
+####################################################
+# SOCKET.IO MESSAGE QUEUE
+####################################################
+def sync_chat_history(event, data):
+    # With a queue, every worker sees every new_message (its own included), so
+    # this is where the per-process recent-message buffers are fed.
+    if event == 'new_message' and recent_messages is not None:
+        if isinstance(data, dict) and 'room_id' in data:
+            recent_messages.append(data['room_id'], data)
+
+class ChatHistorySyncMixin:
+    def _handle_emit(self, message):
+        sync_chat_history(message.get('event'), message.get('data'))
+        super()._handle_emit(message)
+
+class LocalQueueManager(socketio_lib.BaseManager):
+    # In-process stand-in for Redis/AMQP used by tests: an emit on any manager
+    # is delivered by every manager on the same channel, as if each were a
+    # separate worker on a shared queue. Payloads are pickled as on the wire
+    # and delivery is synchronous so tests stay deterministic.
+    _channels = {}
+    _channels_lock = threading.Lock()
+
+    def __init__(self, url='local://', channel='socketio', write_only=False):
+        super().__init__()
+        self.channel = channel
+        with self._channels_lock:
+            self._channels.setdefault(channel, []).append(self)
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None,
+             callback=None, **kwargs):
+        message = pickle.dumps(data)
+        # All "workers" here share one process, hence one history buffer.
+        sync_chat_history(event, pickle.loads(message))
+        for manager in list(self._channels.get(self.channel, [])):
+            if manager.server is not None:
+                super(LocalQueueManager, manager).emit(
+                    event, pickle.loads(message), namespace=namespace or '/', room=room,
+                    skip_sid=skip_sid, callback=callback if manager is self else None)
+
+def make_client_manager(url, channel, write_only=False):
+    if not url:
+        return None
+    if url.startswith('local://'):
+        return LocalQueueManager(url, channel=channel, write_only=write_only)
+    if url.startswith(('redis://', 'rediss://')):
+        base = socketio_lib.RedisManager
+    elif url.startswith('kafka://'):
+        base = socketio_lib.KafkaManager
+    elif url.startswith('zmq'):
+        base = socketio_lib.ZmqManager
+    else:
+        base = socketio_lib.KombuManager
+    manager_class = type('Chat' + base.__name__, (ChatHistorySyncMixin, base), {})
+    return manager_class(url, channel=channel, write_only=write_only)
+
+client_manager = make_client_manager(app.config['SOCKETIO_MESSAGE_QUEUE'], app.config['SOCKETIO_CHANNEL'])
+if client_manager is not None:
+    socketio = SocketIO(app, cors_allowed_origins="*", client_manager=client_manager)
+else:
+    socketio = SocketIO(app, cors_allowed_origins="*")
 
 ####################################################
 # MODELS
@@ -34,7 +277,7 @@ class Employee(db.Model):
     first_name = db.Column(db.String(50), nullable=False)
     last_name  = db.Column(db.String(50), nullable=False)
     department = db.Column(db.String(100))
-    is_active  = db.Column(db.Boolean, default=True)
+    is_active  = db.Column(db.Boolean, default=True, index=True)
     two_factor_enabled = db.Column(db.Boolean, default=False)
     role = db.Column(db.String(50), default='Employee')
 
@@ -43,26 +286,32 @@ class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(500), default='')
-    due_date = db.Column(db.String(50), default='')   # e.g., "dd-mm-yyyy"
+    due_date = db.Column(db.Date, nullable=True, index=True)
     priority = db.Column(db.String(20), default='Medium')
-    status = db.Column(db.String(50), default='Open')
+    status = db.Column(db.String(50), default='Open', index=True)
     assigned_to = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
 
 class Shift(db.Model):
     __tablename__ = 'shifts'
+    __table_args__ = (
+        db.Index('ix_shifts_employee_id_start_time', 'employee_id', 'start_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
-    start_time = db.Column(db.String(50), nullable=False)
-    end_time = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(20), default='Active')
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='Active', index=True)
 
 class TimeOffRequest(db.Model):
     __tablename__ = 'timeoff_requests'
+    __table_args__ = (
+        db.Index('ix_timeoff_requests_employee_id_start_date', 'employee_id', 'start_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
-    start_date = db.Column(db.String(50), nullable=False)
-    end_date = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(20), default='Pending')
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), default='Pending', index=True)
 
 class Performance(db.Model):
     __tablename__ = 'performance'
@@ -75,22 +324,40 @@ class ActivityLog(db.Model):
     __tablename__ = 'activity_log'
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(255), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Event(db.Model):
     __tablename__ = 'events'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
-    date = db.Column(db.String(50), nullable=False)  # "dd-mm-yyyy"
-    time = db.Column(db.String(50), nullable=False)  # "hh:mm AM/PM"
+    date = db.Column(db.Date, nullable=False, index=True)
+    time = db.Column(db.Time, nullable=False)
     duration = db.Column(db.String(50), default='30 minutes')
     description = db.Column(db.String(500), default='')
-    participants = db.Column(db.String(255), default='')
+    participants = db.Column(db.String(255), default='')  # free-text label; see EventParticipant
     color = db.Column(db.String(20), default='blue')
+    # Repeats every recurrence_interval days/weeks/months until recurrence_until
+    # (inclusive, open-ended when null); occurrences are expanded on read.
+    recurrence = db.Column(db.String(10), nullable=True)  # daily, weekly, monthly
+    recurrence_interval = db.Column(db.Integer, default=1)
+    recurrence_until = db.Column(db.Date, nullable=True)
+
+class EventParticipant(db.Model):
+    __tablename__ = 'event_participants'
+    __table_args__ = (
+        db.Index('ix_event_participants_event_id_employee_id', 'event_id', 'employee_id', unique=True),
+        db.Index('ix_event_participants_employee_id_event_id', 'employee_id', 'event_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
 
 # Leave Management Models
 class EmployeeLeaveBalance(db.Model):
     __tablename__ = 'employee_leave_balance'
+    __table_args__ = (
+        db.Index('ix_employee_leave_balance_employee_id_year', 'employee_id', 'year', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
     year = db.Column(db.Integer, default=datetime.now().year)
@@ -99,80 +366,2720 @@ class EmployeeLeaveBalance(db.Model):
     other_remaining = db.Column(db.Float, default=0.0)
     total_taken = db.Column(db.Float, default=0.0)
 
-class LeaveRequest(db.Model):
-    __tablename__ = 'leave_requests'
-    id = db.Column(db.Integer, primary_key=True)
-    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
-    leave_type = db.Column(db.String(20), default='Annual')
-    start_date = db.Column(db.String(50), nullable=False)    # "YYYY-MM-DD"
-    end_date = db.Column(db.String(50), nullable=False)      # "YYYY-MM-DD"
-    days = db.Column(db.Float, default=1.0)
-    status = db.Column(db.String(20), default='Pending')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+class LeaveRequest(db.Model):
+    __tablename__ = 'leave_requests'
+    __table_args__ = (
+        db.Index('ix_leave_requests_employee_id_start_date', 'employee_id', 'start_date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    leave_type = db.Column(db.String(20), default='Annual')
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    days = db.Column(db.Float, default=1.0)
+    status = db.Column(db.String(20), default='Pending', index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Compliance (Policy) Models
+class PolicyDocument(db.Model):
+    __tablename__ = 'policy_documents'
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.String(500), default='')
+    status = db.Column(db.String(50), default='Active', index=True)
+    doc_url = db.Column(db.String(500), default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class PolicyAcknowledgement(db.Model):
+    __tablename__ = 'policy_acknowledgements'
+    __table_args__ = (
+        db.Index('ix_policy_acknowledgements_user_id_ack_date', 'user_id', 'ack_date'),
+        # Covers the coverage report's anti-join without touching the table
+        db.Index('ix_policy_acknowledgements_policy_id_user_id', 'policy_id', 'user_id', 'ack_status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    policy_id = db.Column(db.Integer, db.ForeignKey('policy_documents.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    ack_status = db.Column(db.String(50), default='Acknowledged')
+    ack_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Time Tracking Models
+class Attendance(db.Model):
+    __tablename__ = 'attendance'
+    __table_args__ = (
+        db.Index('ix_attendance_employee_id_date', 'employee_id', 'date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
+    is_late = db.Column(db.Boolean, default=False)
+    hours_worked = db.Column(db.Float, default=0.0)
+    break_time = db.Column(db.Float, default=0.0)
+    status = db.Column(db.String(20), default='Present')
+
+class Project(db.Model):
+    __tablename__ = 'projects'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    progress = db.Column(db.Integer, default=0)  # 0-100
+
+# Communication Model
+class Communication(db.Model):
+    __tablename__ = 'communications'
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Chat Models
+class ChatRoom(db.Model):
+    __tablename__ = 'chat_rooms'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatRoomMember(db.Model):
+    __tablename__ = 'chat_room_members'
+    __table_args__ = (
+        db.Index('ix_chat_room_members_room_id_user_id', 'room_id', 'user_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('chat_rooms.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+
+class ChatMessage(db.Model):
+    __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_room_id_timestamp', 'room_id', 'timestamp'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('chat_rooms.id'), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    content = db.Column(db.String(1000), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Change counters for read-mostly resources, bumped in the writing transaction
+class ResourceVersion(db.Model):
+    __tablename__ = 'resource_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Block-allocated id sequences for rows whose ids are handed out before insert
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+# Attendance totals per employee and day/week/month, kept in step with attendance
+class AttendanceRollup(db.Model):
+    __tablename__ = 'attendance_rollups'
+    grain = db.Column(db.String(5), primary_key=True)  # day, week, month
+    period_start = db.Column(db.Date, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), primary_key=True)
+    records = db.Column(db.Integer, nullable=False, default=0)
+    hours_worked = db.Column(db.Float, nullable=False, default=0.0)
+    break_time = db.Column(db.Float, nullable=False, default=0.0)
+    late_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Background report exports (see EXPORT JOBS)
+class ExportJob(db.Model):
+    __tablename__ = 'export_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    report = db.Column(db.String(20), nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    # Queued, Running, Completed, Failed, Cancelled, Expired
+    status = db.Column(db.String(20), nullable=False, default='Queued', index=True)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    total_rows = db.Column(db.Integer)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+
+# Full-text index over task, communication, policy and chat text (see SEARCH):
+# an FTS5 virtual table on SQLite, a FULLTEXT-indexed table on MySQL
+class SearchDocument(db.Model):
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.Index('ix_search_documents_title_body', 'title', 'body', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+    # Named rowid so that on SQLite it is the FTS5 rowid
+    doc_id = db.Column('rowid', db.BigInteger, key='doc_id', primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False, default='')
+    body = db.Column(db.Text, nullable=False, default='')
+
+@compiles(CreateTable, "sqlite")
+def _create_sqlite_table(element, compiler, **kw):
+    if element.element.name == SearchDocument.__tablename__:
+        return ("CREATE VIRTUAL TABLE search_documents "
+                "USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')")
+    return compiler.visit_create_table(element, **kw)
+
+####################################################
+# DATE & TIME PARSING
+####################################################
+# Clients send dates both as "YYYY-MM-DD" and "dd-mm-yyyy" and event times as
+# "hh:mm AM/PM"; everything is stored in native DATE/TIME/DATETIME columns.
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%Y")
+TIME_FORMATS = ("%I:%M %p", "%I:%M%p", "%H:%M", "%H:%M:%S")
+
+def parse_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r}")
+
+def parse_time(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, time_of_day):
+        return value
+    value = str(value).strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.upper(), fmt).time()
+        except ValueError:
+            pass
+    try:
+        return time_of_day.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r}")
+
+def parse_datetime(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time_of_day())
+    value = str(value).strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    day, _, clock = value.partition(" ")
+    try:
+        return datetime.combine(parse_date(day), parse_time(clock) or time_of_day())
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid datetime: {value!r}")
+
+def format_time(value):
+    return value.strftime("%I:%M %p") if value is not None else None
+
+####################################################
+# SCHEMA MIGRATIONS
+####################################################
+# Versioned, forward-only migrations for databases created before a model
+# change. A brand-new database is built with db.create_all() and stamped with
+# every version; an existing one has the pending migrations applied in order.
+# Run with:  flask --app app db-upgrade
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+# Migrations spell out the tables and indexes they create as they were when
+# the migration was written, never through the models, so replaying one later
+# gives the schema it gave then. Tables that are only the target of a foreign
+# key are stubbed in frozen_metadata() and never created.
+def frozen_metadata(*referenced):
+    metadata = MetaData()
+    for name in referenced:
+        Table(name, metadata, db.Column("id", db.Integer, primary_key=True))
+    return metadata
+
+def create_index(conn, table_name, name, *columns, unique=False):
+    if any(index["name"] == name for index in inspect(conn).get_indexes(table_name)):
+        return
+    table = Table(table_name, MetaData(), autoload_with=conn)
+    db.Index(name, *[table.c[column] for column in columns], unique=unique).create(conn)
+
+@migration(1, "Indexes on hot filter and sort columns")
+def _m0001_hot_indexes(conn):
+    create_index(conn, "employees", "ix_employees_is_active", "is_active")
+    create_index(conn, "tasks", "ix_tasks_status", "status")
+    create_index(conn, "shifts", "ix_shifts_status", "status")
+    create_index(conn, "timeoff_requests", "ix_timeoff_requests_status", "status")
+    create_index(conn, "attendance", "ix_attendance_date", "date")
+    create_index(conn, "policy_documents", "ix_policy_documents_created_at", "created_at")
+    create_index(conn, "policy_acknowledgements", "ix_policy_acknowledgements_user_id_ack_date",
+                 "user_id", "ack_date")
+    create_index(conn, "communications", "ix_communications_created_at", "created_at")
+    create_index(conn, "chat_messages", "ix_chat_messages_room_id_timestamp", "room_id", "timestamp")
+
+@migration(2, "Native DATE/TIME/DATETIME columns for string dates")
+def _m0002_native_dates(conn):
+    metadata = frozen_metadata("employees")
+    attendance = Table(
+        "attendance", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("employee_id", db.Integer, db.ForeignKey("employees.id"), nullable=False),
+        db.Column("date", db.Date, nullable=False, index=True),
+        db.Column("is_late", db.Boolean),
+        db.Column("hours_worked", db.Float),
+        db.Column("break_time", db.Float),
+        db.Column("status", db.String(20)),
+    )
+    tasks = Table(
+        "tasks", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("title", db.String(100), nullable=False),
+        db.Column("description", db.String(500)),
+        db.Column("due_date", db.Date, index=True),
+        db.Column("priority", db.String(20)),
+        db.Column("status", db.String(50), index=True),
+        db.Column("assigned_to", db.Integer, db.ForeignKey("employees.id")),
+    )
+    shifts = Table(
+        "shifts", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("employee_id", db.Integer, db.ForeignKey("employees.id"), nullable=False),
+        db.Column("start_time", db.DateTime, nullable=False, index=True),
+        db.Column("end_time", db.DateTime, nullable=False),
+        db.Column("status", db.String(20), index=True),
+    )
+    timeoff_requests = Table(
+        "timeoff_requests", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("employee_id", db.Integer, db.ForeignKey("employees.id"), nullable=False),
+        db.Column("start_date", db.Date, nullable=False),
+        db.Column("end_date", db.Date, nullable=False),
+        db.Column("status", db.String(20), index=True),
+    )
+    leave_requests = Table(
+        "leave_requests", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("employee_id", db.Integer, db.ForeignKey("employees.id"), nullable=False),
+        db.Column("leave_type", db.String(20)),
+        db.Column("start_date", db.Date, nullable=False),
+        db.Column("end_date", db.Date, nullable=False),
+        db.Column("days", db.Float),
+        db.Column("status", db.String(20)),
+        db.Column("created_at", db.DateTime),
+    )
+    events = Table(
+        "events", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("title", db.String(100), nullable=False),
+        db.Column("date", db.Date, nullable=False, index=True),
+        db.Column("time", db.Time, nullable=False),
+        db.Column("duration", db.String(50)),
+        db.Column("description", db.String(500)),
+        db.Column("participants", db.String(255)),
+        db.Column("color", db.String(20)),
+    )
+    rebuild_table(conn, attendance, {"date": parse_date})
+    rebuild_table(conn, tasks, {"due_date": parse_date})
+    rebuild_table(conn, shifts, {"start_time": parse_datetime, "end_time": parse_datetime})
+    rebuild_table(conn, timeoff_requests, {"start_date": parse_date, "end_date": parse_date})
+    rebuild_table(conn, leave_requests, {"start_date": parse_date, "end_date": parse_date})
+    rebuild_table(conn, events, {"date": parse_date, "time": parse_time})
+
+def rebuild_table(conn, table, converters, batch_size=5000):
+    # Give the listed columns their type in `table`, converting every stored value.
+    if conn.dialect.name == "sqlite":
+        copy_sqlite_table(conn, table, converters, batch_size)
+    else:
+        convert_columns(conn, table, converters, batch_size)
+
+def convert_values(table, row, converters):
+    values = {}
+    for name, convert in converters.items():
+        try:
+            values[name] = convert(row[name])
+        except ValueError as exc:
+            raise ValueError(f"{table.name} id={row['id']}: {exc}")
+        if values[name] is None and not table.c[name].nullable:
+            raise ValueError(f"{table.name} id={row['id']}: {name} is empty")
+    return values
+
+def copy_sqlite_table(conn, table, converters, batch_size):
+    # SQLite cannot ALTER a column type: copy the rows into a new table, drop
+    # the old one and rename the copy into place. The original is never
+    # renamed, so foreign keys that other tables declare on it stay valid.
+    old = Table(table.name, MetaData(), autoload_with=conn)
+    for index in list(old.indexes):
+        index.drop(conn)
+    new_name = table.name + "_new"
+    metadata = MetaData()
+    for fk in table.foreign_keys:
+        fk.column.table.to_metadata(metadata)
+    new = table.to_metadata(metadata, name=new_name)
+    new.indexes.clear()
+    new.create(conn)
+    columns = [c.name for c in table.columns if c.name in old.c]
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(*[old.c[name] for name in columns])
+            .where(old.c.id > last_id).order_by(old.c.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+        conn.execute(new.insert(), [dict(row, **convert_values(table, row, converters)) for row in rows])
+        last_id = rows[-1]["id"]
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {new_name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(conn)
+
+def convert_columns(conn, table, converters, batch_size):
+    # In place: add a column of the new type next to each converted one,
+    # backfill it, then swap the two in a single ALTER that also rebuilds the
+    # indexes on the old column. Other indexes and foreign keys are untouched.
+    preparer = conn.dialect.identifier_preparer
+    quote = preparer.quote
+    new_names = {name: name + "_new" for name in converters}
+    for name, new_name in new_names.items():
+        conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(new_name)} "
+                          f"{table.c[name].type.compile(conn.dialect)} NULL"))
+    old = Table(table.name, MetaData(), autoload_with=conn)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(old.c.id, *[old.c[name] for name in converters])
+            .where(old.c.id > last_id).order_by(old.c.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+        conn.execute(
+            update(old).where(old.c.id == bindparam("_id"))
+            .values({new_names[name]: bindparam("_" + name) for name in converters}),
+            [dict({"_" + name: value for name, value in convert_values(table, row, converters).items()},
+                  _id=row["id"]) for row in rows],
+        )
+        last_id = rows[-1]["id"]
+    indexes = [index for index in inspect(conn).get_indexes(table.name)
+               if set(index["column_names"]) & set(converters)]
+    clauses = [f"DROP INDEX {quote(index['name'])}" for index in indexes]
+    for name, new_name in new_names.items():
+        column = table.c[name]
+        clauses.append(f"DROP COLUMN {quote(name)}")
+        clauses.append(f"CHANGE COLUMN {quote(new_name)} {quote(name)} "
+                       f"{column.type.compile(conn.dialect)} {'NULL' if column.nullable else 'NOT NULL'}")
+    for index in indexes:
+        columns = ", ".join(quote(c) for c in index["column_names"])
+        unique = "UNIQUE " if index["unique"] else ""
+        clauses.append(f"ADD {unique}INDEX {quote(index['name'])} ({columns})")
+    conn.execute(text(f"ALTER TABLE {quote(table.name)} " + ", ".join(clauses)))
+
+@migration(3, "id_sequences table for block id allocation")
+def _m0003_id_sequences(conn):
+    Table(
+        "id_sequences", frozen_metadata(),
+        db.Column("name", db.String(50), primary_key=True),
+        db.Column("next_value", db.BigInteger, nullable=False),
+    ).create(conn, checkfirst=True)
+
+@migration(4, "Index chat room members by room")
+def _m0004_chat_member_index(conn):
+    create_index(conn, "chat_room_members", "ix_chat_room_members_room_id_user_id", "room_id", "user_id")
+
+@migration(5, "resource_versions table for ETags")
+def _m0005_resource_versions(conn):
+    Table(
+        "resource_versions", frozen_metadata(),
+        db.Column("name", db.String(50), primary_key=True),
+        db.Column("version", db.BigInteger, nullable=False),
+    ).create(conn, checkfirst=True)
+
+@migration(6, "attendance_rollups table, backfilled from attendance")
+def _m0006_attendance_rollups(conn):
+    Table(
+        "attendance_rollups", frozen_metadata("employees"),
+        db.Column("grain", db.String(5), primary_key=True),
+        db.Column("period_start", db.Date, primary_key=True),
+        db.Column("employee_id", db.Integer, db.ForeignKey("employees.id"), primary_key=True),
+        db.Column("records", db.Integer, nullable=False),
+        db.Column("hours_worked", db.Float, nullable=False),
+        db.Column("break_time", db.Float, nullable=False),
+        db.Column("late_count", db.Integer, nullable=False),
+    ).create(conn, checkfirst=True)
+    rebuild_attendance_rollups(conn)
+
+@migration(7, "Indexes for leave overlap checks and balance lookups")
+def _m0007_leave_indexes(conn):
+    create_index(conn, "leave_requests", "ix_leave_requests_status", "status")
+    create_index(conn, "leave_requests", "ix_leave_requests_employee_id_start_date", "employee_id", "start_date")
+    create_index(conn, "employee_leave_balance", "ix_employee_leave_balance_employee_id_year",
+                 "employee_id", "year", unique=True)
+
+@migration(8, "Per-employee indexes for shift conflict checks")
+def _m0008_shift_conflict_indexes(conn):
+    create_index(conn, "shifts", "ix_shifts_employee_id_start_time", "employee_id", "start_time")
+    create_index(conn, "timeoff_requests", "ix_timeoff_requests_employee_id_start_date",
+                 "employee_id", "start_date")
+
+def add_columns(conn, table_name, *columns):
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    for column in columns:
+        if column.name not in existing:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column.name} "
+                              f"{column.type.compile(conn.dialect)}"))
+
+@migration(9, "event_participants from the participants strings; event recurrence")
+def _m0009_event_participants(conn):
+    add_columns(conn, "events", db.Column("recurrence", db.String(10)),
+                db.Column("recurrence_interval", db.Integer), db.Column("recurrence_until", db.Date))
+    metadata = frozen_metadata("events", "employees")
+    participants = Table(
+        "event_participants", metadata,
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("event_id", db.Integer, db.ForeignKey("events.id"), nullable=False),
+        db.Column("employee_id", db.Integer, db.ForeignKey("employees.id"), nullable=False),
+        db.Index("ix_event_participants_event_id_employee_id", "event_id", "employee_id", unique=True),
+        db.Index("ix_event_participants_employee_id_event_id", "employee_id", "event_id"),
+    )
+    participants.create(conn, checkfirst=True)
+    events = Table("events", MetaData(), autoload_with=conn)
+    resolve = participant_resolver(conn)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(events.c.id, events.c.participants)
+            .where(events.c.id > last_id).order_by(events.c.id).limit(5000)
+        ).all()
+        if not rows:
+            break
+        links = [{"event_id": event_id, "employee_id": employee_id}
+                 for event_id, participants_value in rows
+                 for employee_id in resolve(participants_value)]
+        if links:
+            conn.execute(participants.insert(), links)
+        last_id = rows[-1][0]
+
+@migration(10, "Indexes for the policy acknowledgement coverage report")
+def _m0010_policy_coverage_indexes(conn):
+    create_index(conn, "policy_documents", "ix_policy_documents_status", "status")
+    create_index(conn, "policy_acknowledgements", "ix_policy_acknowledgements_policy_id_user_id",
+                 "policy_id", "user_id", "ack_status")
+
+@migration(11, "Index activity_log by timestamp")
+def _m0011_activity_log_index(conn):
+    create_index(conn, "activity_log", "ix_activity_log_timestamp", "timestamp")
+
+@migration(12, "Full-text search index over tasks, communications, policies and chat")
+def _m0012_search_index(conn):
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS search_documents "
+                          "USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')"))
+    else:
+        Table(
+            "search_documents", frozen_metadata(),
+            db.Column("rowid", db.BigInteger, primary_key=True, autoincrement=False),
+            db.Column("title", db.String(200), nullable=False),
+            db.Column("body", db.Text, nullable=False),
+            db.Index("ix_search_documents_title_body", "title", "body", mysql_prefix="FULLTEXT"),
+        ).create(conn, checkfirst=True)
+    for model in SEARCHABLE:
+        index_search(conn, model)
+
+@migration(13, "Export jobs; per-employee attendance index")
+def _m0013_export_jobs(conn):
+    Table(
+        "export_jobs", frozen_metadata(),
+        db.Column("id", db.Integer, primary_key=True),
+        db.Column("report", db.String(20), nullable=False),
+        db.Column("format", db.String(10), nullable=False),
+        db.Column("params", db.Text, nullable=False),
+        db.Column("status", db.String(20), nullable=False, index=True),
+        db.Column("rows_written", db.Integer, nullable=False),
+        db.Column("total_rows", db.Integer),
+        db.Column("error", db.String(500)),
+        db.Column("created_at", db.DateTime),
+        db.Column("started_at", db.DateTime),
+        db.Column("heartbeat_at", db.DateTime),
+        db.Column("finished_at", db.DateTime),
+        db.Column("expires_at", db.DateTime),
+    ).create(conn, checkfirst=True)
+    create_index(conn, "attendance", "ix_attendance_employee_id_date", "employee_id", "date")
+
+def applied_versions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {v for (v,) in db.session.query(SchemaMigration.version)}
+
+def upgrade_db():
+    fresh = not inspect(db.engine).has_table(Employee.__tablename__)
+    applied = applied_versions()
+    ran = []
+    for version, description, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        if not fresh:
+            with db.engine.begin() as conn:
+                fn(conn)
+        db.session.add(SchemaMigration(version=version, description=description))
+        db.session.commit()
+        ran.append(version)
+    # After the migrations, so no new table references one they rebuild.
+    # Brand-new tables are created with their indexes already in place.
+    db.create_all()
+    return ran
+
+@app.cli.command("db-upgrade")
+def db_upgrade_command():
+    ran = upgrade_db()
+    print(f"Applied migrations: {ran}" if ran else "Database is up to date.")
+
+####################################################
+# SERIALIZATION SCHEMAS
+####################################################
+# Each schema declares the JSON fields of a model and the column each comes
+# from. Endpoints select exactly those columns as plain tuples (no ORM
+# instances, no identity map) and encode them with orjson when available.
+def dumps(obj):
+    started = time.perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    else:
+        body = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+    record_serialization(time.perf_counter() - started)
+    return body
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status=status, mimetype="application/json")
+
+class Field:
+    def __init__(self, column, encode=None):
+        self.column = column
+        self.encode = encode
+
+class Schema:
+    def __init__(self, model, **fields):
+        self.model = model
+        self.fields = {}
+        self.names = list(fields)
+        self.columns = []
+        self.keys = []
+        self.encoders = []
+        for name, spec in fields.items():
+            if not isinstance(spec, Field):
+                spec = Field(spec)
+            self.fields[name] = spec
+            self.columns.append(spec.column.label(name))
+            self.keys.append(spec.column.key)
+            if spec.encode is not None:
+                self.encoders.append((name, spec.encode))
+        self._subsets = {}
+
+    def only(self, names):
+        # A narrowed schema selecting just these columns; id is always kept
+        # because it is the keyset cursor.
+        names = tuple(name for name in self.names if name == "id" or name in names)
+        subset = self._subsets.get(names)
+        if subset is None:
+            subset = Schema(self.model, **{name: self.fields[name] for name in names})
+            self._subsets[names] = subset
+        return subset
+
+    def query(self):
+        return db.session.query(*self.columns)
+
+    def dump_row(self, row):
+        data = dict(zip(self.names, row))
+        for name, encode in self.encoders:
+            if data[name] is not None:
+                data[name] = encode(data[name])
+        return data
+
+    def dump_rows(self, rows):
+        return [self.dump_row(row) for row in rows]
+
+    def dump(self, obj):
+        # For an instance already in hand, e.g. right after an insert.
+        return self.dump_row([getattr(obj, key) for key in self.keys])
+
+    def all(self, query=None):
+        query = self.query() if query is None else query
+        return self.dump_rows(query.order_by(self.model.id))
+
+    def get_or_404(self, id):
+        row = self.query().filter(self.model.id == id).first()
+        if row is None:
+            abort(404)
+        return self.dump_row(row)
+
+def fieldset(schema):
+    # ?fields=id,title,status narrows the SELECT as well as the output.
+    value = request.args.get("fields")
+    if not value:
+        return schema
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(names - set(schema.names))
+    if unknown:
+        abort(json_response({"message": "Unknown fields: " + ", ".join(unknown)}, 400))
+    return schema.only(names)
+
+def isoformat(value):
+    return value.isoformat()
+
+employee_schema = Schema(
+    Employee,
+    id=Employee.id,
+    first_name=Employee.first_name,
+    last_name=Employee.last_name,
+    department=Employee.department,
+    is_active=Employee.is_active,
+    twoFactor=Employee.two_factor_enabled,
+    role=Employee.role,
+)
+
+task_schema = Schema(
+    Task,
+    id=Task.id,
+    title=Task.title,
+    description=Task.description,
+    due_date=Field(Task.due_date, isoformat),
+    priority=Task.priority,
+    status=Task.status,
+    assigned_to=Task.assigned_to,
+)
+
+attendance_schema = Schema(
+    Attendance,
+    id=Attendance.id,
+    employee_id=Attendance.employee_id,
+    date=Field(Attendance.date, isoformat),
+    is_late=Attendance.is_late,
+    hours_worked=Attendance.hours_worked,
+    break_time=Attendance.break_time,
+    status=Attendance.status,
+)
+
+event_schema = Schema(
+    Event,
+    id=Event.id,
+    title=Event.title,
+    date=Field(Event.date, isoformat),
+    time=Field(Event.time, format_time),
+    duration=Event.duration,
+    description=Event.description,
+    participants=Event.participants,
+    color=Event.color,
+    recurrence=Event.recurrence,
+    recurrence_interval=Event.recurrence_interval,
+    recurrence_until=Field(Event.recurrence_until, isoformat),
+)
+
+event_participant_schema = Schema(
+    EventParticipant,
+    id=EventParticipant.id,
+    employee_id=EventParticipant.employee_id,
+    first_name=Employee.first_name,
+    last_name=Employee.last_name,
+    department=Employee.department,
+)
+
+shift_schema = Schema(
+    Shift,
+    id=Shift.id,
+    employee_id=Shift.employee_id,
+    start_time=Field(Shift.start_time, isoformat),
+    end_time=Field(Shift.end_time, isoformat),
+    status=Shift.status,
+)
+
+project_schema = Schema(
+    Project,
+    id=Project.id,
+    name=Project.name,
+    progress=Project.progress,
+)
+
+communication_schema = Schema(
+    Communication,
+    id=Communication.id,
+    title=Communication.title,
+    message=Communication.message,
+    created_at=Field(Communication.created_at, isoformat),
+)
+
+policy_document_schema = Schema(
+    PolicyDocument,
+    id=PolicyDocument.id,
+    title=PolicyDocument.title,
+    description=PolicyDocument.description,
+    status=PolicyDocument.status,
+    doc_url=PolicyDocument.doc_url,
+    created_at=Field(PolicyDocument.created_at, isoformat),
+)
+
+outstanding_ack_schema = Schema(
+    PolicyDocument,
+    policy_id=PolicyDocument.id,
+    title=PolicyDocument.title,
+    employee_id=Employee.id,
+    first_name=Employee.first_name,
+    last_name=Employee.last_name,
+    department=Employee.department,
+)
+
+activity_log_schema = Schema(
+    ActivityLog,
+    id=ActivityLog.id,
+    description=ActivityLog.description,
+    timestamp=Field(ActivityLog.timestamp, isoformat),
+)
+
+export_job_schema = Schema(
+    ExportJob,
+    id=ExportJob.id,
+    report=ExportJob.report,
+    format=ExportJob.format,
+    params=Field(ExportJob.params, json.loads),
+    status=ExportJob.status,
+    rows_written=ExportJob.rows_written,
+    total_rows=ExportJob.total_rows,
+    error=ExportJob.error,
+    created_at=Field(ExportJob.created_at, isoformat),
+    started_at=Field(ExportJob.started_at, isoformat),
+    finished_at=Field(ExportJob.finished_at, isoformat),
+    expires_at=Field(ExportJob.expires_at, isoformat),
+)
+
+ack_history_schema = Schema(
+    PolicyAcknowledgement,
+    policy_id=PolicyDocument.id,
+    title=PolicyDocument.title,
+    ack_status=PolicyAcknowledgement.ack_status,
+    ack_date=Field(PolicyAcknowledgement.ack_date, isoformat),
+)
+
+chat_room_schema = Schema(
+    ChatRoom,
+    id=ChatRoom.id,
+    name=ChatRoom.name,
+    created_at=Field(ChatRoom.created_at, isoformat),
+)
+
+chat_message_schema = Schema(
+    ChatMessage,
+    id=ChatMessage.id,
+    room_id=ChatMessage.room_id,
+    sender_id=ChatMessage.sender_id,
+    content=ChatMessage.content,
+    timestamp=Field(ChatMessage.timestamp, isoformat),
+)
+
+leave_request_schema = Schema(
+    LeaveRequest,
+    id=LeaveRequest.id,
+    employee_id=LeaveRequest.employee_id,
+    leave_type=LeaveRequest.leave_type,
+    start_date=Field(LeaveRequest.start_date, isoformat),
+    end_date=Field(LeaveRequest.end_date, isoformat),
+    days=LeaveRequest.days,
+    status=LeaveRequest.status,
+    created_at=Field(LeaveRequest.created_at, isoformat),
+)
+
+leave_balance_schema = Schema(
+    EmployeeLeaveBalance,
+    id=EmployeeLeaveBalance.id,
+    employee_id=EmployeeLeaveBalance.employee_id,
+    year=EmployeeLeaveBalance.year,
+    annual_remaining=EmployeeLeaveBalance.annual_remaining,
+    sick_remaining=EmployeeLeaveBalance.sick_remaining,
+    other_remaining=EmployeeLeaveBalance.other_remaining,
+    total_taken=EmployeeLeaveBalance.total_taken,
+)
+
+attendance_rollup_schema = Schema(
+    AttendanceRollup,
+    period=Field(AttendanceRollup.period_start, isoformat),
+    employee_id=AttendanceRollup.employee_id,
+    records=AttendanceRollup.records,
+    hours_worked=AttendanceRollup.hours_worked,
+    break_time=AttendanceRollup.break_time,
+    late_count=AttendanceRollup.late_count,
+)
+
+department_rollup_schema = Schema(
+    AttendanceRollup,
+    period=Field(AttendanceRollup.period_start, isoformat),
+    department=Employee.department,
+    records=func.sum(AttendanceRollup.records),
+    hours_worked=func.sum(AttendanceRollup.hours_worked),
+    break_time=func.sum(AttendanceRollup.break_time),
+    late_count=func.sum(AttendanceRollup.late_count),
+)
+
+####################################################
+# PAGINATION & STREAMING
+####################################################
+# List endpoints accept:
+#   ?after=<id>     keyset cursor: return rows that sort after this id
+#   ?limit=<n>      page size (capped at MAX_PAGE_SIZE)
+#   ?stream=ndjson  stream one JSON object per line from a server-side cursor
+#   ?fields=a,b     select only these fields (id is always included)
+# A request without after/limit gets the whole list as before, but written out
+# as a chunked JSON array so the worker never holds the full result in memory.
+class InvalidCursor(Exception):
+    pass
+
+def keyset_pivot(model, sort_col, after):
+    row = db.session.query(sort_col).filter(model.id == after).first()
+    if row is None:
+        raise InvalidCursor(after)
+    return row[0]
+
+def keyset_filter(query, model, after, sort_col=None, descending=False, pivot=None):
+    # Rows are ordered by (sort_col, id) so ties on sort_col stay stable.
+    id_col = model.id
+    if sort_col is None:
+        order = [id_col.desc() if descending else id_col.asc()]
+    else:
+        order = [sort_col.desc(), id_col.desc()] if descending else [sort_col.asc(), id_col.asc()]
+    if after is not None:
+        if sort_col is None:
+            query = query.filter(id_col < after if descending else id_col > after)
+        else:
+            if pivot is None:
+                pivot = keyset_pivot(model, sort_col, after)
+            # Written as a range on sort_col plus a tie-breaker so both SQLite
+            # and MySQL can seek the sort_col index instead of scanning it.
+            if descending:
+                query = query.filter(sort_col <= pivot, or_(sort_col < pivot, id_col < after))
+            else:
+                query = query.filter(sort_col >= pivot, or_(sort_col > pivot, id_col > after))
+    return query.order_by(*order)
+
+def stream_rows(query, schema, ndjson=False):
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    def batches():
+        # yield_per() turns on stream_results, i.e. a server-side cursor on MySQL
+        batch = []
+        for row in query.yield_per(batch_size):
+            batch.append(schema.dump_row(row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def generate():
+        if ndjson:
+            for batch in batches():
+                yield b"".join(dumps(item) + b"\n" for item in batch)
+            return
+        yield b"["
+        first = True
+        for batch in batches():
+            # Encode the batch as one array and drop its brackets.
+            yield (b"" if first else b",") + dumps(batch)[1:-1]
+            first = False
+        yield b"]\n"
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def stream_csv(query, schema, filename):
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(schema.names)
+        for n, row in enumerate(query.yield_per(batch_size), 1):
+            data = schema.dump_row(row)
+            writer.writerow([data[name] for name in schema.names])
+            if n % batch_size == 0:
+                yield buf.getvalue().encode()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode()
+
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def date_range_filter(query, column):
+    # ?from=&to= are inclusive dates; on a DATETIME column `to` covers the whole day.
+    start = parse_date(request.args.get("from"))
+    end = parse_date(request.args.get("to"))
+    is_datetime = isinstance(column.type, db.DateTime)
+    if start is not None:
+        query = query.filter(column >= (datetime.combine(start, time_of_day()) if is_datetime else start))
+    if end is not None:
+        if is_datetime:
+            query = query.filter(column < datetime.combine(end + timedelta(days=1), time_of_day()))
+        else:
+            query = query.filter(column <= end)
+    return query
+
+def list_response(query, schema, sort_col=None, descending=False):
+    model = schema.model
+    narrowed = fieldset(schema)
+    if narrowed is not schema:
+        query = query.with_entities(*narrowed.columns)
+        schema = narrowed
+    after = request.args.get("after", type=int)
+    limit = request.args.get("limit", type=int)
+    stream = request.args.get("stream", "").lower()
+    if limit is not None and limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+    if stream not in ("", "json", "ndjson"):
+        return jsonify({"message": "stream must be 'json' or 'ndjson'"}), 400
+    try:
+        query = keyset_filter(query, model, after, sort_col, descending)
+    except InvalidCursor:
+        return jsonify({"message": "Unknown cursor"}), 400
+
+    if stream or (after is None and limit is None):
+        if limit is not None:
+            query = query.limit(limit)
+        return stream_rows(query, schema, ndjson=(stream == "ndjson")), 200
+
+    limit = min(limit or app.config['DEFAULT_PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    resp = json_response(schema.dump_rows(rows))
+    if has_more:
+        next_cursor = rows[-1].id
+        args = request.args.to_dict()
+        args.update(after=next_cursor, limit=limit)
+        next_url = request.base_url + "?" + urlencode(args)
+        resp.headers["X-Next-Cursor"] = str(next_cursor)
+        resp.headers["Link"] = f'<{next_url}>; rel="next"'
+    return resp, 200
+
+####################################################
+# RESPONSE COMPRESSION
+####################################################
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/csv"}
+
+def negotiate_encoding():
+    offers = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offers)
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=app.config['BROTLI_QUALITY'])
+    compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+def compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=app.config['BROTLI_QUALITY'])
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    for chunk in chunks:
+        # Flush per batch so streamed rows still reach the client as they are read.
+        yield compress(chunk) + flush()
+    yield finish()
+
+def compress_response(resp):
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    # Files (send_file) go out as stored, with their Content-Length and ranges.
+    if (min_size <= 0 or resp.status_code != 200 or resp.mimetype not in COMPRESSIBLE_TYPES
+            or "Content-Encoding" in resp.headers or resp.direct_passthrough):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return resp
+    if resp.is_streamed:
+        resp.response = compress_stream(resp.response, encoding)
+    else:
+        body = resp.get_data()
+        if len(body) < min_size:
+            return resp
+        resp.set_data(compress_body(body, encoding))
+    resp.headers["Content-Encoding"] = encoding
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+app.after_request(compress_response)
+
+####################################################
+# DASHBOARD COUNTERS
+####################################################
+# name -> (model, attribute, value counted)
+DASHBOARD_COUNTERS = {
+    "activeEmployees": (Employee, "is_active", True),
+    "openTasks": (Task, "status", "Open"),
+    "todaysShifts": (Shift, "status", "Active"),
+    "timeOffRequests": (TimeOffRequest, "status", "Pending"),
+}
+
+class LocalCounterStore:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values = None
+        self._expires_at = 0.0
+
+    def get(self):
+        with self._lock:
+            if self._values is None or time.monotonic() >= self._expires_at:
+                return None
+            return dict(self._values)
+
+    def set(self, values):
+        with self._lock:
+            self._values = dict(values)
+            self._expires_at = time.monotonic() + self.ttl
+
+    def incr(self, deltas):
+        with self._lock:
+            if self._values is None:
+                return
+            for name, delta in deltas.items():
+                self._values[name] += delta
+
+    def clear(self):
+        with self._lock:
+            self._values = None
+
+class RedisCounterStore:
+    key = "dashboard:summary"
+
+    def __init__(self, url, ttl):
+        import redis
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self):
+        raw = self._redis.hgetall(self.key)
+        if len(raw) != len(DASHBOARD_COUNTERS):
+            return None
+        return {k.decode(): int(v) for k, v in raw.items()}
+
+    def set(self, values):
+        pipe = self._redis.pipeline()
+        pipe.hset(self.key, mapping=values)
+        pipe.expire(self.key, max(1, int(self.ttl)))
+        pipe.execute()
+
+    def incr(self, deltas):
+        # Only adjust a hash that is already populated; a missing key means the
+        # next reader recounts anyway.
+        if not self._redis.exists(self.key):
+            return
+        pipe = self._redis.pipeline()
+        for name, delta in deltas.items():
+            pipe.hincrby(self.key, name, delta)
+        pipe.execute()
+
+    def clear(self):
+        self._redis.delete(self.key)
+
+def make_counter_store():
+    ttl = app.config['DASHBOARD_CACHE_TTL']
+    if ttl <= 0:
+        return None
+    if app.config['DASHBOARD_CACHE_URL']:
+        return RedisCounterStore(app.config['DASHBOARD_CACHE_URL'], ttl)
+    return LocalCounterStore(ttl)
+
+dashboard_cache = make_counter_store()
+
+def dashboard_statement():
+    # All four counts as scalar subqueries of a single SELECT: one round trip.
+    return select(*[
+        select(func.count()).select_from(model).where(getattr(model, attr) == value)
+        .scalar_subquery().label(name)
+        for name, (model, attr, value) in DASHBOARD_COUNTERS.items()
+    ])
+
+def count_dashboard():
+    row = db.session.execute(dashboard_statement()).one()
+    return dict(row._mapping)
+
+def dashboard_counts():
+    if dashboard_cache is None:
+        return count_dashboard()
+    values = dashboard_cache.get()
+    if values is None:
+        values = count_dashboard()
+        dashboard_cache.set(values)
+    return values
+
+def invalidate_dashboard():
+    if dashboard_cache is not None:
+        dashboard_cache.clear()
+    if dashboard_publisher is not None:
+        dashboard_publisher.publish({}, recount=True)
+
+class DashboardPublisher:
+    # Deltas committed by any request are merged for `interval` seconds, then
+    # one background thread broadcasts them with the current counts, so open
+    # dashboards cost one event per window instead of a summary query each.
+    name = "dashboard-publisher"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._deltas = {}
+        self._recount = False
+        self._thread = None
+        self._stopping = False
+
+    def publish(self, deltas, recount=False):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._deltas[name] = self._deltas.get(name, 0) + delta
+            self._recount = self._recount or recount
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        with app.app_context():
+            while not self._stopping:
+                self._wake.wait()
+                time.sleep(self.interval)
+                with self._lock:
+                    self._wake.clear()
+                    deltas = {name: delta for name, delta in self._deltas.items() if delta}
+                    recount = self._recount
+                    self._deltas, self._recount = {}, False
+                if not deltas and not recount:
+                    continue
+                try:
+                    self.broadcast(deltas)
+                except Exception:
+                    app.logger.exception("Publishing dashboard counters failed")
+                finally:
+                    db.session.remove()
+
+    def broadcast(self, deltas):
+        socketio.emit("dashboard_update", {"deltas": deltas, "counts": dashboard_counts()}, room="dashboard")
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+
+dashboard_publisher = (
+    DashboardPublisher(app.config['DASHBOARD_PUSH_INTERVAL'])
+    if app.config['DASHBOARD_PUSH_INTERVAL'] > 0 else None
+)
+if dashboard_publisher is not None:
+    atexit.register(dashboard_publisher.stop)
+
+def _counter_deltas(session):
+    # Work out how each flushed insert/update/delete moves the counters. When an
+    # old value can't be recovered from attribute history the cache is dropped.
+    deltas = {}
+    invalidate = False
+    for name, (model, attr, value) in DASHBOARD_COUNTERS.items():
+        delta = 0
+        for obj in session.new:
+            if isinstance(obj, model) and getattr(obj, attr) == value:
+                delta += 1
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                hist = inspect(obj).attrs[attr].history
+                old = hist.deleted[0] if hist.deleted else getattr(obj, attr)
+                if old == value:
+                    delta -= 1
+        for obj in session.dirty:
+            if not isinstance(obj, model) or obj in session.deleted:
+                continue
+            hist = inspect(obj).attrs[attr].history
+            if not hist.added:
+                continue
+            if not hist.deleted:
+                invalidate = True
+                continue
+            delta += (hist.added[0] == value) - (hist.deleted[0] == value)
+        if delta:
+            deltas[name] = delta
+    return deltas, invalidate
+
+@event.listens_for(db.session, "after_flush")
+def _track_dashboard_deltas(session, flush_context):
+    if dashboard_cache is None and dashboard_publisher is None:
+        return
+    deltas, invalidate = _counter_deltas(session)
+    pending = session.info.setdefault("dashboard_deltas", {})
+    for name, delta in deltas.items():
+        pending[name] = pending.get(name, 0) + delta
+    if invalidate:
+        session.info["dashboard_invalidate"] = True
+
+@event.listens_for(db.session, "after_commit")
+def _apply_dashboard_deltas(session):
+    deltas = session.info.pop("dashboard_deltas", None)
+    if session.info.pop("dashboard_invalidate", False):
+        invalidate_dashboard()
+    elif deltas:
+        if dashboard_cache is not None:
+            dashboard_cache.incr(deltas)
+        if dashboard_publisher is not None:
+            dashboard_publisher.publish(deltas)
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_dashboard_deltas(session):
+    session.info.pop("dashboard_deltas", None)
+    session.info.pop("dashboard_invalidate", None)
+
+####################################################
+# RESOURCE VERSIONS & RESPONSE CACHE
+####################################################
+# Every write to one of these models bumps its resource's row in
+# resource_versions inside the same transaction. GETs decorated with
+# @cached_resource read the rows of the resources they show, answer
+# If-None-Match with 304, and otherwise serve the serialized body cached for
+# (URL, versions). Streamed (unpaged) lists are never buffered into the cache.
+VERSIONED_RESOURCES = {
+    PolicyDocument: "policy_documents",
+    Event: "events",
+    Project: "projects",
+    ChatRoom: "chat_rooms",
+    EventParticipant: "events",
+    Employee: "employees",
+}
+
+@event.listens_for(db.session, "after_flush")
+def _bump_resource_versions(session, flush_context):
+    names = {VERSIONED_RESOURCES[type(obj)]
+             for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+             if type(obj) in VERSIONED_RESOURCES}
+    if names:
+        bump_resource_versions(session.connection(), names)
+
+def bump_resource_versions(conn, names):
+    # Called directly by writes that go around the ORM (Core statements).
+    versions = ResourceVersion.__table__
+    for name in sorted(names):
+        bumped = conn.execute(
+            update(versions).where(versions.c.name == name).values(version=versions.c.version + 1)
+        ).rowcount
+        if not bumped:
+            conn.execute(versions.insert().values(name=name, version=1))
+
+def resource_version(*names):
+    versions = dict(db.session.query(ResourceVersion.name, ResourceVersion.version)
+                    .filter(ResourceVersion.name.in_(names)))
+    return "-".join(str(versions.get(name, 0)) for name in names)
+
+class ResponseCache:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (url, version, encoding) -> (body, mimetype, headers)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype, headers):
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[key] = (body, mimetype, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# Pagination and encoding headers are part of the cached response
+CACHED_HEADERS = ("X-Next-Cursor", "Link", "Content-Encoding", "Vary")
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_ENTRIES'], app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+def cached_resource(*names):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = resource_version(*names)
+            url = request.full_path
+            etag = f"{names[0]}-{version}-" + hashlib.sha1(url.encode()).hexdigest()[:12]
+            if request.if_none_match.contains_weak(etag):
+                resp = Response(status=304)
+                resp.set_etag(etag)
+                return resp
+            # Bodies are cached already compressed, one entry per encoding.
+            key = (url, version, negotiate_encoding())
+            cached = response_cache.get(key)
+            if cached is not None:
+                resp = Response(cached[0], mimetype=cached[1], headers=cached[2])
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                if resp.is_streamed:
+                    # Whole lists stay streamed in constant memory and are not
+                    # cached; the ETag still saves the body on a repeat request.
+                    resp.set_etag(etag, weak=True)
+                    return resp
+                compress_response(resp)
+                headers = [(k, v) for k, v in resp.headers if k in CACHED_HEADERS]
+                response_cache.put(key, resp.get_data(), resp.mimetype, headers)
+            resp.set_etag(etag, weak="Content-Encoding" in resp.headers)
+            return resp
+        return wrapper
+    return decorator
+
+####################################################
+# ATTENDANCE ROLLUPS
+####################################################
+# attendance_rollups holds records, hours, break time and late count per
+# (grain, period_start, employee_id). ORM writes to Attendance adjust it in
+# the same flush; the bulk import applies its batch explicitly. Any drift
+# (e.g. rows changed with raw SQL) is repaired with:
+#   flask --app app rebuild-attendance-rollups
+ROLLUP_GRAINS = ("day", "week", "month")
+ROLLUP_MEASURES = ("records", "hours_worked", "break_time", "late_count")
+
+def period_start(grain, day):
+    if grain == "week":
+        return day - timedelta(days=day.weekday())
+    if grain == "month":
+        return day.replace(day=1)
+    return day
+
+def add_rollup(totals, employee_id, day, records, hours_worked, break_time, late_count, sign=1):
+    for grain in ROLLUP_GRAINS:
+        key = (grain, period_start(grain, day), employee_id)
+        current = totals.setdefault(key, [0, 0.0, 0.0, 0])
+        current[0] += sign * records
+        current[1] += sign * hours_worked
+        current[2] += sign * break_time
+        current[3] += sign * late_count
+
+def attendance_totals(rows, sign=1):
+    totals = {}
+    for row in rows:
+        if row["employee_id"] is None or row["date"] is None:
+            continue  # the flush itself rejects the row
+        add_rollup(totals, int(row["employee_id"]), row["date"], 1, float(row.get("hours_worked") or 0.0),
+                   float(row.get("break_time") or 0.0), int(bool(row.get("is_late"))), sign)
+    return totals
+
+def apply_rollup_deltas(conn, totals):
+    # One executemany upsert: concurrent writers adding the first record of a
+    # period for the same employee both land on the same row.
+    totals = {key: delta for key, delta in totals.items() if any(delta)}
+    if not totals:
+        return
+    rollups = AttendanceRollup.__table__
+    rows = [dict(zip(ROLLUP_MEASURES, delta), grain=grain, period_start=start, employee_id=employee_id)
+            for (grain, start, employee_id), delta in totals.items()]
+    if conn.dialect.name == "mysql":
+        stmt = mysql_insert(rollups)
+        stmt = stmt.on_duplicate_key_update({name: rollups.c[name] + stmt.inserted[name]
+                                             for name in ROLLUP_MEASURES})
+    else:
+        stmt = sqlite_insert(rollups)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rollups.c.grain, rollups.c.period_start, rollups.c.employee_id],
+            set_={name: rollups.c[name] + stmt.excluded[name] for name in ROLLUP_MEASURES},
+        )
+    conn.execute(stmt, rows)
+    conn.execute(delete(rollups).where(rollups.c.records <= 0,
+                                       rollups.c.employee_id.in_({key[2] for key in totals})))
+
+def rebuild_attendance_rollups(conn):
+    # Day totals are aggregated by the database; weeks and months are summed
+    # from those, so the work is one GROUP BY over attendance.
+    attendance = Attendance.__table__
+    rollups = AttendanceRollup.__table__
+    totals = {}
+    rows = conn.execute(
+        select(attendance.c.employee_id, attendance.c.date, func.count(),
+               func.coalesce(func.sum(attendance.c.hours_worked), 0.0),
+               func.coalesce(func.sum(attendance.c.break_time), 0.0),
+               func.sum(case((attendance.c.is_late == True, 1), else_=0)))
+        .group_by(attendance.c.employee_id, attendance.c.date)
+    )
+    for employee_id, day, records, hours_worked, break_time, late_count in rows:
+        add_rollup(totals, employee_id, day, records, hours_worked, break_time, late_count)
+    conn.execute(delete(rollups))
+    batch_size = app.config['BULK_BATCH_SIZE']
+    batch = []
+    for (grain, start, employee_id), values in totals.items():
+        batch.append(dict(zip(ROLLUP_MEASURES, values), grain=grain, period_start=start,
+                          employee_id=employee_id))
+        if len(batch) >= batch_size:
+            conn.execute(rollups.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(rollups.insert(), batch)
+    return len(totals)
+
+def _attendance_values(obj, old=False):
+    values = {}
+    for name in ("employee_id", "date", "hours_worked", "break_time", "is_late"):
+        hist = inspect(obj).attrs[name].history
+        if old:
+            before = hist.deleted or hist.unchanged
+            values[name] = before[0] if before else None
+        else:
+            values[name] = getattr(obj, name)
+    return values
+
+@event.listens_for(db.session, "before_flush")
+def _track_attendance_rollups(session, flush_context, instances):
+    # Runs before the flush so an unloaded old value can still be read back.
+    new = [_attendance_values(obj) for obj in session.new if isinstance(obj, Attendance)]
+    old = []
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Attendance):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        values = _attendance_values(obj, old=True)
+        if None in values.values():
+            row = session.connection().execute(
+                select(Attendance.__table__).where(Attendance.id == obj.id)).mappings().first()
+            values = dict(row)
+        old.append(values)
+        if obj in session.dirty and obj not in session.deleted:
+            new.append(_attendance_values(obj))
+    if not new and not old:
+        return
+    totals = attendance_totals(new)
+    for key, delta in attendance_totals(old, sign=-1).items():
+        current = totals.setdefault(key, [0, 0.0, 0.0, 0])
+        for i, value in enumerate(delta):
+            current[i] += value
+    apply_rollup_deltas(session.connection(), totals)
+
+@app.cli.command("rebuild-attendance-rollups")
+def rebuild_attendance_rollups_command():
+    with db.engine.begin() as conn:
+        count = rebuild_attendance_rollups(conn)
+    print(f"Rebuilt {count} attendance rollup rows.")
+
+####################################################
+# FULL-TEXT SEARCH
+####################################################
+# search_documents holds one row per searchable record, keyed by
+# id * SEARCH_KIND_SLOTS + kind code. ORM writes are indexed in after_flush,
+# inside the writing transaction; Core writes call reindex_search() or
+# unindex_search() themselves. Rebuild with
+# `flask --app app rebuild-search-index`.
+SEARCH_KIND_SLOTS = 8
+# model -> (kind, kind code, title column, body column)
+SEARCHABLE = {
+    Task: ("task", 1, Task.title, Task.description),
+    Communication: ("communication", 2, Communication.title, Communication.message),
+    PolicyDocument: ("policy", 3, PolicyDocument.title, PolicyDocument.description),
+    ChatMessage: ("chat", 4, None, ChatMessage.content),
+}
+SEARCH_KINDS = {kind: code for kind, code, _, _ in SEARCHABLE.values()}
+SEARCH_KIND_NAMES = {code: kind for kind, code in SEARCH_KINDS.items()}
+SEARCH_TOKEN = re.compile(r"\w+")
+SEARCH_MAX_TERMS = 16
+
+def search_doc_id(model):
+    return model.id * SEARCH_KIND_SLOTS + SEARCHABLE[model][1]
+
+def index_search(conn, model, *clauses):
+    _, _, title, body = SEARCHABLE[model]
+    docs = SearchDocument.__table__
+    conn.execute(docs.insert().from_select(
+        [docs.c.doc_id, docs.c.title, docs.c.body],
+        select(search_doc_id(model), literal("") if title is None else func.coalesce(title, ""),
+               func.coalesce(body, "")).where(*clauses)))
+
+def unindex_search(conn, model, *clauses):
+    docs = SearchDocument.__table__
+    conn.execute(delete(docs).where(docs.c.doc_id.in_(select(search_doc_id(model)).where(*clauses))))
+
+def reindex_search(conn, model, *clauses):
+    unindex_search(conn, model, *clauses)
+    index_search(conn, model, *clauses)
+
+@event.listens_for(db.session, "after_flush")
+def _sync_search_index(session, flush_context):
+    # New rows are only indexed, edited ones reindexed, deleted ones unindexed.
+    created = defaultdict(set)
+    changed = defaultdict(set)
+    removed = []
+    for obj in session.new:
+        if type(obj) in SEARCHABLE:
+            created[type(obj)].add(obj.id)
+    for obj in session.dirty:
+        model = type(obj)
+        if model not in SEARCHABLE or obj in session.deleted:
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[column.key].history.has_changes() for column in SEARCHABLE[model][2:] if column is not None):
+            changed[model].add(obj.id)
+    for obj in session.deleted:
+        if type(obj) in SEARCHABLE:
+            removed.append(obj.id * SEARCH_KIND_SLOTS + SEARCHABLE[type(obj)][1])
+    if removed:
+        # The rows are gone already, so their entries are addressed directly.
+        docs = SearchDocument.__table__
+        session.connection().execute(delete(docs).where(docs.c.doc_id.in_(removed)))
+    for model, ids in created.items():
+        index_search(session.connection(), model, model.id.in_(ids))
+    for model, ids in changed.items():
+        reindex_search(session.connection(), model, model.id.in_(ids))
+
+def search_terms(q):
+    return SEARCH_TOKEN.findall(q.lower())[:SEARCH_MAX_TERMS]
+
+def search_query(terms, kinds=None):
+    # Every term must match; the last one also matches as a prefix.
+    docs = SearchDocument.__table__
+    if db.engine.dialect.name == "sqlite":
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        rank = literal_column("rank")
+        # ORDER BY rank alone is sorted inside FTS5, with title matches weighted up.
+        query = db.session.query(
+            docs.c.doc_id, docs.c.title,
+            func.snippet(literal_column(docs.name), 1, "", "", "…", 24).label("snippet"),
+            (-rank).label("score"),
+        ).filter(literal_column(docs.name).op("MATCH")(match),
+                 rank.op("MATCH")("bm25(5.0, 1.0)")).order_by(rank)
+    else:
+        relevance = mysql_match(docs.c.title, docs.c.body,
+                                against=" ".join(f"+{term}" for term in terms) + "*").in_boolean_mode()
+        query = db.session.query(
+            docs.c.doc_id, docs.c.title, func.substr(docs.c.body, 1, 200).label("snippet"),
+            relevance.label("score"),
+        ).filter(relevance).order_by(relevance.desc(), docs.c.doc_id)
+    if kinds:
+        query = query.filter((docs.c.doc_id % SEARCH_KIND_SLOTS).in_([SEARCH_KINDS[kind] for kind in kinds]))
+    return query
+
+def search_result(row):
+    ref_id, code = divmod(row.doc_id, SEARCH_KIND_SLOTS)
+    return {"kind": SEARCH_KIND_NAMES[code], "id": ref_id, "title": row.title,
+            "snippet": row.snippet, "score": float(row.score)}
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    docs = SearchDocument.__table__
+    with db.engine.begin() as conn:
+        conn.execute(delete(docs))
+        for model in SEARCHABLE:
+            index_search(conn, model)
+        count = conn.execute(select(func.count()).select_from(docs)).scalar()
+    print(f"Indexed {count} documents.")
+
+####################################################
+# CHAT HISTORY
+####################################################
+# History is read newest-first, backwards from a cursor (the id of the oldest
+# message the client already has) on the (room_id, timestamp) index. The last
+# CHAT_BUFFER_SIZE messages of recently active rooms are also kept in memory so
+# a burst of rejoins can be answered without touching the database.
+class RecentMessages:
+    def __init__(self, per_room, max_rooms):
+        self.per_room = per_room
+        self.max_rooms = max_rooms
+        self._lock = threading.Lock()
+        # room_id -> [deque of message dicts (oldest first), holds whole history?]
+        self._rooms = OrderedDict()
+
+    def get(self, room_id):
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is None:
+                return None, False
+            self._rooms.move_to_end(room_id)
+            return list(entry[0]), entry[1]
+
+    def prime(self, room_id, messages, complete):
+        with self._lock:
+            self._rooms[room_id] = [deque(messages, maxlen=self.per_room), complete]
+            self._rooms.move_to_end(room_id)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+
+    def append(self, room_id, message):
+        # Only rooms already primed from the database are kept up to date; an
+        # unprimed buffer would not be a contiguous tail of the history.
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is None:
+                return
+            messages, complete = entry
+            if complete and len(messages) == messages.maxlen:
+                entry[1] = False
+            messages.append(message)
+
+    def discard(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+recent_messages = (
+    RecentMessages(app.config['CHAT_BUFFER_SIZE'], app.config['CHAT_BUFFER_ROOMS'])
+    if app.config['CHAT_BUFFER_SIZE'] > 0 else None
+)
+
+def chat_history_query(room_id, before=None, before_ts=None, pivot=None):
+    query = chat_message_schema.query().filter(ChatMessage.room_id == room_id)
+    if before is not None:
+        if pivot is None:
+            row = db.session.query(ChatMessage.timestamp).filter(
+                ChatMessage.id == before, ChatMessage.room_id == room_id).first()
+            if row is None:
+                raise InvalidCursor(before)
+            pivot = row[0]
+        query = query.filter(ChatMessage.timestamp <= pivot,
+                             or_(ChatMessage.timestamp < pivot, ChatMessage.id < before))
+    elif before_ts is not None:
+        query = query.filter(ChatMessage.timestamp < before_ts)
+    return query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+
+def chat_history(room_id, before=None, before_ts=None, limit=None):
+    # Returns (messages newest first, cursor for the next page or None).
+    page_size = app.config['CHAT_PAGE_SIZE']
+    limit = min(limit or page_size, page_size)
+    if recent_messages is not None and before_ts is None:
+        buffered, complete = recent_messages.get(room_id)
+        if buffered is None and before is None:
+            rows = chat_history_query(room_id).limit(recent_messages.per_room).all()
+            buffered = chat_message_schema.dump_rows(reversed(rows))
+            complete = len(rows) < recent_messages.per_room
+            recent_messages.prime(room_id, buffered, complete)
+        if buffered is not None:
+            if before is not None:
+                ids = [m["id"] for m in buffered]
+                buffered = buffered[:ids.index(before)] if before in ids else None
+            if buffered is not None and (len(buffered) > limit or complete):
+                page = buffered[::-1][:limit]
+                more = len(buffered) > limit
+                return page, (page[-1]["id"] if more else None)
+    rows = chat_history_query(room_id, before, before_ts).limit(limit + 1).all()
+    more = len(rows) > limit
+    page = chat_message_schema.dump_rows(rows[:limit])
+    return page, (page[-1]["id"] if more else None)
+
+####################################################
+# CHAT MEMBERSHIP
+####################################################
+# Socket.IO join/send/history are only allowed for members of the room. Each
+# process caches room -> set of member ids, loaded on first use, evicted LRU
+# and dropped whenever a membership row or the room itself is written.
+class RoomMembers:
+    def __init__(self, max_rooms, ttl):
+        self.max_rooms = max_rooms
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rooms = OrderedDict()  # room_id -> (frozenset of user ids, expires_at)
+
+    def members(self, room_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is not None and entry[1] > now:
+                self._rooms.move_to_end(room_id)
+                return entry[0]
+        members = frozenset(
+            user_id for (user_id,) in db.session.query(ChatRoomMember.user_id)
+            .join(ChatRoom, ChatRoom.id == ChatRoomMember.room_id)
+            .filter(ChatRoomMember.room_id == room_id)
+        )
+        with self._lock:
+            self._rooms[room_id] = (members, now + self.ttl)
+            self._rooms.move_to_end(room_id)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        return members
+
+    def is_member(self, room_id, user_id):
+        return user_id in self.members(room_id)
+
+    def discard(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+room_members = RoomMembers(app.config['CHAT_MEMBERSHIP_ROOMS'], app.config['CHAT_MEMBERSHIP_TTL'])
+
+@event.listens_for(db.session, "after_flush")
+def _track_membership_changes(session, flush_context):
+    rooms = session.info.setdefault("membership_rooms", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, ChatRoomMember):
+            rooms.add(obj.room_id)
+            hist = inspect(obj).attrs.room_id.history
+            rooms.update(hist.deleted or ())
+        elif isinstance(obj, ChatRoom) and obj in session.deleted:
+            rooms.add(obj.id)
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_memberships(session):
+    for room_id in session.info.pop("membership_rooms", ()):
+        room_members.discard(room_id)
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_membership_changes(session):
+    session.info.pop("membership_rooms", None)
+
+def chat_ids(*values):
+    # Socket.IO payloads carry ids as whatever the client sent.
+    try:
+        return tuple(int(v) for v in values)
+    except (TypeError, ValueError):
+        return None
+
+####################################################
+# CHAT GROUP COMMIT
+####################################################
+class IdAllocator:
+    # Hands out ids from blocks reserved in id_sequences (hi/lo), so a message
+    # has its final id before it is written. Each reservation is one short
+    # transaction; concurrent processes get disjoint blocks.
+    def __init__(self, model, block_size):
+        self.model = model
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._limit:
+                self._next = self._reserve()
+                self._limit = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self):
+        seq = IdSequence.__table__
+        name = self.model.__tablename__
+        for _ in range(3):
+            try:
+                with db.engine.begin() as conn:
+                    # Rows written without the allocator (group commit off, bulk
+                    # inserts) may have taken ids past the sequence, so a block
+                    # never starts below max(id) + 1.
+                    floor = (conn.execute(select(func.max(self.model.id))).scalar() or 0) + 1
+                    start = case((seq.c.next_value < floor, floor), else_=seq.c.next_value)
+                    updated = conn.execute(
+                        update(seq).where(seq.c.name == name).values(next_value=start + self.block_size)
+                    ).rowcount
+                    if not updated:
+                        conn.execute(seq.insert().values(name=name, next_value=floor + self.block_size))
+                        return floor
+                    return conn.execute(
+                        select(seq.c.next_value).where(seq.c.name == name)
+                    ).scalar() - self.block_size
+            except sqlalchemy_exc.IntegrityError:
+                # Another process created the row first; take the update path.
+                continue
+        raise RuntimeError(f"Could not reserve ids for {name}")
+
+class BatchWriter:
+    # Rows queued by request handlers are inserted by one background thread
+    # (a green thread under eventlet) in batches of batch_size, or whatever
+    # arrived within interval seconds, one transaction per batch.
+    name = "batch-writer"
+
+    def __init__(self, table, batch_size, interval, max_queue, put_timeout):
+        self.table = table
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+    def put(self, row):
+        # False when the queue stayed full for put_timeout seconds.
+        self._ensure_started()
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            return False
+        return True
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.interval)
+                except queue.Empty:
+                    if self._stopping:
+                        return
+                    self.maintain()
+                    continue
+                batch = [first]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        batch.append(self._queue.get(timeout=max(remaining, 0)) if remaining > 0
+                                     else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._write(batch)
+                self.maintain()
+
+    def maintain(self):
+        # Periodic work; runs after every batch and whenever the queue is idle.
+        pass
+
+    def inserted(self, conn, rows):
+        pass
+
+    def failed(self, row):
+        pass
+
+    def _write(self, batch):
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(self.table.insert(), batch)
+                self.inserted(conn, batch)
+            return
+        except Exception:
+            app.logger.exception("%s batch of %d failed, retrying row by row", self.name, len(batch))
+        for row in batch:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(self.table.insert(), row)
+                    self.inserted(conn, [row])
+            except Exception:
+                app.logger.exception("%s dropping row %r", self.name, row)
+                self.failed(row)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=30):
+        # Let the flusher drain everything already queued, then exit.
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class ChatWriter(BatchWriter):
+    name = "chat-writer"
+
+    def __init__(self, batch_size, interval, max_queue, put_timeout, id_block):
+        super().__init__(ChatMessage.__table__, batch_size, interval, max_queue, put_timeout)
+        self.ids = IdAllocator(ChatMessage, id_block)
+
+    def submit(self, room_id, sender_id, content):
+        # Returns the row as it will be stored, or None when the queue stayed
+        # full for put_timeout seconds (back-pressure on the sender).
+        row = {
+            "id": self.ids.next_id(),
+            "room_id": room_id,
+            "sender_id": sender_id,
+            "content": content,
+            "timestamp": datetime.utcnow(),
+        }
+        return row if self.put(row) else None
+
+    def inserted(self, conn, rows):
+        index_search(conn, ChatMessage, ChatMessage.id.in_([row["id"] for row in rows]))
+
+    def failed(self, row):
+        # The message was already broadcast when it was queued: tell the room
+        # (sender included) it was not stored, and drop the cached history.
+        if recent_messages is not None:
+            recent_messages.discard(row["room_id"])
+        socketio.emit("message_failed", {"id": row["id"], "room_id": row["room_id"],
+                                         "message": "Message could not be saved"},
+                      room=str(row["room_id"]))
+
+chat_writer = (
+    ChatWriter(app.config['CHAT_FLUSH_BATCH'], app.config['CHAT_FLUSH_INTERVAL'],
+               app.config['CHAT_QUEUE_MAX'], app.config['CHAT_QUEUE_TIMEOUT'],
+               app.config['CHAT_ID_BLOCK'])
+    if app.config['CHAT_GROUP_COMMIT'] else None
+)
+if chat_writer is not None:
+    atexit.register(chat_writer.stop)
+
+####################################################
+# CONNECTION POOL STATISTICS
+####################################################
+# Per-engine counters from pool events, reported by /admin/db/pool next to
+# the pool's own gauges. A request that times out waiting for a connection
+# gets a 503 instead of a 500 and is counted.
+class PoolStats:
+    EVENTS = ("connect", "checkout", "invalidate")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(int)
+
+    def incr(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def watch(self, engine):
+        for name in self.EVENTS:
+            event.listen(engine, name, lambda *args, name=name: self.incr(name))
+
+pool_stats = {}
+with app.app_context():
+    for _name, _engine in db.engines.items():
+        pool_stats[_engine] = PoolStats()
+        pool_stats[_engine].watch(_engine)
+
+def database_engines():
+    # (label, engine) pairs: the primary, then the replica when configured.
+    engines = [("primary", db.engine)]
+    if app.config['DATABASE_REPLICA_URL']:
+        engines.append(("replica", db.engines["replica"]))
+    return engines
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    for key, attr in (("size", "size"), ("checked_in", "checkedin"),
+                      ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if hasattr(pool, attr):
+            status[key] = getattr(pool, attr)()
+    stats = pool_stats.get(engine)
+    if stats is not None:
+        status.update({name + "s": stats.counts[name] for name in PoolStats.EVENTS})
+        status["timeouts"] = stats.counts["timeout"]
+    return status
+
+@app.errorhandler(sqlalchemy_exc.TimeoutError)
+def database_pool_timeout(exc):
+    db.session.rollback()
+    stats = pool_stats.get(db.engine)
+    if stats is not None:
+        stats.incr("timeout")
+    app.logger.warning("Timed out waiting for a database connection: %s", exc)
+    return jsonify({"message": "Database busy, retry shortly"}), 503
+
+####################################################
+# INSTRUMENTATION
+####################################################
+# Every HTTP request and Socket.IO event collects its SQL statement count and
+# time (from cursor events on every engine), serialization time and latency
+# in a RequestMetrics held in flask.g. Requests report them in a
+# Server-Timing header (for streamed bodies it covers the work before the
+# first byte); both feed the histograms /admin/metrics serves in the
+# Prometheus text format. Histograms are per process: scrape each worker.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+def prometheus_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = defaultdict(int)
+
+    def inc(self, values, amount=1):
+        with self._lock:
+            self._series[values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for values, count in series:
+            lines.append(f"{self.name}{prometheus_labels(self.labels, values)} {count}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> [count per bucket..., count above the last, sum]
+        self._series = {}
+
+    def observe(self, values, amount):
+        i = bisect_left(self.buckets, amount)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((values, list(counts)) for values, counts in self._series.items())
+        names = self.labels + ("le",)
+        for values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{prometheus_labels(names, values + (bound,))} {cumulative}")
+            labels = prometheus_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency, streamed bodies included.",
+                            ("method", "route", "status"), LATENCY_BUCKETS)
+REQUEST_SQL_STATEMENTS = Histogram("http_request_sql_statements", "SQL statements executed per HTTP request.",
+                                   ("method", "route"), STATEMENT_BUCKETS)
+REQUEST_SQL_TIME = Histogram("http_request_sql_duration_seconds", "Time spent in SQL per HTTP request.",
+                             ("method", "route"), LATENCY_BUCKETS)
+REQUEST_SERIALIZATION = Histogram("http_request_serialization_seconds", "Time spent encoding JSON per HTTP request.",
+                                  ("method", "route"), LATENCY_BUCKETS)
+EVENT_LATENCY = Histogram("socketio_event_duration_seconds", "Socket.IO handler latency.",
+                          ("event",), LATENCY_BUCKETS)
+EVENT_SQL_STATEMENTS = Histogram("socketio_event_sql_statements", "SQL statements executed per Socket.IO event.",
+                                 ("event",), STATEMENT_BUCKETS)
+EVENT_SQL_TIME = Histogram("socketio_event_sql_duration_seconds", "Time spent in SQL per Socket.IO event.",
+                           ("event",), LATENCY_BUCKETS)
+QUERY_PROBLEMS = Counter("query_problems_total", "Requests and events flagged by the query detector.",
+                         ("endpoint", "problem"))
+METRICS = [REQUEST_LATENCY, REQUEST_SQL_STATEMENTS, REQUEST_SQL_TIME, REQUEST_SERIALIZATION,
+           EVENT_LATENCY, EVENT_SQL_STATEMENTS, EVENT_SQL_TIME, QUERY_PROBLEMS]
+
+def short_statement(statement):
+    return " ".join(statement.split())[:200]
+
+class RequestMetrics:
+    def __init__(self, detect):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        # Per-statement counts are only kept for the query detector.
+        self.statements = defaultdict(int) if detect else None
+        self.slow_statements = []
+
+    def add_statement(self, statement, elapsed):
+        self.sql_count += 1
+        self.sql_time += elapsed
+        if self.statements is not None:
+            self.statements[statement] += 1
+            if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+                self.slow_statements.append((elapsed, statement))
+
+    def server_timing(self):
+        total = time.perf_counter() - self.started
+        return (f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries", '
+                f'serialize;dur={self.serialize_time * 1000:.1f}, total;dur={total * 1000:.1f}')
+
+    def finish(self, endpoint):
+        total = time.perf_counter() - self.started
+        if self.statements is None:
+            return total
+        for elapsed, statement in self.slow_statements:
+            QUERY_PROBLEMS.inc((endpoint, "slow_query"))
+            app.logger.warning("Slow query in %s (%.1f ms): %s", endpoint, elapsed * 1000, short_statement(statement))
+        for statement, count in self.statements.items():
+            if count >= app.config['NPLUS1_THRESHOLD']:
+                QUERY_PROBLEMS.inc((endpoint, "n_plus_one"))
+                app.logger.warning("Possible N+1 in %s: %d executions of %s", endpoint, count, short_statement(statement))
+        if total * 1000 >= app.config['SLOW_REQUEST_MS']:
+            QUERY_PROBLEMS.inc((endpoint, "slow_request"))
+            app.logger.warning("Slow request %s: %.1f ms, %d queries in %.1f ms", endpoint, total * 1000,
+                               self.sql_count, self.sql_time * 1000)
+        return total
+
+def current_metrics():
+    # None outside requests and events, e.g. in the background writers.
+    return g.get("metrics") if has_app_context() else None
+
+def record_serialization(elapsed):
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.serialize_time += elapsed
+
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("statement_started", None)
+    metrics = current_metrics()
+    if started is not None and metrics is not None:
+        metrics.add_statement(statement, time.perf_counter() - started)
+
+with app.app_context():
+    for _engine in db.engines.values():
+        event.listen(_engine, "before_cursor_execute", _start_statement_timer)
+        event.listen(_engine, "after_cursor_execute", _record_statement)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        body = super().dumps(obj, **kwargs)
+        record_serialization(time.perf_counter() - started)
+        return body
+
+app.json = TimedJSONProvider(app)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics = RequestMetrics(app.config['QUERY_DETECTOR'])
+
+@app.after_request
+def finish_request_metrics(resp):
+    metrics = g.get("metrics")
+    if metrics is None:
+        return resp
+    resp.headers["Server-Timing"] = metrics.server_timing()
+    method = request.method
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    status = str(resp.status_code)
+
+    # Observed on close so streamed bodies count in full.
+    def observe():
+        total = metrics.finish(f"{method} {route}")
+        REQUEST_LATENCY.observe((method, route, status), total)
+        REQUEST_SQL_STATEMENTS.observe((method, route), metrics.sql_count)
+        REQUEST_SQL_TIME.observe((method, route), metrics.sql_time)
+        REQUEST_SERIALIZATION.observe((method, route), metrics.serialize_time)
+
+    resp.call_on_close(observe)
+    return resp
+
+def socketio_event(name):
+    # socketio.on(name), with the handler measured like a request.
+    def decorator(handler):
+        @wraps(handler)
+        def instrumented(*args):
+            metrics = g.metrics = RequestMetrics(app.config['QUERY_DETECTOR'])
+            try:
+                return handler(*args)
+            finally:
+                EVENT_LATENCY.observe((name,), metrics.finish(f"socket.io {name}"))
+                EVENT_SQL_STATEMENTS.observe((name,), metrics.sql_count)
+                EVENT_SQL_TIME.observe((name,), metrics.sql_time)
+        return socketio.on(name)(instrumented)
+    return decorator
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    pool_metrics = (("checked_out", "db_pool_checked_out", "gauge", "Connections checked out of the pool."),
+                    ("timeouts", "db_pool_timeouts_total", "counter", "Requests that timed out waiting for a connection."))
+    for key, name, kind, description in pool_metrics:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for label, engine in database_engines():
+            status = pool_status(engine)
+            if key in status:
+                lines.append(f"{name}{prometheus_labels(('engine',), (label,))} {status[key]}")
+    return "\n".join(lines) + "\n"
+
+####################################################
+# AUDIT LOG
+####################################################
+# ORM inserts, updates and deletes are described in after_flush; handlers
+# that write with Core statements call audit() themselves. Entries are held
+# in session.info and only queued once the transaction commits.
+AUDIT_EXCLUDED = (ActivityLog, SchemaMigration, ResourceVersion, IdSequence, AttendanceRollup, ChatMessage)
+
+def audit(description):
+    db.session.info.setdefault("audit_entries", []).append(description)
+
+@event.listens_for(db.session, "after_flush")
+def _track_audit_entries(session, flush_context):
+    if audit_writer is None:
+        return
+    entries = session.info.setdefault("audit_entries", [])
+    for obj in session.new:
+        if not isinstance(obj, AUDIT_EXCLUDED):
+            entries.append(f"created {obj.__tablename__} {obj.id}")
+    for obj in session.dirty:
+        if isinstance(obj, AUDIT_EXCLUDED) or obj in session.deleted:
+            continue
+        changed = [attr.key for attr in inspect(obj).attrs if attr.history.has_changes()]
+        if changed:
+            entries.append(f"updated {obj.__tablename__} {obj.id} ({', '.join(changed)})")
+    for obj in session.deleted:
+        if not isinstance(obj, AUDIT_EXCLUDED):
+            entries.append(f"deleted {obj.__tablename__} {obj.id}")
+
+@event.listens_for(db.session, "after_commit")
+def _queue_audit_entries(session):
+    entries = session.info.pop("audit_entries", None)
+    if not entries or audit_writer is None:
+        return
+    prefix = f"{request.method} {request.path}: " if has_request_context() else ""
+    now = datetime.utcnow()
+    limit = ActivityLog.description.type.length
+    for entry in entries:
+        audit_writer.record((prefix + entry)[:limit], now)
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_audit_entries(session):
+    session.info.pop("audit_entries", None)
+
+def prune_activity_log(retention_days, batch_size=5000):
+    # Deletes in id batches so no single statement holds locks for long.
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    table = ActivityLog.__table__
+    deleted = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = [i for (i,) in conn.execute(
+                select(table.c.id).where(table.c.timestamp < cutoff).limit(batch_size))]
+            if not ids:
+                return deleted
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+        deleted += len(ids)
+
+class AuditWriter(BatchWriter):
+    name = "audit-writer"
+
+    def __init__(self, batch_size, interval, max_queue, retention_days, prune_interval):
+        super().__init__(ActivityLog.__table__, batch_size, interval, max_queue, put_timeout=0)
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.dropped = 0
+        self._next_prune = time.monotonic()
+
+    def record(self, description, timestamp):
+        # Never blocks a request: a full queue drops the entry.
+        if not self.put({"description": description, "timestamp": timestamp}):
+            self.dropped += 1
+            app.logger.warning("Audit queue full, dropped: %s", description)
+
+    def maintain(self):
+        if self.retention_days <= 0 or time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_interval
+        try:
+            prune_activity_log(self.retention_days)
+        except Exception:
+            app.logger.exception("Pruning activity_log failed")
+
+audit_writer = (
+    AuditWriter(app.config['AUDIT_FLUSH_BATCH'], app.config['AUDIT_FLUSH_INTERVAL'],
+                app.config['AUDIT_QUEUE_MAX'], app.config['AUDIT_RETENTION_DAYS'],
+                app.config['AUDIT_PRUNE_INTERVAL'])
+    if app.config['AUDIT_LOG'] else None
+)
+if audit_writer is not None:
+    atexit.register(audit_writer.stop)
+
+@app.cli.command("prune-activity-log")
+def prune_activity_log_command():
+    days = app.config['AUDIT_RETENTION_DAYS']
+    if days <= 0:
+        print("AUDIT_RETENTION_DAYS is 0; nothing pruned.")
+        return
+    print(f"Deleted {prune_activity_log(days)} activity_log entries older than {days} days.")
+
+####################################################
+# EXPORT JOBS
+####################################################
+# Long reports are written to files by background workers instead of inside a
+# request. Jobs live in export_jobs; a worker claims a Queued one with a
+# guarded UPDATE, so any number of processes (and `flask --app app
+# export-worker`) can share the queue. Rows are read in keyset batches of
+# employees (each batch read in full, so no cursor stays open between
+# batches) and streamed to a .part file that is renamed when complete.
+# Progress goes to the "export:<id>" Socket.IO room; cancelling flips the
+# status, which the worker sees at its next progress update.
+EXPORT_FORMATS = {"csv": "text/csv",
+                  "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+EXPORT_ACTIVE = ("Queued", "Running")
+EXPORT_EMPLOYEE_BATCH = 200
+EXPORT_PROGRESS_INTERVAL = 0.5
+
+class ExportCancelled(Exception):
+    pass
+
+def export_employee_batches(params):
+    query = db.session.query(Employee.id, Employee.first_name, Employee.last_name, Employee.department)
+    if params.get("employee_id") is not None:
+        query = query.filter(Employee.id == params["employee_id"])
+    if params.get("department"):
+        query = query.filter(Employee.department == params["department"])
+    last_id = 0
+    while True:
+        batch = query.filter(Employee.id > last_id).order_by(Employee.id).limit(EXPORT_EMPLOYEE_BATCH).all()
+        if not batch:
+            return
+        yield {row.id: row for row in batch}
+        last_id = batch[-1].id
+
+def export_period(params):
+    return parse_date(params["from"]), parse_date(params["to"])
+
+def attendance_export_rows(params):
+    start, end = export_period(params)
+    for employees in export_employee_batches(params):
+        rows = db.session.query(
+            Attendance.employee_id, Attendance.date, Attendance.status, Attendance.is_late,
+            Attendance.hours_worked, Attendance.break_time,
+        ).filter(Attendance.employee_id.in_(list(employees)), Attendance.date.between(start, end)) \
+         .order_by(Attendance.employee_id, Attendance.date).all()
+        out = []
+        for row in rows:
+            e = employees[row.employee_id]
+            out.append((e.id, e.first_name, e.last_name, e.department, row.date, row.status,
+                        bool(row.is_late), row.hours_worked, row.break_time))
+        if out:
+            yield out
+
+def attendance_export_count(params):
+    start, end = export_period(params)
+    query = db.session.query(func.count(Attendance.id)).filter(Attendance.date.between(start, end))
+    if params.get("employee_id") is not None or params.get("department"):
+        query = query.join(Employee, Employee.id == Attendance.employee_id)
+        if params.get("employee_id") is not None:
+            query = query.filter(Employee.id == params["employee_id"])
+        if params.get("department"):
+            query = query.filter(Employee.department == params["department"])
+    return query.scalar()
+
+def payroll_export_rows(params):
+    # One row per employee with attendance in the period, plus active
+    # employees without any (so they show up with zeros).
+    start, end = export_period(params)
+    for employees in export_employee_batches(params):
+        totals = {row[0]: row[1:] for row in db.session.query(
+            Attendance.employee_id, func.count(Attendance.id),
+            func.coalesce(func.sum(Attendance.hours_worked), 0.0),
+            func.coalesce(func.sum(Attendance.break_time), 0.0),
+            func.sum(case((Attendance.is_late == True, 1), else_=0)),
+        ).filter(Attendance.employee_id.in_(list(employees)), Attendance.date.between(start, end))
+         .group_by(Attendance.employee_id)}
+        active = {i for (i,) in db.session.query(Employee.id).filter(
+            Employee.id.in_(list(employees)), Employee.is_active == True)}
+        out = []
+        for employee_id, e in employees.items():
+            if employee_id not in totals and employee_id not in active:
+                continue
+            days, hours_worked, break_time, late_count = totals.get(employee_id, (0, 0.0, 0.0, 0))
+            out.append((e.id, e.first_name, e.last_name, e.department, start, end, days,
+                        round(hours_worked, 2), round(break_time, 2), int(late_count or 0)))
+        if out:
+            yield out
+
+def payroll_export_count(params):
+    # The employees payroll_export_rows writes: active or with attendance.
+    start, end = export_period(params)
+    worked = select(Attendance.id).where(Attendance.employee_id == Employee.id,
+                                         Attendance.date.between(start, end)).exists()
+    query = db.session.query(func.count(Employee.id)).filter(or_(Employee.is_active == True, worked))
+    if params.get("employee_id") is not None:
+        query = query.filter(Employee.id == params["employee_id"])
+    if params.get("department"):
+        query = query.filter(Employee.department == params["department"])
+    return query.scalar()
+
+# report -> (columns, row batches, expected row count)
+EXPORT_REPORTS = {
+    "attendance": (("employee_id", "first_name", "last_name", "department", "date", "status",
+                    "is_late", "hours_worked", "break_time"),
+                   attendance_export_rows, attendance_export_count),
+    "payroll": (("employee_id", "first_name", "last_name", "department", "period_start", "period_end",
+                 "days", "hours_worked", "break_time", "late_count"),
+                payroll_export_rows, payroll_export_count),
+}
+
+def export_params(data):
+    report = data.get("report")
+    if report not in EXPORT_REPORTS:
+        raise ValueError("report must be one of: " + ", ".join(sorted(EXPORT_REPORTS)))
+    fmt = data.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("format must be 'csv' or 'xlsx'")
+    if fmt == "xlsx" and openpyxl is None:
+        raise ValueError("xlsx exports need the openpyxl package")
+    start = parse_date(data.get("from"))
+    end = parse_date(data.get("to"))
+    if start is None or end is None:
+        raise ValueError("from and to are required")
+    if end < start:
+        raise ValueError("to must not be before from")
+    if (end - start).days >= app.config['EXPORT_MAX_DAYS']:
+        raise ValueError(f"The period may span at most {app.config['EXPORT_MAX_DAYS']} days")
+    params = {"from": start.isoformat(), "to": end.isoformat()}
+    if data.get("employee_id") is not None:
+        try:
+            params["employee_id"] = int(data["employee_id"])
+        except (TypeError, ValueError):
+            raise ValueError("employee_id must be an integer")
+    if data.get("department"):
+        params["department"] = str(data["department"])
+    return report, fmt, params
+
+class ExportFile:
+    def __init__(self, fmt, path, columns):
+        self.fmt = fmt
+        if fmt == "xlsx":
+            # write_only keeps memory flat: rows go straight to a temp file.
+            self._book = openpyxl.Workbook(write_only=True)
+            self._sheet = self._book.create_sheet("Export")
+            self._sheet.append(columns)
+            self._path = path
+        else:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns)
+
+    def write(self, rows):
+        if self.fmt == "xlsx":
+            for row in rows:
+                self._sheet.append(row)
+        else:
+            self._writer.writerows(rows)
+
+    def close(self):
+        if self.fmt == "xlsx":
+            self._book.save(self._path)
+        else:
+            self._file.close()
+
+def export_path(job_id, fmt):
+    return os.path.join(app.config['EXPORT_DIR'], f"export-{job_id}.{fmt}")
+
+def export_progress(job):
+    return {"job_id": job["id"], "status": job["status"], "rows_written": job["rows_written"],
+            "total_rows": job["total_rows"]}
+
+def update_export_job(job_id, only_if=None, **values):
+    # Returns False when the job is gone or no longer in an only_if status.
+    jobs = ExportJob.__table__
+    stmt = update(jobs).where(jobs.c.id == job_id)
+    if only_if is not None:
+        stmt = stmt.where(jobs.c.status.in_(only_if))
+    with db.engine.begin() as conn:
+        return conn.execute(stmt.values(**values)).rowcount == 1
+
+def load_export_job(job_id):
+    with db.engine.connect() as conn:
+        row = conn.execute(select(ExportJob.__table__).where(ExportJob.id == job_id)).mappings().first()
+    return dict(row) if row is not None else None
+
+def emit_export_progress(job_id):
+    job = load_export_job(job_id)
+    if job is not None:
+        socketio.emit("export_progress", export_progress(job), room=f"export:{job_id}")
+
+def claim_export_job():
+    jobs = ExportJob.__table__
+    while True:
+        with db.engine.connect() as conn:
+            job_id = conn.execute(select(jobs.c.id).where(jobs.c.status == "Queued")
+                                  .order_by(jobs.c.id).limit(1)).scalar()
+        if job_id is None:
+            return None
+        now = datetime.utcnow()
+        if update_export_job(job_id, only_if=("Queued",), status="Running", started_at=now, heartbeat_at=now):
+            return job_id
+
+def run_export_job(job_id):
+    job = load_export_job(job_id)
+    columns, rows, count = EXPORT_REPORTS[job["report"]]
+    params = json.loads(job["params"])
+    path = export_path(job_id, job["format"])
+    partial = path + ".part"
+    try:
+        os.makedirs(app.config['EXPORT_DIR'], exist_ok=True)
+        if not update_export_job(job_id, only_if=("Running",), total_rows=count(params)):
+            raise ExportCancelled()
+        emit_export_progress(job_id)
+        written = 0
+        reported = time.monotonic()
+        out = ExportFile(job["format"], partial, columns)
+        try:
+            for batch in rows(params):
+                out.write(batch)
+                written += len(batch)
+                if time.monotonic() - reported >= EXPORT_PROGRESS_INTERVAL:
+                    reported = time.monotonic()
+                    if not update_export_job(job_id, only_if=("Running",), rows_written=written,
+                                             heartbeat_at=datetime.utcnow()):
+                        raise ExportCancelled()
+                    emit_export_progress(job_id)
+                time.sleep(0)  # let request handlers run between batches under eventlet
+        finally:
+            out.close()
+        os.replace(partial, path)
+        now = datetime.utcnow()
+        expires = now + timedelta(hours=app.config['EXPORT_TTL_HOURS'])
+        if not update_export_job(job_id, only_if=("Running",), status="Completed", rows_written=written,
+                                 finished_at=now, expires_at=expires):
+            os.remove(path)
+    except ExportCancelled:
+        pass
+    except Exception as exc:
+        app.logger.exception("Export %s failed", job_id)
+        update_export_job(job_id, only_if=("Running",), status="Failed", finished_at=datetime.utcnow(),
+                          error=f"{exc.__class__.__name__}: {exc}"[:500])
+    finally:
+        db.session.remove()
+        if os.path.exists(partial):
+            os.remove(partial)
+    emit_export_progress(job_id)
+
+def prune_exports():
+    # Expires finished files past their TTL and fails jobs whose worker has
+    # stopped sending heartbeats.
+    jobs = ExportJob.__table__
+    now = datetime.utcnow()
+    with db.engine.connect() as conn:
+        expired = conn.execute(select(jobs.c.id, jobs.c.format).where(
+            jobs.c.status == "Completed", jobs.c.expires_at <= now)).all()
+    for job_id, fmt in expired:
+        if update_export_job(job_id, only_if=("Completed",), status="Expired"):
+            try:
+                os.remove(export_path(job_id, fmt))
+            except FileNotFoundError:
+                pass
+    stale_before = now - timedelta(seconds=app.config['EXPORT_STALE_SECONDS'])
+    with db.engine.begin() as conn:
+        stale = conn.execute(update(jobs).where(jobs.c.status == "Running", jobs.c.heartbeat_at < stale_before)
+                             .values(status="Failed", finished_at=now, error="Export worker stopped")).rowcount
+    return len(expired), stale
+
+class ExportWorkers:
+    # size threads (green threads under eventlet) that claim and run queued
+    # jobs and prune old ones every prune_interval. notify() wakes one up;
+    # otherwise they poll every poll_interval.
+    name = "export-worker"
+
+    def __init__(self, size, poll_interval, prune_interval=60):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.prune_interval = prune_interval
+        self._wake = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self._next_prune = time.monotonic()
+        self._schema_ready = False
 
-# Compliance (Policy) Models
-class PolicyDocument(db.Model):
-    __tablename__ = 'policy_documents'
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.String(500), default='')
-    status = db.Column(db.String(50), default='Active')
-    doc_url = db.Column(db.String(500), default='')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    def notify(self):
+        self.start()
+        self._wake.put(None)
 
-class PolicyAcknowledgement(db.Model):
-    __tablename__ = 'policy_acknowledgements'
-    id = db.Column(db.Integer, primary_key=True)
-    policy_id = db.Column(db.Integer, db.ForeignKey('policy_documents.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
-    ack_status = db.Column(db.String(50), default='Acknowledged')
-    ack_date = db.Column(db.DateTime, default=datetime.utcnow)
+    def start(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads and not self._stopping:
+                for n in range(self.size):
+                    thread = threading.Thread(target=self.run, name=f"{self.name}-{n}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
 
-# Time Tracking Models
-class Attendance(db.Model):
-    __tablename__ = 'attendance'
-    id = db.Column(db.Integer, primary_key=True)
-    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
-    date = db.Column(db.String(50), nullable=False)  # "YYYY-MM-DD"
-    is_late = db.Column(db.Boolean, default=False)
-    hours_worked = db.Column(db.Float, default=0.0)
-    break_time = db.Column(db.Float, default=0.0)
-    status = db.Column(db.String(20), default='Present')
+    def run(self):
+        with app.app_context():
+            while not self._stopping:
+                job_id = None
+                if self.schema_ready():
+                    self.prune()
+                    try:
+                        job_id = claim_export_job()
+                    except Exception:
+                        app.logger.exception("Claiming an export job failed")
+                if job_id is not None:
+                    run_export_job(job_id)
+                    continue
+                try:
+                    self._wake.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    pass
 
-class Project(db.Model):
-    __tablename__ = 'projects'
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    progress = db.Column(db.Integer, default=0)  # 0-100
+    def schema_ready(self):
+        # export_jobs comes with migration 13; until then there is nothing to poll.
+        if not self._schema_ready:
+            try:
+                with db.engine.connect() as conn:
+                    self._schema_ready = conn.execute(
+                        select(SchemaMigration.version).where(SchemaMigration.version == 13)
+                    ).first() is not None
+            except sqlalchemy_exc.DBAPIError:
+                pass
+        return self._schema_ready
 
-# Communication Model
-class Communication(db.Model):
-    __tablename__ = 'communications'
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    message = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    def prune(self):
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + self.prune_interval
+        try:
+            prune_exports()
+        except Exception:
+            app.logger.exception("Pruning exports failed")
 
-# Chat Models
-class ChatRoom(db.Model):
-    __tablename__ = 'chat_rooms'
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    def stop(self, timeout=5):
+        # Running jobs are abandoned; prune_exports() fails them later.
+        self._stopping = True
+        for _ in self._threads:
+            self._wake.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
 
-class ChatRoomMember(db.Model):
-    __tablename__ = 'chat_room_members'
-    id = db.Column(db.Integer, primary_key=True)
-    room_id = db.Column(db.Integer, db.ForeignKey('chat_rooms.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+export_workers = (
+    ExportWorkers(app.config['EXPORT_WORKERS'], app.config['EXPORT_POLL_INTERVAL'])
+    if app.config['EXPORT_WORKERS'] > 0 else None
+)
+if export_workers is not None:
+    atexit.register(export_workers.stop)
 
-class ChatMessage(db.Model):
-    __tablename__ = 'chat_messages'
-    id = db.Column(db.Integer, primary_key=True)
-    room_id = db.Column(db.Integer, db.ForeignKey('chat_rooms.id'), nullable=False)
-    sender_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
-    content = db.Column(db.String(1000), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+@app.before_request
+def start_export_workers():
+    # Called by the server entry points at startup, so jobs queued or stalled
+    # before a restart are picked up; the first request covers `flask run`.
+    if export_workers is not None:
+        export_workers.start()
+
+@app.cli.command("export-worker")
+@click.option("--threads", default=2, show_default=True)
+def export_worker_command(threads):
+    # Runs exports in this process only, e.g. with EXPORT_WORKERS=0 on the web processes.
+    workers = ExportWorkers(threads, app.config['EXPORT_POLL_INTERVAL'])
+    workers.notify()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        workers.stop()
+
+@app.cli.command("prune-exports")
+def prune_exports_command():
+    expired, stale = prune_exports()
+    print(f"Expired {expired} export files; marked {stale} stalled jobs as failed.")
 
 ####################################################
 # ADMIN ENDPOINTS
@@ -181,44 +3088,16 @@ class ChatMessage(db.Model):
 # --- 1. Admin Dashboard ---
 @app.route('/admin/dashboard/summary', methods=['GET'])
 def admin_dashboard_summary():
-    active_employees = Employee.query.filter_by(is_active=True).count()
-    open_tasks = Task.query.filter_by(status='Open').count()
-    todays_shifts = Shift.query.filter_by(status='Active').count()
-    pending_requests = TimeOffRequest.query.filter_by(status='Pending').count()
-    return jsonify({
-        "activeEmployees": active_employees,
-        "openTasks": open_tasks,
-        "todaysShifts": todays_shifts,
-        "timeOffRequests": pending_requests
-    }), 200
+    return jsonify(dashboard_counts()), 200
 
 # --- 2. Admin Employee Management ---
 @app.route('/admin/employees', methods=['GET'])
 def admin_get_employees():
-    emps = Employee.query.all()
-    data = [{
-        "id": e.id,
-        "first_name": e.first_name,
-        "last_name": e.last_name,
-        "department": e.department,
-        "is_active": e.is_active,
-        "twoFactor": e.two_factor_enabled,
-        "role": e.role
-    } for e in emps]
-    return jsonify(data), 200
+    return list_response(employee_schema.query(), employee_schema)
 
 @app.route('/admin/employees/<int:employee_id>', methods=['GET'])
 def admin_get_employee(employee_id):
-    e = Employee.query.get_or_404(employee_id)
-    return jsonify({
-        "id": e.id,
-        "first_name": e.first_name,
-        "last_name": e.last_name,
-        "department": e.department,
-        "is_active": e.is_active,
-        "twoFactor": e.two_factor_enabled,
-        "role": e.role
-    }), 200
+    return json_response(fieldset(employee_schema).get_or_404(employee_id)), 200
 
 @app.route('/admin/employees', methods=['POST'])
 def admin_create_employee():
@@ -263,19 +3142,12 @@ def admin_delete_employee(employee_id):
 # --- 3. Admin Communication Management ---
 @app.route('/admin/communications', methods=['GET'])
 def admin_get_communications():
-    comms = Communication.query.order_by(Communication.created_at.desc()).all()
-    data = [{"id": c.id, "title": c.title, "message": c.message, "created_at": c.created_at.isoformat()} for c in comms]
-    return jsonify(data), 200
+    return list_response(communication_schema.query(), communication_schema,
+                         sort_col=Communication.created_at, descending=True)
 
 @app.route('/admin/communications/<int:comm_id>', methods=['GET'])
 def admin_get_communication(comm_id):
-    c = Communication.query.get_or_404(comm_id)
-    return jsonify({
-        "id": c.id,
-        "title": c.title,
-        "message": c.message,
-        "created_at": c.created_at.isoformat()
-    }), 200
+    return json_response(fieldset(communication_schema).get_or_404(comm_id)), 200
 
 @app.route('/admin/communications', methods=['POST'])
 def admin_create_communication():
@@ -310,49 +3182,48 @@ def admin_delete_communication(comm_id):
 
 # --- 4. Admin Scheduling (Events) Management ---
 @app.route('/admin/schedule/events', methods=['GET'])
+@cached_resource("events")
 def admin_get_events():
-    events = Event.query.order_by(Event.id.desc()).all()
-    data = [{
-        "id": ev.id,
-        "title": ev.title,
-        "date": ev.date,
-        "time": ev.time,
-        "duration": ev.duration,
-        "description": ev.description,
-        "participants": ev.participants,
-        "color": ev.color
-    } for ev in events]
-    return jsonify(data), 200
+    try:
+        query = date_range_filter(event_schema.query(), Event.date)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    return list_response(query, event_schema, descending=True)
 
 @app.route('/admin/schedule/events/<int:event_id>', methods=['GET'])
+@cached_resource("events")
 def admin_get_event(event_id):
-    ev = Event.query.get_or_404(event_id)
-    return jsonify({
-        "id": ev.id,
-        "title": ev.title,
-        "date": ev.date,
-        "time": ev.time,
-        "duration": ev.duration,
-        "description": ev.description,
-        "participants": ev.participants,
-        "color": ev.color
-    }), 200
+    return json_response(fieldset(event_schema).get_or_404(event_id)), 200
 
 @app.route('/admin/schedule/events', methods=['POST'])
 def admin_create_event():
     data = request.get_json()
-    if not data or not all(k in data for k in ("title", "date", "time")):
+    if not data or not all(data.get(k) for k in ("title", "date", "time")):
         return jsonify({"message": "title, date, and time are required"}), 400
+    try:
+        ev_date = parse_date(data["date"])
+        ev_time = parse_time(data["time"])
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    try:
+        recurrence = event_recurrence(data)
+        participant_ids = event_participant_ids(data)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
     new_ev = Event(
         title=data["title"],
-        date=data["date"],
-        time=data["time"],
+        date=ev_date,
+        time=ev_time,
         duration=data.get("duration", "30 minutes"),
         description=data.get("description", ""),
-        participants=data.get("participants", ""),
-        color=data.get("color", "blue")
+        participants=participants_label(data.get("participants", "")),
+        color=data.get("color", "blue"),
+        **recurrence
     )
     db.session.add(new_ev)
+    db.session.flush()
+    if participant_ids:
+        set_event_participants(new_ev.id, participant_ids)
     db.session.commit()
     return jsonify({"message": "Event created", "event_id": new_ev.id}), 201
 
@@ -362,50 +3233,245 @@ def admin_update_event(event_id):
     data = request.get_json()
     if not data:
         return jsonify({"message": "No input data"}), 400
+    try:
+        ev_date = parse_date(data.get("date")) or ev.date
+        ev_time = parse_time(data.get("time")) or ev.time
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
     ev.title = data.get("title", ev.title)
-    ev.date = data.get("date", ev.date)
-    ev.time = data.get("time", ev.time)
+    ev.date = ev_date
+    ev.time = ev_time
     ev.duration = data.get("duration", ev.duration)
     ev.description = data.get("description", ev.description)
-    ev.participants = data.get("participants", ev.participants)
+    try:
+        recurrence = event_recurrence(data, ev)
+        participant_ids = event_participant_ids(data)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    ev.participants = participants_label(data.get("participants", ev.participants))
     ev.color = data.get("color", ev.color)
+    for name, value in recurrence.items():
+        setattr(ev, name, value)
+    if participant_ids is not None:
+        set_event_participants(ev.id, participant_ids, replace=True)
     db.session.commit()
     return jsonify({"message": "Event updated"}), 200
 
 @app.route('/admin/schedule/events/<int:event_id>', methods=['DELETE'])
 def admin_delete_event(event_id):
     ev = Event.query.get_or_404(event_id)
+    EventParticipant.query.filter_by(event_id=event_id).delete(synchronize_session=False)
     db.session.delete(ev)
     db.session.commit()
     return jsonify({"message": "Event deleted"}), 200
 
+# Participants live in event_participants. Writes accept "participant_ids"
+# (employee ids); a legacy comma-separated "participants" string is resolved
+# to employees by id or by unique "First Last" name, as the migration did.
+RECURRENCES = ("daily", "weekly", "monthly")
+
+def participant_resolver(conn):
+    names = defaultdict(list)
+    ids = set()
+    for employee_id, first, last in conn.execute(
+            select(Employee.id, Employee.first_name, Employee.last_name)):
+        ids.add(employee_id)
+        names[f"{first} {last}".strip().lower()].append(employee_id)
+
+    def resolve(value):
+        found = []
+        for token in (value or "").split(","):
+            token = token.strip()
+            if token.isdigit() and int(token) in ids:
+                found.append(int(token))
+            elif len(names.get(token.lower(), ())) == 1:
+                found.append(names[token.lower()][0])
+        return list(dict.fromkeys(found))
+    return resolve
+
+def participants_label(value):
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    return (value or "")[:Event.participants.type.length]
+
+def event_participant_ids(data):
+    # None when the request doesn't touch participants.
+    if "participant_ids" in data:
+        try:
+            ids = list(dict.fromkeys(int(i) for i in data["participant_ids"] or []))
+        except (TypeError, ValueError):
+            raise ValueError("participant_ids must be a list of integers")
+        known = set()
+        for offset in range(0, len(ids), 500):
+            known.update(i for (i,) in db.session.query(Employee.id).filter(Employee.id.in_(ids[offset:offset + 500])))
+        unknown = [i for i in ids if i not in known]
+        if unknown:
+            raise ValueError("Unknown participant_ids: " + ", ".join(map(str, unknown[:20])))
+        return ids
+    if "participants" in data:
+        value = data["participants"]
+        if isinstance(value, list):
+            value = ",".join(str(v) for v in value)
+        return participant_resolver(db.session.connection())(value)
+    return None
+
+def set_event_participants(event_id, employee_ids, replace=False):
+    participants = EventParticipant.__table__
+    conn = db.session.connection()
+    if replace:
+        conn.execute(delete(participants).where(participants.c.event_id == event_id))
+        existing = set()
+    else:
+        existing = {i for (i,) in conn.execute(
+            select(participants.c.employee_id).where(participants.c.event_id == event_id))}
+    rows = [{"event_id": event_id, "employee_id": i} for i in employee_ids if i not in existing]
+    if rows:
+        conn.execute(participants.insert(), rows)
+    if replace or rows:
+        audit(f"{'set' if replace else 'added'} event_participants of events {event_id} ({len(rows)} added)")
+    # Core statements skip the after_flush version bump.
+    bump_resource_versions(conn, {"events"})
+    return len(rows)
+
+def event_recurrence(data, current=None):
+    values = {}
+    if "recurrence" in data:
+        recurrence = data["recurrence"] or None
+        if recurrence is not None and recurrence not in RECURRENCES:
+            raise ValueError("recurrence must be one of " + ", ".join(RECURRENCES))
+        values["recurrence"] = recurrence
+    if "recurrence_interval" in data:
+        try:
+            interval = int(data["recurrence_interval"] or 1)
+        except (TypeError, ValueError):
+            interval = 0
+        if interval < 1:
+            raise ValueError("recurrence_interval must be a positive integer")
+        values["recurrence_interval"] = interval
+    if "recurrence_until" in data:
+        values["recurrence_until"] = parse_date(data["recurrence_until"])
+    return values
+
+@app.route('/admin/schedule/events/<int:event_id>/participants', methods=['GET'])
+@cached_resource("events", "employees")
+def admin_get_event_participants(event_id):
+    Event.query.get_or_404(event_id)
+    query = event_participant_schema.query().join(Employee, Employee.id == EventParticipant.employee_id) \
+        .filter(EventParticipant.event_id == event_id)
+    return list_response(query, event_participant_schema)
+
+@app.route('/admin/schedule/events/<int:event_id>/participants', methods=['POST'])
+def admin_add_event_participants(event_id):
+    Event.query.get_or_404(event_id)
+    data = request.get_json()
+    if not data or "participant_ids" not in data:
+        return jsonify({"message": "participant_ids is required"}), 400
+    try:
+        ids = event_participant_ids(data)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    added = set_event_participants(event_id, ids)
+    db.session.commit()
+    return jsonify({"message": "Participants added", "added": added}), 201 if added else 200
+
+@app.route('/admin/schedule/events/<int:event_id>/participants/<int:employee_id>', methods=['DELETE'])
+def admin_remove_event_participant(event_id, employee_id):
+    p = EventParticipant.query.filter_by(event_id=event_id, employee_id=employee_id).first_or_404()
+    db.session.delete(p)
+    db.session.commit()
+    return jsonify({"message": "Participant removed"}), 200
+
+def add_months(day, months):
+    # None when the month has no such day (e.g. the 31st); those are skipped.
+    month = day.month - 1 + months
+    try:
+        return day.replace(year=day.year + month // 12, month=month % 12 + 1)
+    except ValueError:
+        return None
+
+def occurrences(ev, start, end):
+    # Lazily yields the event's dates within [start, end].
+    if not ev.recurrence:
+        if start <= ev.date <= end:
+            yield ev.date
+        return
+    interval = ev.recurrence_interval or 1
+    last = min(end, ev.recurrence_until) if ev.recurrence_until else end
+    if ev.recurrence == "monthly":
+        # Jump straight to the first period that can fall inside the window.
+        n = max(0, ((start.year - ev.date.year) * 12 + start.month - ev.date.month) // interval)
+        while add_months(ev.date.replace(day=1), n * interval) <= last:
+            day = add_months(ev.date, n * interval)
+            if day is not None and start <= day <= last:
+                yield day
+            n += 1
+        return
+    step = interval * (7 if ev.recurrence == "weekly" else 1)
+    n = max(0, -(-(start - ev.date).days // step))
+    day = ev.date + timedelta(days=n * step)
+    while day <= last:
+        yield day
+        day += timedelta(days=step)
+
+def calendar_events_query(start, end, employee_id=None, department=None):
+    # Single events inside the window, plus recurring events that started
+    # before its end and are still running at its start.
+    query = db.session.query(Event).filter(
+        Event.date <= end,
+        or_(Event.date >= start,
+            Event.recurrence.isnot(None) & (or_(Event.recurrence_until.is_(None), Event.recurrence_until >= start))),
+    )
+    if employee_id is not None:
+        query = query.filter(Event.id.in_(
+            select(EventParticipant.event_id).where(EventParticipant.employee_id == employee_id)))
+    if department is not None:
+        query = query.filter(Event.id.in_(
+            select(EventParticipant.event_id)
+            .join(Employee, Employee.id == EventParticipant.employee_id)
+            .where(Employee.department == department)))
+    return query
+
+@app.route('/admin/schedule/calendar', methods=['GET'])
+def admin_get_calendar():
+    # ?from=&to= (inclusive, at most a year apart) and ?employee_id= or
+    # ?department=. Returns occurrences ordered by date and time.
+    try:
+        start = parse_date(request.args.get("from"))
+        end = parse_date(request.args.get("to"))
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    if start is None or end is None or end < start:
+        return jsonify({"message": "from and to are required, with from <= to"}), 400
+    if (end - start).days > 366:
+        return jsonify({"message": "The calendar window is limited to one year"}), 400
+    employee_id = request.args.get("employee_id", type=int)
+    department = request.args.get("department")
+    events = calendar_events_query(start, end, employee_id, department).all()
+    items = [((day, ev.time, ev.id), ev) for ev in events for day in occurrences(ev, start, end)]
+    items.sort(key=lambda item: item[0])
+    return json_response([{
+        "event_id": ev.id,
+        "title": ev.title,
+        "date": day.isoformat(),
+        "time": format_time(ev.time),
+        "duration": ev.duration,
+        "color": ev.color,
+        "recurring": bool(ev.recurrence),
+    } for (day, _, _), ev in items]), 200
+
 # --- 5. Admin Time Tracking Management: Attendance ---
 @app.route('/admin/time/attendance', methods=['GET'])
 def admin_get_attendance():
-    records = Attendance.query.order_by(Attendance.date.desc()).all()
-    data = [{
-        "id": a.id,
-        "employee_id": a.employee_id,
-        "date": a.date,
-        "is_late": a.is_late,
-        "hours_worked": a.hours_worked,
-        "break_time": a.break_time,
-        "status": a.status
-    } for a in records]
-    return jsonify(data), 200
+    try:
+        query = date_range_filter(attendance_schema.query(), Attendance.date)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    return list_response(query, attendance_schema,
+                         sort_col=Attendance.date, descending=True)
 
 @app.route('/admin/time/attendance/<int:att_id>', methods=['GET'])
 def admin_get_attendance_record(att_id):
-    a = Attendance.query.get_or_404(att_id)
-    return jsonify({
-        "id": a.id,
-        "employee_id": a.employee_id,
-        "date": a.date,
-        "is_late": a.is_late,
-        "hours_worked": a.hours_worked,
-        "break_time": a.break_time,
-        "status": a.status
-    }), 200
+    return json_response(fieldset(attendance_schema).get_or_404(att_id)), 200
 
 @app.route('/admin/time/attendance', methods=['POST'])
 def admin_create_attendance():
@@ -413,9 +3479,15 @@ def admin_create_attendance():
     required = ["employee_id", "date", "hours_worked", "status"]
     if not data or not all(f in data for f in required):
         return jsonify({"message": "Missing required fields"}), 400
+    try:
+        att_date = parse_date(data["date"])
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    if att_date is None:
+        return jsonify({"message": "Missing required fields"}), 400
     new_att = Attendance(
         employee_id=data["employee_id"],
-        date=data["date"],
+        date=att_date,
         is_late=data.get("is_late", False),
         hours_worked=data["hours_worked"],
         break_time=data.get("break_time", 0.0),
@@ -425,14 +3497,219 @@ def admin_create_attendance():
     db.session.commit()
     return jsonify({"message": "Attendance record created", "attendance_id": new_att.id}), 201
 
+# Bulk import accepts a JSON array, NDJSON (application/x-ndjson) or CSV, either
+# as the request body (text/csv) or as a multipart upload in the "file" field.
+# Rows are validated one by one and inserted in batches of BULK_BATCH_SIZE with
+# one executemany INSERT and one commit per batch; bad rows are reported and
+# skipped without aborting the import.
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == "":
+        return False
+    value = str(value).strip().lower()
+    if value in ("1", "true", "yes", "y"):
+        return True
+    if value in ("0", "false", "no", "n"):
+        return False
+    raise ValueError(f"Invalid boolean: {value!r}")
+
+def batches(rows, size):
+    rows = iter(rows)
+    return iter(lambda: list(itertools.islice(rows, size)), [])
+
+def bulk_input_rows():
+    # Yields (row number, dict) pairs; row numbers are 1-based data rows.
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, name, mimetype = upload.stream, (upload.filename or "").lower(), upload.mimetype
+    else:
+        stream, name, mimetype = request.stream, "", request.mimetype
+    if name.endswith(".csv") or mimetype in ("text/csv", "application/csv"):
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        yield from enumerate(reader, 1)
+    elif name.endswith((".ndjson", ".jsonl")) or mimetype in ("application/x-ndjson", "application/jsonl"):
+        row_no = 0
+        for line in io.TextIOWrapper(stream, encoding="utf-8"):
+            if not line.strip():
+                continue
+            row_no += 1
+            try:
+                yield row_no, json.loads(line)
+            except ValueError:
+                yield row_no, None
+    else:
+        yield from enumerate(iter_json_array(stream), 1)
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    # Decodes a top-level JSON array one element at a time, so memory is
+    # bounded by the largest element rather than by the body.
+    reader = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        chunk = reader.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+        return not eof
+
+    def peek():
+        # Next non-whitespace character, or "" at the end of the body.
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or not more():
+                return buf[pos:pos + 1]
+
+    if peek() != "[":
+        raise ValueError("Expected a JSON array, NDJSON or CSV body")
+    pos += 1
+    if peek() == "]":
+        return
+    while True:
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError as exc:
+                if more():
+                    continue
+                raise ValueError(f"Invalid JSON: {exc}")
+            # A number could continue in the next chunk.
+            if end == len(buf) and more():
+                continue
+            break
+        pos = end
+        yield value
+        char = peek()
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError("Invalid JSON: expected ',' or ']' between array elements")
+        pos += 1
+
+def attendance_row(data):
+    if not isinstance(data, dict):
+        raise ValueError("Row is not an object")
+    missing = [f for f in ("employee_id", "date", "hours_worked", "status") if data.get(f) in (None, "")]
+    if missing:
+        raise ValueError("Missing required fields: " + ", ".join(missing))
+    try:
+        employee_id = int(data["employee_id"])
+        hours_worked = float(data["hours_worked"])
+        break_time = float(data.get("break_time") or 0.0)
+    except (TypeError, ValueError):
+        raise ValueError("employee_id, hours_worked and break_time must be numeric")
+    status = str(data["status"])
+    if len(status) > Attendance.status.type.length:
+        raise ValueError("status is too long")
+    return {
+        "employee_id": employee_id,
+        "date": parse_date(data["date"]),
+        "is_late": parse_bool(data.get("is_late")),
+        "hours_worked": hours_worked,
+        "break_time": break_time,
+        "status": status,
+    }
+
+class BulkErrors:
+    # Per-row errors of a streamed import: every failure is counted, only the
+    # first `limit` are kept for the response.
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.kept = []
+
+    def append(self, error):
+        self.count += 1
+        if len(self.kept) < self.limit:
+            self.kept.append(error)
+
+    def extend(self, errors):
+        for error in errors:
+            self.append(error)
+
+def insert_attendance_batch(batch, errors):
+    # batch: list of (row number, values). Unknown employees are rejected up
+    # front so a foreign-key failure can't take the whole batch down.
+    ids = {values["employee_id"] for _, values in batch}
+    known = {i for (i,) in db.session.query(Employee.id).filter(Employee.id.in_(ids))}
+    rows = []
+    for row_no, values in batch:
+        if values["employee_id"] in known:
+            rows.append(values)
+        else:
+            errors.append({"row": row_no, "message": f"Unknown employee_id {values['employee_id']}"})
+    if not rows:
+        return 0
+    try:
+        db.session.execute(Attendance.__table__.insert(), rows)
+        apply_rollup_deltas(db.session.connection(), attendance_totals(rows))
+        audit(f"bulk created attendance ({len(rows)} rows)")
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        errors.extend({"row": row_no, "message": f"Batch failed: {exc.__class__.__name__}"}
+                      for row_no, values in batch if values["employee_id"] in known)
+        return 0
+    return len(rows)
+
+@app.route('/admin/time/attendance/bulk', methods=['POST'])
+def admin_bulk_create_attendance():
+    # Rows read before BULK_ABORT_AFTER_ERRORS failures are imported as
+    # usual; the rest of the input is not read.
+    batch_size = app.config['BULK_BATCH_SIZE']
+    abort_after = app.config['BULK_ABORT_AFTER_ERRORS']
+    inserted = 0
+    total = 0
+    errors = BulkErrors(app.config['BULK_MAX_ERRORS'])
+    batch = []
+    stopped = False
+    try:
+        for row_no, data in bulk_input_rows():
+            total += 1
+            try:
+                batch.append((row_no, attendance_row(data)))
+            except ValueError as exc:
+                errors.append({"row": row_no, "message": str(exc)})
+            if len(batch) >= batch_size:
+                inserted += insert_attendance_batch(batch, errors)
+                batch = []
+            if abort_after and errors.count >= abort_after:
+                stopped = True
+                break
+    except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+        if not total:
+            return jsonify({"message": str(exc)}), 400
+        errors.append({"row": total + 1, "message": f"Unreadable input: {exc}"})
+    if batch:
+        inserted += insert_attendance_batch(batch, errors)
+    return jsonify({
+        "message": f"Attendance import stopped after {errors.count} errors" if stopped
+                   else "Attendance import finished",
+        "received": total,
+        "inserted": inserted,
+        "failed": errors.count,
+        "errors": errors.kept,
+        "errors_truncated": errors.count > len(errors.kept),
+        "stopped_early": stopped
+    }), 201 if inserted else (400 if errors.count else 200)
+
 @app.route('/admin/time/attendance/<int:att_id>', methods=['PUT'])
 def admin_update_attendance(att_id):
     a = Attendance.query.get_or_404(att_id)
     data = request.get_json()
     if not data:
         return jsonify({"message": "No input data"}), 400
+    try:
+        att_date = parse_date(data.get("date")) or a.date
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
     a.employee_id = data.get("employee_id", a.employee_id)
-    a.date = data.get("date", a.date)
+    a.date = att_date
     a.is_late = data.get("is_late", a.is_late)
     a.hours_worked = data.get("hours_worked", a.hours_worked)
     a.break_time = data.get("break_time", a.break_time)
@@ -447,17 +3724,574 @@ def admin_delete_attendance(att_id):
     db.session.commit()
     return jsonify({"message": "Attendance record deleted"}), 200
 
+# Totals from attendance_rollups:
+#   ?by=employee|department  ?period=day|week|month  ?from=&to= (inclusive dates)
+#   ?employee_id=  ?department=
+def attendance_analytics_query(by, grain, start=None, end=None, employee_id=None, department=None):
+    schema = department_rollup_schema if by == "department" else attendance_rollup_schema
+    query = schema.query().filter(AttendanceRollup.grain == grain)
+    if start is not None:
+        query = query.filter(AttendanceRollup.period_start >= period_start(grain, start))
+    if end is not None:
+        query = query.filter(AttendanceRollup.period_start <= end)
+    if employee_id is not None:
+        query = query.filter(AttendanceRollup.employee_id == employee_id)
+    if by == "department" or department is not None:
+        query = query.join(Employee, Employee.id == AttendanceRollup.employee_id)
+    if department is not None:
+        query = query.filter(Employee.department == department)
+    if by == "department":
+        return query.group_by(AttendanceRollup.period_start, Employee.department).order_by(
+            AttendanceRollup.period_start, Employee.department)
+    return query.order_by(AttendanceRollup.period_start, AttendanceRollup.employee_id)
+
+@app.route('/admin/time/attendance/analytics', methods=['GET'])
+def admin_attendance_analytics():
+    by = request.args.get("by", "employee")
+    grain = request.args.get("period", "day")
+    if by not in ("employee", "department"):
+        return jsonify({"message": "by must be 'employee' or 'department'"}), 400
+    if grain not in ROLLUP_GRAINS:
+        return jsonify({"message": "period must be 'day', 'week' or 'month'"}), 400
+    try:
+        start = parse_date(request.args.get("from"))
+        end = parse_date(request.args.get("to"))
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    query = attendance_analytics_query(by, grain, start, end,
+                                       request.args.get("employee_id", type=int),
+                                       request.args.get("department"))
+    schema = department_rollup_schema if by == "department" else attendance_rollup_schema
+    return stream_rows(query, schema), 200
+
+# --- 5b. Admin Time Tracking Management: Shifts ---
+@app.route('/admin/time/shifts', methods=['GET'])
+def admin_get_shifts():
+    try:
+        query = date_range_filter(shift_schema.query(), Shift.start_time)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    employee_id = request.args.get("employee_id", type=int)
+    if employee_id is not None:
+        query = query.filter(Shift.employee_id == employee_id)
+    return list_response(query, shift_schema, sort_col=Shift.start_time)
+
+@app.route('/admin/time/shifts/<int:shift_id>', methods=['GET'])
+def admin_get_shift(shift_id):
+    return json_response(fieldset(shift_schema).get_or_404(shift_id)), 200
+
+# Conflicts are found without pairwise comparisons: the busy intervals of the
+# employees involved (live shifts, approved time off and approved leave) are
+# loaded with one indexed range query per table and kept per employee in an
+# IntervalIndex, and each proposed shift is a bisect into its employee's index.
+class IntervalIndex:
+    # Intervals sorted by start plus a running maximum of their ends: the
+    # bisect finds those starting before the probe ends, and the running
+    # maximum tells whether any of them is still open when the probe starts.
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda iv: iv[0])
+        self.starts = [iv[0] for iv in self.intervals]
+        self.max_ends = list(itertools.accumulate((iv[1] for iv in self.intervals), max))
+
+    def find(self, start, end):
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_ends[i] > start:
+            if self.intervals[i][1] > start:
+                return self.intervals[i]
+            i -= 1
+        return None
+
+def busy_intervals(employee_ids, window_start, window_end, exclude_shift_id=None):
+    max_length = timedelta(hours=app.config['SHIFT_MAX_HOURS'])
+    first_day, last_day = window_start.date(), window_end.date()
+    intervals = defaultdict(list)
+    ids = sorted(set(employee_ids))
+    for offset in range(0, len(ids), 500):
+        chunk = ids[offset:offset + 500]
+        shifts = db.session.query(Shift.id, Shift.employee_id, Shift.start_time, Shift.end_time).filter(
+            Shift.employee_id.in_(chunk),
+            Shift.start_time >= window_start - max_length,
+            Shift.start_time < window_end,
+            Shift.end_time > window_start,
+            Shift.status != "Cancelled",
+        )
+        for shift_id, employee_id, start, end in shifts:
+            if shift_id != exclude_shift_id:
+                intervals[employee_id].append((start, end, f"shift {shift_id}"))
+        for model, label in ((TimeOffRequest, "time off"), (LeaveRequest, "leave")):
+            ranges = db.session.query(model.id, model.employee_id, model.start_date, model.end_date).filter(
+                model.employee_id.in_(chunk),
+                model.start_date <= last_day,
+                model.end_date >= first_day,
+                model.status == "Approved",
+            )
+            for range_id, employee_id, start, end in ranges:
+                intervals[employee_id].append((datetime.combine(start, time_of_day()),
+                                               datetime.combine(end + timedelta(days=1), time_of_day()),
+                                               f"{label} {range_id}"))
+    return {employee_id: IntervalIndex(ivs) for employee_id, ivs in intervals.items()}
+
+def lock_shift_employees(employee_ids):
+    # Serializes shift writes per employee, so a conflict check and the insert
+    # that follows it can't interleave with another request's. SQLite ignores
+    # FOR UPDATE; there a no-op UPDATE takes the database write lock instead.
+    ids = sorted(set(employee_ids))
+    sqlite = db.session.connection().dialect.name == "sqlite"
+    for offset in range(0, len(ids), 500):
+        chunk = ids[offset:offset + 500]
+        if sqlite:
+            db.session.execute(update(Employee.__table__).where(Employee.id.in_(chunk)).values(id=Employee.id))
+        else:
+            db.session.query(Employee.id).filter(Employee.id.in_(chunk)).order_by(Employee.id).with_for_update().all()
+
+def shift_conflicts(candidates, exclude_shift_id=None):
+    # candidates: dicts with employee_id, start_time, end_time and a "row"
+    # label. Returns one error per conflicting candidate, including clashes
+    # between candidates themselves.
+    if not candidates:
+        return []
+    window_start = min(c["start_time"] for c in candidates)
+    window_end = max(c["end_time"] for c in candidates)
+    indexes = busy_intervals([c["employee_id"] for c in candidates], window_start, window_end, exclude_shift_id)
+    errors = []
+    open_until = {}
+    for c in sorted(candidates, key=lambda c: (c["employee_id"], c["start_time"])):
+        index = indexes.get(c["employee_id"])
+        clash = index.find(c["start_time"], c["end_time"]) if index is not None else None
+        if clash is not None:
+            errors.append({"row": c["row"], "employee_id": c["employee_id"],
+                           "message": f"Overlaps {clash[2]}"})
+        elif open_until.get(c["employee_id"], c["start_time"]) > c["start_time"]:
+            errors.append({"row": c["row"], "employee_id": c["employee_id"],
+                           "message": "Overlaps another shift in this schedule"})
+        else:
+            open_until[c["employee_id"]] = c["end_time"]
+    return errors
+
+def shift_values(data, current=None):
+    def pick(name):
+        return data.get(name, getattr(current, name) if current is not None else None)
+    start = parse_datetime(pick("start_time"))
+    end = parse_datetime(pick("end_time"))
+    if pick("employee_id") in (None, "") or start is None or end is None:
+        raise ValueError("employee_id, start_time and end_time are required")
+    try:
+        employee_id = int(pick("employee_id"))
+    except (TypeError, ValueError):
+        raise ValueError("employee_id must be an integer")
+    if end <= start:
+        raise ValueError("end_time must be after start_time")
+    if end - start > timedelta(hours=app.config['SHIFT_MAX_HOURS']):
+        raise ValueError(f"Shifts are limited to {app.config['SHIFT_MAX_HOURS']:g} hours")
+    return {"employee_id": employee_id, "start_time": start, "end_time": end,
+            "status": pick("status") or "Active"}
+
+@app.route('/admin/time/shifts', methods=['POST'])
+def admin_create_shift():
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    try:
+        values = shift_values(data)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    if values["status"] != "Cancelled":
+        lock_shift_employees([values["employee_id"]])
+        errors = shift_conflicts([dict(values, row=1)])
+        if errors:
+            db.session.rollback()
+            return jsonify({"message": errors[0]["message"]}), 409
+    new_shift = Shift(**values)
+    db.session.add(new_shift)
+    db.session.commit()
+    return jsonify({"message": "Shift created", "shift_id": new_shift.id}), 201
+
+@app.route('/admin/time/shifts/<int:shift_id>', methods=['PUT'])
+def admin_update_shift(shift_id):
+    s = Shift.query.get_or_404(shift_id)
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    try:
+        values = shift_values(data, s)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    if values["status"] != "Cancelled":
+        lock_shift_employees([values["employee_id"]])
+        errors = shift_conflicts([dict(values, row=1)], exclude_shift_id=s.id)
+        if errors:
+            db.session.rollback()
+            return jsonify({"message": errors[0]["message"]}), 409
+    s.employee_id = values["employee_id"]
+    s.start_time = values["start_time"]
+    s.end_time = values["end_time"]
+    s.status = values["status"]
+    db.session.commit()
+    return jsonify({"message": "Shift updated"}), 200
+
+@app.route('/admin/time/shifts/<int:shift_id>', methods=['DELETE'])
+def admin_delete_shift(shift_id):
+    s = Shift.query.get_or_404(shift_id)
+    db.session.delete(s)
+    db.session.commit()
+    return jsonify({"message": "Shift deleted"}), 200
+
+def generated_shifts(data):
+    # A week of shifts for every active employee of a department:
+    # {"department", "week_start", "start": "09:00", "end": "17:00",
+    #  "weekdays": [0, 1, 2, 3, 4]}  (0 = Monday; end <= start runs overnight)
+    if not data.get("department") or not data.get("week_start"):
+        raise ValueError("department and week_start are required")
+    week_start = parse_date(data["week_start"])
+    start = parse_time(data.get("start", "09:00"))
+    end = parse_time(data.get("end", "17:00"))
+    weekdays = data.get("weekdays", [0, 1, 2, 3, 4])
+    if not isinstance(weekdays, list) or not all(isinstance(d, int) and 0 <= d <= 6 for d in weekdays):
+        raise ValueError("weekdays must be a list of integers 0-6")
+    employee_ids = [i for (i,) in db.session.query(Employee.id).filter(
+        Employee.department == data["department"], Employee.is_active == True).order_by(Employee.id)]
+    rows = []
+    for offset in range(7):
+        day = week_start + timedelta(days=offset)
+        if day.weekday() not in weekdays:
+            continue
+        shift_start = datetime.combine(day, start)
+        shift_end = datetime.combine(day if end > start else day + timedelta(days=1), end)
+        for employee_id in employee_ids:
+            rows.append({"employee_id": employee_id, "start_time": shift_start,
+                         "end_time": shift_end, "status": "Active"})
+    return rows
+
+@app.route('/admin/time/shifts/bulk', methods=['POST'])
+def admin_bulk_create_shifts():
+    # Either generates a department's week (see generated_shifts) or takes an
+    # explicit roster as {"shifts": [...]}. Conflicting shifts are reported and
+    # skipped; the rest are inserted in one transaction. ?dry_run=1 only checks.
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    errors = []
+    candidates = []
+    try:
+        if "shifts" in data:
+            if not isinstance(data["shifts"], list):
+                raise ValueError("shifts must be a list")
+            for row_no, item in enumerate(data["shifts"], 1):
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError("Row is not an object")
+                    candidates.append(dict(shift_values(item), row=row_no))
+                except ValueError as exc:
+                    errors.append({"row": row_no, "message": str(exc)})
+        else:
+            candidates = [dict(values, row=row_no)
+                          for row_no, values in enumerate(generated_shifts(data), 1)]
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    received = len(data["shifts"]) if "shifts" in data else len(candidates)
+    known = set()
+    ids = sorted({c["employee_id"] for c in candidates})
+    for offset in range(0, len(ids), 500):
+        known.update(i for (i,) in db.session.query(Employee.id).filter(Employee.id.in_(ids[offset:offset + 500])))
+    for c in candidates:
+        if c["employee_id"] not in known:
+            errors.append({"row": c["row"], "message": f"Unknown employee_id {c['employee_id']}"})
+    candidates = [c for c in candidates if c["employee_id"] in known]
+    live = [c for c in candidates if c["status"] != "Cancelled"]
+    dry_run = parse_bool(request.args.get("dry_run"))
+    if live and not dry_run:
+        lock_shift_employees(c["employee_id"] for c in live)
+    conflicts = shift_conflicts(live)
+    errors.extend(conflicts)
+    rejected = {e["row"] for e in conflicts}
+    rows = [{k: v for k, v in c.items() if k != "row"} for c in candidates if c["row"] not in rejected]
+    if rows and not dry_run:
+        batch_size = app.config['BULK_BATCH_SIZE']
+        for offset in range(0, len(rows), batch_size):
+            db.session.execute(Shift.__table__.insert(), rows[offset:offset + batch_size])
+        audit(f"bulk created shifts ({len(rows)} rows)")
+        db.session.commit()
+        # Core inserts bypass the dashboard delta hooks.
+        invalidate_dashboard()
+    errors.sort(key=lambda e: e["row"])
+    max_errors = app.config['BULK_MAX_ERRORS']
+    return jsonify({
+        "message": "Shift schedule checked" if dry_run else "Shift schedule created",
+        "received": received,
+        "created": 0 if dry_run else len(rows),
+        "valid": len(rows),
+        "failed": len(errors),
+        "errors": errors[:max_errors],
+        "errors_truncated": len(errors) > max_errors
+    }), 200 if dry_run else (201 if rows else 400)
+
+# --- 5c. Admin Time Tracking Management: Leave ---
+# Every decision on an employee's leave first locks that employee's balance
+# row for the year (SELECT ... FOR UPDATE), so approvals for one employee run
+# one at a time while different employees proceed in parallel. The balance
+# is then charged with a guarded UPDATE (remaining >= days), which also keeps
+# SQLite, where FOR UPDATE is a no-op, from ever overdrawing it. Balances
+# are per calendar year, so a request may not span two years.
+LEAVE_BALANCE_COLUMNS = {
+    "Annual": "annual_remaining",
+    "Sick": "sick_remaining",
+    "Other": "other_remaining",
+}
+
+class LeaveError(Exception):
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+class LeaveConflict(LeaveError):
+    # A guarded write lost a race after the checks passed; the caller must
+    # roll back the whole transaction.
+    pass
+
+def lock_leave_balance(employee_id, year):
+    balance = db.session.query(EmployeeLeaveBalance).filter(
+        EmployeeLeaveBalance.employee_id == employee_id,
+        EmployeeLeaveBalance.year == year,
+    ).with_for_update().populate_existing().first()
+    if balance is None:
+        raise LeaveError(f"No leave balance for employee {employee_id} in {year}")
+    return balance
+
+def overlapping_leave(employee_id, start, end, statuses, exclude_id=None):
+    # Seeks ix_leave_requests_employee_id_start_date: start_date <= end, then
+    # filters the few candidates on end_date >= start.
+    query = db.session.query(LeaveRequest.id).filter(
+        LeaveRequest.employee_id == employee_id,
+        LeaveRequest.start_date <= end,
+        LeaveRequest.end_date >= start,
+        LeaveRequest.status.in_(statuses),
+    )
+    if exclude_id is not None:
+        query = query.filter(LeaveRequest.id != exclude_id)
+    return query.first()
+
+def approve_leave(leave_id):
+    leave = db.session.query(LeaveRequest.employee_id, LeaveRequest.start_date).filter(
+        LeaveRequest.id == leave_id).first()
+    if leave is None:
+        raise LeaveError(f"Leave request {leave_id} not found", 404)
+    balance = lock_leave_balance(leave.employee_id, leave.start_date.year)
+    # Re-read under the lock: another approver may have decided it meanwhile.
+    leave = db.session.query(LeaveRequest).filter(LeaveRequest.id == leave_id).populate_existing().one()
+    if leave.status != "Pending":
+        raise LeaveError(f"Leave request {leave_id} is already {leave.status}")
+    # Rows older than these endpoints may hold any leave_type and no days.
+    if leave.leave_type not in LEAVE_BALANCE_COLUMNS:
+        raise LeaveError(f"Leave request {leave_id} has unknown leave_type {leave.leave_type!r}")
+    if leave.days is None or leave.days <= 0:
+        raise LeaveError(f"Leave request {leave_id} has no positive number of days")
+    if leave.end_date.year != leave.start_date.year:
+        raise LeaveError(f"Leave request {leave_id} spans two years")
+    if overlapping_leave(leave.employee_id, leave.start_date, leave.end_date, ("Approved",), leave.id):
+        raise LeaveError(f"Leave request {leave_id} overlaps approved leave")
+    column = LEAVE_BALANCE_COLUMNS[leave.leave_type]
+    days = leave.days
+    if (getattr(balance, column) or 0.0) < days:
+        raise LeaveError(f"Insufficient {leave.leave_type.lower()} leave balance for request {leave_id}")
+    balances = EmployeeLeaveBalance.__table__
+    charged = db.session.execute(
+        update(balances)
+        .where(balances.c.id == balance.id, balances.c[column] >= days)
+        .values({column: balances.c[column] - days,
+                 "total_taken": func.coalesce(balances.c.total_taken, 0.0) + days})
+    ).rowcount
+    leaves = LeaveRequest.__table__
+    decided = charged and db.session.execute(
+        update(leaves).where(leaves.c.id == leave_id, leaves.c.status == "Pending").values(status="Approved")
+    ).rowcount
+    if not decided:
+        raise LeaveConflict(f"Leave request {leave_id} changed concurrently, retry")
+    audit(f"approved leave_requests {leave_id} (charged {days:g} {column})")
+
+@app.route('/admin/time/leave/requests', methods=['GET'])
+def admin_get_leave_requests():
+    query = leave_request_schema.query()
+    try:
+        query = date_range_filter(query, LeaveRequest.start_date)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    if request.args.get("status"):
+        query = query.filter(LeaveRequest.status == request.args["status"])
+    employee_id = request.args.get("employee_id", type=int)
+    if employee_id is not None:
+        query = query.filter(LeaveRequest.employee_id == employee_id)
+    return list_response(query, leave_request_schema)
+
+@app.route('/admin/time/leave/requests/<int:leave_id>', methods=['GET'])
+def admin_get_leave_request(leave_id):
+    return json_response(fieldset(leave_request_schema).get_or_404(leave_id)), 200
+
+@app.route('/admin/time/leave/requests', methods=['POST'])
+def admin_create_leave_request():
+    data = request.get_json()
+    required = ["employee_id", "start_date", "end_date"]
+    if not data or not all(data.get(f) not in (None, "") for f in required):
+        return jsonify({"message": "Missing required fields"}), 400
+    leave_type = data.get("leave_type", "Annual")
+    if leave_type not in LEAVE_BALANCE_COLUMNS:
+        return jsonify({"message": "leave_type must be one of " + ", ".join(LEAVE_BALANCE_COLUMNS)}), 400
+    try:
+        start = parse_date(data["start_date"])
+        end = parse_date(data["end_date"])
+        days = float(data["days"]) if data.get("days") is not None else float((end - start).days + 1)
+    except (TypeError, ValueError) as exc:
+        return jsonify({"message": str(exc)}), 400
+    if end < start:
+        return jsonify({"message": "end_date must not be before start_date"}), 400
+    if end.year != start.year:
+        return jsonify({"message": "Leave may not span two years; submit one request per year"}), 400
+    if days <= 0:
+        return jsonify({"message": "days must be positive"}), 400
+    try:
+        balance = lock_leave_balance(data["employee_id"], start.year)
+        if overlapping_leave(balance.employee_id, start, end, ("Pending", "Approved")):
+            raise LeaveError("Overlaps an existing leave request")
+        if (getattr(balance, LEAVE_BALANCE_COLUMNS[leave_type]) or 0.0) < days:
+            raise LeaveError(f"Insufficient {leave_type.lower()} leave balance")
+    except LeaveError as exc:
+        db.session.rollback()
+        return jsonify({"message": exc.message}), exc.status
+    leave = LeaveRequest(employee_id=balance.employee_id, leave_type=leave_type,
+                         start_date=start, end_date=end, days=days)
+    db.session.add(leave)
+    db.session.commit()
+    return jsonify({"message": "Leave request created", "leave_id": leave.id}), 201
+
+@app.route('/admin/time/leave/requests/<int:leave_id>/approve', methods=['POST'])
+def admin_approve_leave_request(leave_id):
+    try:
+        approve_leave(leave_id)
+    except LeaveError as exc:
+        db.session.rollback()
+        return jsonify({"message": exc.message}), exc.status
+    db.session.commit()
+    return jsonify({"message": "Leave request approved"}), 200
+
+@app.route('/admin/time/leave/requests/<int:leave_id>/reject', methods=['POST'])
+def admin_reject_leave_request(leave_id):
+    leaves = LeaveRequest.__table__
+    rejected = db.session.execute(
+        update(leaves).where(leaves.c.id == leave_id, leaves.c.status == "Pending").values(status="Rejected")
+    ).rowcount
+    if not rejected:
+        db.session.rollback()
+        status = db.session.query(LeaveRequest.status).filter(LeaveRequest.id == leave_id).scalar()
+        if status is None:
+            abort(404)
+        return jsonify({"message": f"Leave request is already {status}"}), 409
+    audit(f"rejected leave_requests {leave_id}")
+    db.session.commit()
+    return jsonify({"message": "Leave request rejected"}), 200
+
+@app.route('/admin/time/leave/requests/approve', methods=['POST'])
+def admin_bulk_approve_leave_requests():
+    # Body: {"ids": [...]}. Requests are approved in (employee, year) order, so
+    # concurrent bulk runs take balance locks in the same order and cannot
+    # deadlock, and committed in transactions of BULK_BATCH_SIZE approvals.
+    data = request.get_json()
+    if not data or not isinstance(data.get("ids"), list):
+        return jsonify({"message": "Expected {\"ids\": [...]}"}), 400
+    try:
+        ids = {int(i) for i in data["ids"]}
+    except (TypeError, ValueError):
+        return jsonify({"message": "ids must be integers"}), 400
+    found = db.session.query(LeaveRequest.id, LeaveRequest.employee_id, LeaveRequest.start_date).filter(
+        LeaveRequest.id.in_(ids)).all()
+    errors = [{"id": i, "message": "Leave request not found"} for i in sorted(ids - {row.id for row in found})]
+    ordered = [row.id for row in sorted(found, key=lambda r: (r.employee_id, r.start_date.year, r.id))]
+    batch_size = app.config['BULK_BATCH_SIZE']
+    approved = 0
+    for offset in range(0, len(ordered), batch_size):
+        chunk = ordered[offset:offset + batch_size]
+        chunk_errors = []
+        try:
+            for leave_id in chunk:
+                try:
+                    approve_leave(leave_id)
+                except LeaveConflict:
+                    raise
+                except LeaveError as exc:
+                    chunk_errors.append({"id": leave_id, "message": exc.message})
+            db.session.commit()
+        except LeaveConflict as exc:
+            db.session.rollback()
+            errors.extend({"id": leave_id, "message": f"Batch failed: {exc.message}"} for leave_id in chunk)
+            continue
+        approved += len(chunk) - len(chunk_errors)
+        errors.extend(chunk_errors)
+    max_errors = app.config['BULK_MAX_ERRORS']
+    return jsonify({
+        "message": "Leave approvals finished",
+        "received": len(ids),
+        "approved": approved,
+        "failed": len(errors),
+        "errors": errors[:max_errors],
+        "errors_truncated": len(errors) > max_errors
+    }), 200
+
+@app.route('/admin/time/leave/balances', methods=['GET'])
+def admin_get_leave_balances():
+    query = leave_balance_schema.query()
+    employee_id = request.args.get("employee_id", type=int)
+    if employee_id is not None:
+        query = query.filter(EmployeeLeaveBalance.employee_id == employee_id)
+    year = request.args.get("year", type=int)
+    if year is not None:
+        query = query.filter(EmployeeLeaveBalance.year == year)
+    return list_response(query, leave_balance_schema)
+
+@app.route('/admin/time/leave/balances', methods=['POST'])
+def admin_create_leave_balance():
+    data = request.get_json()
+    if not data or "employee_id" not in data:
+        return jsonify({"message": "Missing required fields"}), 400
+    year = data.get("year", date.today().year)
+    exists = db.session.query(EmployeeLeaveBalance.id).filter(
+        EmployeeLeaveBalance.employee_id == data["employee_id"], EmployeeLeaveBalance.year == year).first()
+    if exists:
+        return jsonify({"message": "A leave balance for that employee and year already exists"}), 409
+    balance = EmployeeLeaveBalance(
+        employee_id=data["employee_id"],
+        year=year,
+        annual_remaining=data.get("annual_remaining", 0.0),
+        sick_remaining=data.get("sick_remaining", 0.0),
+        other_remaining=data.get("other_remaining", 0.0),
+        total_taken=data.get("total_taken", 0.0)
+    )
+    db.session.add(balance)
+    db.session.commit()
+    return jsonify({"message": "Leave balance created", "balance_id": balance.id}), 201
+
+@app.route('/admin/time/leave/balances/<int:balance_id>', methods=['PUT'])
+def admin_update_leave_balance(balance_id):
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    # Locked like an approval so an adjustment can't interleave with one.
+    b = EmployeeLeaveBalance.query.filter_by(id=balance_id).with_for_update().first_or_404()
+    b.annual_remaining = data.get("annual_remaining", b.annual_remaining)
+    b.sick_remaining = data.get("sick_remaining", b.sick_remaining)
+    b.other_remaining = data.get("other_remaining", b.other_remaining)
+    b.total_taken = data.get("total_taken", b.total_taken)
+    db.session.commit()
+    return jsonify({"message": "Leave balance updated"}), 200
+
 # --- 6. Admin Time Tracking Management: Projects ---
 @app.route('/admin/time/projects', methods=['GET'])
+@cached_resource("projects")
 def admin_get_projects():
-    projects = Project.query.all()
-    data = [{"id": p.id, "name": p.name, "progress": p.progress} for p in projects]
-    return jsonify(data), 200
+    return json_response(fieldset(project_schema).all()), 200
 
 @app.route('/admin/time/projects/<int:project_id>', methods=['GET'])
+@cached_resource("projects")
 def admin_get_project(project_id):
-    p = Project.query.get_or_404(project_id)
-    return jsonify({"id": p.id, "name": p.name, "progress": p.progress}), 200
+    return json_response(fieldset(project_schema).get_or_404(project_id)), 200
 
 @app.route('/admin/time/projects', methods=['POST'])
 def admin_create_project():
@@ -493,40 +4327,29 @@ def admin_delete_project(project_id):
 # --- 7. Admin Tasks Management ---
 @app.route('/admin/tasks', methods=['GET'])
 def admin_get_tasks():
-    tasks = Task.query.all()
-    data = [{
-        "id": t.id,
-        "title": t.title,
-        "description": t.description,
-        "due_date": t.due_date,
-        "priority": t.priority,
-        "status": t.status,
-        "assigned_to": t.assigned_to
-    } for t in tasks]
-    return jsonify(data), 200
+    try:
+        query = date_range_filter(task_schema.query(), Task.due_date)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    return list_response(query, task_schema)
 
 @app.route('/admin/tasks/<int:task_id>', methods=['GET'])
 def admin_get_task(task_id):
-    t = Task.query.get_or_404(task_id)
-    return jsonify({
-        "id": t.id,
-        "title": t.title,
-        "description": t.description,
-        "due_date": t.due_date,
-        "priority": t.priority,
-        "status": t.status,
-        "assigned_to": t.assigned_to
-    }), 200
+    return json_response(fieldset(task_schema).get_or_404(task_id)), 200
 
 @app.route('/admin/tasks', methods=['POST'])
 def admin_create_task():
     data = request.get_json()
     if not data or "title" not in data:
         return jsonify({"message": "title is required"}), 400
+    try:
+        due_date = parse_date(data.get("due_date"))
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
     new_task = Task(
         title=data["title"],
         description=data.get("description", ""),
-        due_date=data.get("due_date", ""),
+        due_date=due_date,
         priority=data.get("priority", "Medium"),
         status=data.get("status", "Open"),
         assigned_to=data.get("assigned_to")
@@ -541,9 +4364,13 @@ def admin_update_task(task_id):
     data = request.get_json()
     if not data:
         return jsonify({"message": "No input data"}), 400
+    try:
+        due_date = parse_date(data["due_date"]) if "due_date" in data else t.due_date
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
     t.title = data.get("title", t.title)
     t.description = data.get("description", t.description)
-    t.due_date = data.get("due_date", t.due_date)
+    t.due_date = due_date
     t.priority = data.get("priority", t.priority)
     t.status = data.get("status", t.status)
     t.assigned_to = data.get("assigned_to", t.assigned_to)
@@ -557,17 +4384,111 @@ def admin_delete_task(task_id):
     db.session.commit()
     return jsonify({"message": "Task deleted"}), 200
 
+# Bulk task operations run as a single UPDATE/DELETE ... WHERE without loading
+# any rows. The body selects tasks either by {"ids": [...]} or by
+# {"filter": {"status", "priority", "assigned_to", "due_from", "due_to"}};
+# bulk update also takes {"patch": {...}} with the fields to set.
+TASK_PATCH_FIELDS = ("title", "description", "due_date", "priority", "status", "assigned_to")
+
+def task_selection(data):
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            raise ValueError("ids must be a non-empty list of integers")
+        return [Task.id.in_(ids)]
+    criteria = data.get("filter")
+    if not isinstance(criteria, dict) or not criteria:
+        raise ValueError("ids or a non-empty filter is required")
+    unknown = set(criteria) - {"status", "priority", "assigned_to", "due_from", "due_to"}
+    if unknown:
+        raise ValueError("Unknown filter fields: " + ", ".join(sorted(unknown)))
+    clauses = []
+    for field in ("status", "priority", "assigned_to"):
+        if field in criteria:
+            clauses.append(getattr(Task, field) == criteria[field])
+    if "due_from" in criteria:
+        clauses.append(Task.due_date >= parse_date(criteria["due_from"]))
+    if "due_to" in criteria:
+        clauses.append(Task.due_date <= parse_date(criteria["due_to"]))
+    return clauses
+
+def task_patch(patch):
+    if not isinstance(patch, dict) or not patch:
+        raise ValueError("patch must be a non-empty object")
+    unknown = set(patch) - set(TASK_PATCH_FIELDS)
+    if unknown:
+        raise ValueError("Fields cannot be bulk updated: " + ", ".join(sorted(unknown)))
+    values = dict(patch)
+    for name in ("title", "description", "status", "priority"):
+        if name in values:
+            if not isinstance(values[name], str):
+                raise ValueError(f"{name} must be a string")
+            if len(values[name]) > Task.__table__.c[name].type.length:
+                raise ValueError(f"{name} is longer than {Task.__table__.c[name].type.length} characters")
+    if "title" in values and not values["title"].strip():
+        raise ValueError("title must not be empty")
+    if "due_date" in values:
+        values["due_date"] = parse_date(values["due_date"])
+    if "assigned_to" in values and values["assigned_to"] is not None and (
+            not isinstance(values["assigned_to"], int) or isinstance(values["assigned_to"], bool)):
+        raise ValueError("assigned_to must be an employee id or null")
+    if values.get("assigned_to") is not None and db.session.get(Employee, values["assigned_to"]) is None:
+        raise ValueError(f"Unknown employee {values['assigned_to']}")
+    return values
+
+@app.route('/admin/tasks/bulk', methods=['PUT'])
+def admin_bulk_update_tasks():
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    try:
+        clauses = task_selection(data)
+        values = task_patch(data.get("patch"))
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    reindex = []
+    if {"title", "description"} & set(values):
+        reindex = [i for (i,) in db.session.query(Task.id).filter(*clauses)]
+    result = db.session.execute(
+        update(Task).where(*clauses).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    for ids in batches(reindex, app.config['BULK_BATCH_SIZE']):
+        reindex_search(db.session.connection(), Task, Task.id.in_(ids))
+    audit(f"bulk updated tasks {result.rowcount} ({', '.join(sorted(values))})")
+    db.session.commit()
+    # Core statements bypass the flush hooks that keep the counters current.
+    invalidate_dashboard()
+    return jsonify({"message": "Tasks updated", "updated": result.rowcount}), 200
+
+@app.route('/admin/tasks/bulk', methods=['DELETE'])
+def admin_bulk_delete_tasks():
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    try:
+        clauses = task_selection(data)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    unindex_search(db.session.connection(), Task, *clauses)
+    result = db.session.execute(
+        delete(Task).where(*clauses).execution_options(synchronize_session=False)
+    )
+    audit(f"bulk deleted tasks {result.rowcount}")
+    db.session.commit()
+    invalidate_dashboard()
+    return jsonify({"message": "Tasks deleted", "deleted": result.rowcount}), 200
+
 # --- 8. Admin Projects Management (Separate) ---
 @app.route('/admin/projects', methods=['GET'])
+@cached_resource("projects")
 def admin_get_all_projects():
-    projects = Project.query.all()
-    data = [{"id": p.id, "name": p.name, "progress": p.progress} for p in projects]
-    return jsonify(data), 200
+    return json_response(fieldset(project_schema).all()), 200
 
 @app.route('/admin/projects/<int:project_id>', methods=['GET'])
+@cached_resource("projects")
 def admin_get_single_project(project_id):
-    p = Project.query.get_or_404(project_id)
-    return jsonify({"id": p.id, "name": p.name, "progress": p.progress}), 200
+    return json_response(fieldset(project_schema).get_or_404(project_id)), 200
 
 @app.route('/admin/projects', methods=['POST'])
 def admin_create_project_separate():
@@ -602,29 +4523,15 @@ def admin_delete_project_separate(project_id):
 
 # --- 9. Admin Compliance Management (Policy) ---
 @app.route('/admin/compliance/documents', methods=['GET'])
+@cached_resource("policy_documents")
 def admin_get_policy_documents():
-    docs = PolicyDocument.query.order_by(PolicyDocument.created_at.desc()).all()
-    data = [{
-        "id": d.id,
-        "title": d.title,
-        "description": d.description,
-        "status": d.status,
-        "doc_url": d.doc_url,
-        "created_at": d.created_at.isoformat()
-    } for d in docs]
-    return jsonify(data), 200
+    return list_response(policy_document_schema.query(), policy_document_schema,
+                         sort_col=PolicyDocument.created_at, descending=True)
 
 @app.route('/admin/compliance/documents/<int:doc_id>', methods=['GET'])
+@cached_resource("policy_documents")
 def admin_get_policy_document(doc_id):
-    d = PolicyDocument.query.get_or_404(doc_id)
-    return jsonify({
-        "id": d.id,
-        "title": d.title,
-        "description": d.description,
-        "status": d.status,
-        "doc_url": d.doc_url,
-        "created_at": d.created_at.isoformat()
-    }), 200
+    return json_response(fieldset(policy_document_schema).get_or_404(doc_id)), 200
 
 @app.route('/admin/compliance/documents', methods=['POST'])
 def admin_create_policy_document():
@@ -661,78 +4568,472 @@ def admin_delete_policy_document(doc_id):
     db.session.commit()
     return jsonify({"message": "Policy document deleted"}), 200
 
+def ack_history_query(user_id):
+    return ack_history_schema.query().select_from(PolicyAcknowledgement).join(
+        PolicyDocument, PolicyAcknowledgement.policy_id == PolicyDocument.id
+    ).filter(PolicyAcknowledgement.user_id == user_id).order_by(PolicyAcknowledgement.ack_date.desc())
+
+# Coverage of Active policies over active employees (optionally one
+# department). Outstanding pairs are an anti-join: every (policy, employee)
+# with no Acknowledged row, answered from the (policy_id, user_id, ack_status)
+# index alone.
+def acknowledged_exists():
+    return select(PolicyAcknowledgement.id).where(
+        PolicyAcknowledgement.policy_id == PolicyDocument.id,
+        PolicyAcknowledgement.user_id == Employee.id,
+        PolicyAcknowledgement.ack_status == "Acknowledged",
+    ).exists()
+
+def active_employees_filter(department=None):
+    condition = Employee.is_active == True
+    if department is not None:
+        condition = condition & (Employee.department == department)
+    return condition
+
+def coverage_statement(department=None):
+    total = select(func.count()).select_from(Employee).where(
+        active_employees_filter(department)).scalar_subquery()
+    acknowledged = select(func.count(func.distinct(PolicyAcknowledgement.user_id))).select_from(
+        PolicyAcknowledgement).join(Employee, Employee.id == PolicyAcknowledgement.user_id).where(
+        PolicyAcknowledgement.policy_id == PolicyDocument.id,
+        PolicyAcknowledgement.ack_status == "Acknowledged",
+        active_employees_filter(department),
+    ).correlate(PolicyDocument).scalar_subquery()
+    return select(PolicyDocument.id, PolicyDocument.title, total.label("total"),
+                  acknowledged.label("acknowledged")).where(
+        PolicyDocument.status == "Active").order_by(PolicyDocument.id)
+
+def outstanding_acks_query(policy_id=None, department=None):
+    query = outstanding_ack_schema.query().select_from(PolicyDocument).join(
+        Employee, active_employees_filter(department)
+    ).filter(PolicyDocument.status == "Active", ~acknowledged_exists())
+    if policy_id is not None:
+        query = query.filter(PolicyDocument.id == policy_id)
+    return query.order_by(PolicyDocument.id, Employee.id)
+
+@app.route('/admin/compliance/coverage', methods=['GET'])
+def admin_get_policy_coverage():
+    rows = db.session.execute(coverage_statement(request.args.get("department"))).all()
+    return json_response([{
+        "policy_id": policy_id,
+        "title": title,
+        "employees": total,
+        "acknowledged": acknowledged,
+        "outstanding": total - acknowledged,
+        "completion": round(100.0 * acknowledged / total, 2) if total else 100.0,
+    } for policy_id, title, total, acknowledged in rows]), 200
+
+@app.route('/admin/compliance/coverage/outstanding', methods=['GET'])
+def admin_get_outstanding_acks():
+    # ?format=ndjson (default) or csv; ?policy_id= and ?department= narrow it.
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"message": "format must be 'ndjson' or 'csv'"}), 400
+    query = outstanding_acks_query(request.args.get("policy_id", type=int), request.args.get("department"))
+    if fmt == "csv":
+        return stream_csv(query, outstanding_ack_schema, "outstanding-acknowledgements.csv"), 200
+    return stream_rows(query, outstanding_ack_schema, ndjson=True), 200
+
 @app.route('/admin/compliance/ack-history', methods=['GET'])
 def admin_get_ack_history():
     user_id = request.args.get("user_id", type=int)
     if not user_id:
         return jsonify({"message": "user_id query param is required"}), 400
-    acks = db.session.query(PolicyAcknowledgement, PolicyDocument).join(
-        PolicyDocument, PolicyAcknowledgement.policy_id == PolicyDocument.id
-    ).filter(PolicyAcknowledgement.user_id == user_id).order_by(PolicyAcknowledgement.ack_date.desc()).all()
-    data = []
-    for ack, d in acks:
-        data.append({
-            "policy_id": d.id,
-            "title": d.title,
-            "ack_status": ack.ack_status,
-            "ack_date": ack.ack_date.isoformat()
-        })
-    return jsonify(data), 200
+    return json_response(ack_history_schema.dump_rows(ack_history_query(user_id))), 200
+
+# --- 9b. Admin Activity Log ---
+@app.route('/admin/activity-log', methods=['GET'])
+def admin_get_activity_log():
+    # Newest first; ?from=&to= narrow by date, ?after=&limit= page.
+    try:
+        query = date_range_filter(activity_log_schema.query(), ActivityLog.timestamp)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    return list_response(query, activity_log_schema, sort_col=ActivityLog.timestamp, descending=True)
 
 # --- 10. Admin Chat Management (Already covered in public endpoints) ---
 @app.route('/admin/chat/rooms', methods=['GET'])
+@cached_resource("chat_rooms")
 def admin_get_chat_rooms():
-    rooms = ChatRoom.query.all()
-    data = [{"id": r.id, "name": r.name, "created_at": r.created_at.isoformat()} for r in rooms]
-    return jsonify(data), 200
+    return json_response(fieldset(chat_room_schema).all()), 200
 
 @app.route('/admin/chat/rooms/<int:room_id>', methods=['DELETE'])
 def admin_delete_chat_room(room_id):
     r = ChatRoom.query.get_or_404(room_id)
+    ChatRoomMember.query.filter_by(room_id=room_id).delete(synchronize_session=False)
     db.session.delete(r)
     db.session.commit()
+    room_members.discard(room_id)
+    if recent_messages is not None:
+        recent_messages.discard(room_id)
     return jsonify({"message": "Chat room deleted"}), 200
 
+@app.route('/admin/chat/rooms/<int:room_id>/members', methods=['GET'])
+def admin_get_chat_room_members(room_id):
+    ChatRoom.query.get_or_404(room_id)
+    return jsonify(sorted(room_members.members(room_id))), 200
+
+@app.route('/admin/chat/rooms/<int:room_id>/members', methods=['POST'])
+def admin_add_chat_room_member(room_id):
+    ChatRoom.query.get_or_404(room_id)
+    data = request.get_json()
+    if not data or "user_id" not in data:
+        return jsonify({"message": "user_id is required"}), 400
+    if db.session.get(Employee, data["user_id"]) is None:
+        return jsonify({"message": "Unknown user_id"}), 400
+    if ChatRoomMember.query.filter_by(room_id=room_id, user_id=data["user_id"]).first():
+        return jsonify({"message": "Already a member"}), 200
+    db.session.add(ChatRoomMember(room_id=room_id, user_id=data["user_id"]))
+    db.session.commit()
+    return jsonify({"message": "Member added"}), 201
+
+@app.route('/admin/chat/rooms/<int:room_id>/members/<int:user_id>', methods=['DELETE'])
+def admin_remove_chat_room_member(room_id, user_id):
+    m = ChatRoomMember.query.filter_by(room_id=room_id, user_id=user_id).first_or_404()
+    db.session.delete(m)
+    db.session.commit()
+    return jsonify({"message": "Member removed"}), 200
+
+@app.route('/admin/chat/rooms/<int:room_id>/messages', methods=['GET'])
+def admin_get_chat_messages(room_id):
+    ChatRoom.query.get_or_404(room_id)
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"message": "limit must be a positive integer"}), 400
+    try:
+        before_ts = parse_datetime(request.args.get("before_ts"))
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    try:
+        messages, next_before = chat_history(
+            room_id, request.args.get("before", type=int), before_ts, limit)
+    except InvalidCursor:
+        return jsonify({"message": "Unknown cursor"}), 400
+    resp = jsonify(messages)
+    if next_before is not None:
+        resp.headers["X-Next-Cursor"] = str(next_before)
+    return resp, 200
+
+# --- 11. Admin Database Monitoring ---
+@app.route('/admin/db/pool', methods=['GET'])
+def admin_get_db_pool():
+    return jsonify({label: pool_status(engine) for label, engine in database_engines()}), 200
+
+@app.route('/admin/db/health', methods=['GET'])
+def admin_get_db_health():
+    results = {}
+    healthy = True
+    for label, engine in database_engines():
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            results[label] = {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as exc:
+            healthy = False
+            results[label] = {"ok": False, "error": exc.__class__.__name__}
+    return jsonify(results), 200 if healthy else 503
+
+@app.route('/admin/metrics', methods=['GET'])
+def admin_get_metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# --- 12. Admin Search ---
+@app.route('/admin/search', methods=['GET'])
+def admin_search():
+    terms = search_terms(request.args.get("q", ""))
+    if not terms:
+        return jsonify({"message": "q must contain at least one word"}), 400
+    kinds = [k for k in request.args.get("kind", "").split(",") if k]
+    unknown = set(kinds) - set(SEARCH_KINDS)
+    if unknown:
+        return jsonify({"message": "Unknown kinds: " + ", ".join(sorted(unknown))}), 400
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", 0, type=int)
+    if (limit is not None and limit < 1) or offset < 0:
+        return jsonify({"message": "limit must be positive and offset non-negative"}), 400
+    limit = min(limit or app.config['SEARCH_PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+    rows = search_query(terms, kinds).limit(limit + 1).offset(offset).all()
+    resp = json_response([search_result(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        args = request.args.to_dict()
+        args.update(offset=offset + limit, limit=limit)
+        resp.headers["X-Next-Cursor"] = str(offset + limit)
+        resp.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return resp, 200
+
+# --- 13. Admin Exports ---
+@app.route('/admin/exports', methods=['GET'])
+def admin_get_exports():
+    query = export_job_schema.query()
+    if request.args.get("status"):
+        query = query.filter(ExportJob.status == request.args["status"])
+    return list_response(query, export_job_schema, descending=True)
+
+@app.route('/admin/exports/<int:job_id>', methods=['GET'])
+def admin_get_export(job_id):
+    return json_response(fieldset(export_job_schema).get_or_404(job_id)), 200
+
+@app.route('/admin/exports', methods=['POST'])
+def admin_create_export():
+    data = request.get_json()
+    if not data:
+        return jsonify({"message": "No input data"}), 400
+    try:
+        report, fmt, params = export_params(data)
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+    job = ExportJob(report=report, format=fmt, params=json.dumps(params, sort_keys=True))
+    db.session.add(job)
+    db.session.commit()
+    if export_workers is not None:
+        export_workers.notify()
+    resp = json_response(export_job_schema.dump(job), 202)
+    resp.headers["Location"] = f"/admin/exports/{job.id}"
+    return resp
+
+@app.route('/admin/exports/<int:job_id>/download', methods=['GET'])
+def admin_download_export(job_id):
+    job = ExportJob.query.get_or_404(job_id)
+    if job.status == "Expired":
+        return jsonify({"message": "Export has expired"}), 410
+    if job.status != "Completed":
+        return jsonify({"message": f"Export is {job.status.lower()}"}), 409
+    path = export_path(job.id, job.format)
+    if not os.path.exists(path):
+        return jsonify({"message": "Export file not found"}), 404
+    name = f"{job.report}-{json.loads(job.params)['from']}-{job.id}.{job.format}"
+    return send_file(path, mimetype=EXPORT_FORMATS[job.format], as_attachment=True, download_name=name)
+
+@app.route('/admin/exports/<int:job_id>/cancel', methods=['POST'])
+def admin_cancel_export(job_id):
+    ExportJob.query.get_or_404(job_id)
+    result = db.session.execute(
+        update(ExportJob).where(ExportJob.id == job_id, ExportJob.status.in_(EXPORT_ACTIVE))
+        .values(status="Cancelled", finished_at=datetime.utcnow())
+    )
+    if not result.rowcount:
+        db.session.rollback()
+        return jsonify({"message": "Export has already finished"}), 409
+    audit(f"cancelled export {job_id}")
+    db.session.commit()
+    emit_export_progress(job_id)
+    return json_response(export_job_schema.get_or_404(job_id)), 200
+
+@app.route('/admin/exports/<int:job_id>', methods=['DELETE'])
+def admin_delete_export(job_id):
+    # A running job notices the missing row at its next progress update.
+    job = ExportJob.query.get_or_404(job_id)
+    path = export_path(job.id, job.format)
+    db.session.delete(job)
+    db.session.commit()
+    if os.path.exists(path):
+        os.remove(path)
+    return jsonify({"message": "Export deleted"}), 200
+
 # --- SOCKET.IO EVENTS FOR CHAT (Public) ---
-@socketio.on('join')
+@socketio_event('join')
 def on_join(data):
     room_id = data.get("room_id")
     user_id = data.get("user_id")
     if room_id and user_id:
+        ids = chat_ids(room_id, user_id)
+        if ids is None or not room_members.is_member(*ids):
+            emit("error", {"message": "Not a member of this room", "room_id": room_id})
+            return
         join_room(str(room_id))
-        print(f"User {user_id} joined room {room_id}")
+        app.logger.info("User %s joined room %s", user_id, room_id)
+        messages, next_before = chat_history(ids[0])
+        emit("history", {"room_id": room_id, "messages": messages, "next_before": next_before})
+
+@socketio_event('history')
+def on_history(data):
+    room_id = data.get("room_id")
+    if not room_id:
+        return
+    ids = chat_ids(room_id, data.get("user_id"))
+    if ids is None or not room_members.is_member(*ids):
+        emit("error", {"message": "Not a member of this room", "room_id": room_id})
+        return
+    try:
+        before = int(data["before"]) if data.get("before") is not None else None
+        limit = int(data["limit"]) if data.get("limit") else None
+        messages, next_before = chat_history(int(room_id), before, limit=limit)
+    except (InvalidCursor, TypeError, ValueError):
+        emit("history", {"room_id": room_id, "messages": [], "next_before": None, "error": "Unknown cursor"})
+        return
+    emit("history", {"room_id": room_id, "messages": messages, "next_before": next_before})
 
-@socketio.on('leave')
+@socketio_event('leave')
 def on_leave(data):
     room_id = data.get("room_id")
     user_id = data.get("user_id")
     if room_id and user_id:
         leave_room(str(room_id))
-        print(f"User {user_id} left room {room_id}")
+        app.logger.info("User %s left room %s", user_id, room_id)
 
-@socketio.on('send_message')
+@socketio_event('send_message')
 def on_send_message(data):
     room_id = data.get("room_id")
     sender_id = data.get("sender_id")
     content = data.get("content")
     if not room_id or not sender_id or not content:
         return
-    new_msg = ChatMessage(room_id=room_id, sender_id=sender_id, content=content)
-    db.session.add(new_msg)
-    db.session.commit()
-    socketio.emit("new_message", {
-        "id": new_msg.id,
-        "room_id": new_msg.room_id,
-        "sender_id": new_msg.sender_id,
-        "content": new_msg.content,
-        "timestamp": new_msg.timestamp.isoformat()
-    }, room=str(room_id))
+    ids = chat_ids(room_id, sender_id)
+    if ids is None or not room_members.is_member(*ids):
+        emit("error", {"message": "Not a member of this room", "room_id": room_id})
+        return
+    room_id, sender_id = ids
+    if chat_writer is not None:
+        # Rows are written later in a batch, so check what the database would.
+        content = str(content)
+        if len(content) > ChatMessage.content.type.length:
+            emit("error", {"message": f"Message is longer than {ChatMessage.content.type.length} characters",
+                           "room_id": room_id})
+            return
+        row = chat_writer.submit(room_id, sender_id, content)
+        if row is None:
+            emit("error", {"message": "Chat is busy, message not sent"})
+            return
+        payload = dict(row, timestamp=row["timestamp"].isoformat())
+    else:
+        new_msg = ChatMessage(room_id=room_id, sender_id=sender_id, content=content)
+        db.session.add(new_msg)
+        db.session.commit()
+        payload = chat_message_schema.dump(new_msg)
+    if recent_messages is not None and client_manager is None:
+        recent_messages.append(payload["room_id"], payload)
+    socketio.emit("new_message", payload, room=str(room_id))
+
+# --- SOCKET.IO EVENTS FOR THE DASHBOARD (Admin) ---
+@socketio_event('subscribe_dashboard')
+def on_subscribe_dashboard(data=None):
+    join_room("dashboard")
+    emit("dashboard_update", {"deltas": {}, "counts": dashboard_counts()})
+
+@socketio_event('unsubscribe_dashboard')
+def on_unsubscribe_dashboard(data=None):
+    leave_room("dashboard")
+
+# --- SOCKET.IO EVENTS FOR EXPORTS (Admin) ---
+@socketio_event('watch_export')
+def on_watch_export(data):
+    try:
+        job_id = int(data.get("job_id"))
+    except (TypeError, ValueError):
+        return
+    job = load_export_job(job_id)
+    if job is None:
+        emit("error", {"message": "Export not found", "job_id": job_id})
+        return
+    join_room(f"export:{job_id}")
+    emit("export_progress", export_progress(job))
+
+####################################################
+# QUERY PLAN CHECK
+####################################################
+# Representative statements issued by the endpoints. `flask --app app
+# check-query-plans` EXPLAINs each one against the configured database and
+# exits non-zero if any of them needs a full table scan or a filesort.
+SAMPLE_DATE = date(2024, 1, 1)
+SAMPLE_DATETIME = datetime(2024, 1, 1)
+
+PLAN_CHECKS = [
+    ("dashboard summary", lambda: dashboard_statement()),
+    ("employees page", lambda: keyset_filter(employee_schema.query(), Employee, 1).limit(100)),
+    ("tasks page", lambda: keyset_filter(task_schema.query(), Task, 1).limit(100)),
+    ("open tasks", lambda: task_schema.query().filter(Task.status == 'Open')),
+    ("events page", lambda: keyset_filter(event_schema.query(), Event, 1, descending=True).limit(100)),
+    ("attendance first page", lambda: keyset_filter(
+        attendance_schema.query(), Attendance, None, Attendance.date, True).limit(100)),
+    ("attendance page", lambda: keyset_filter(
+        attendance_schema.query(), Attendance, 1, Attendance.date, True, pivot=SAMPLE_DATE).limit(100)),
+    ("communications page", lambda: keyset_filter(
+        communication_schema.query(), Communication, 1, Communication.created_at, True,
+        pivot=SAMPLE_DATETIME).limit(100)),
+    ("policy documents page", lambda: keyset_filter(
+        policy_document_schema.query(), PolicyDocument, 1, PolicyDocument.created_at, True,
+        pivot=SAMPLE_DATETIME).limit(100)),
+    ("ack history", lambda: ack_history_query(1)),
+    ("attendance month", lambda: keyset_filter(
+        attendance_schema.query().filter(Attendance.date.between(SAMPLE_DATE, SAMPLE_DATE + timedelta(days=30))),
+        Attendance, None, Attendance.date, True).limit(100)),
+    ("shifts week", lambda: keyset_filter(
+        shift_schema.query().filter(Shift.start_time >= SAMPLE_DATETIME,
+                                    Shift.start_time < SAMPLE_DATETIME + timedelta(days=7)),
+        Shift, None, Shift.start_time).limit(100)),
+    ("attendance analytics by employee", lambda: attendance_analytics_query(
+        "employee", "month", SAMPLE_DATE, SAMPLE_DATE + timedelta(days=365))),
+    ("attendance analytics for one employee", lambda: attendance_analytics_query(
+        "employee", "week", SAMPLE_DATE, SAMPLE_DATE + timedelta(days=365), employee_id=1)),
+    ("leave overlap", lambda: db.session.query(LeaveRequest.id).filter(
+        LeaveRequest.employee_id == 1, LeaveRequest.start_date <= SAMPLE_DATE,
+        LeaveRequest.end_date >= SAMPLE_DATE, LeaveRequest.status.in_(("Pending", "Approved")))),
+    ("pending leave page", lambda: keyset_filter(
+        leave_request_schema.query().filter(LeaveRequest.status == "Pending"), LeaveRequest, 1).limit(100)),
+    ("shift conflicts", lambda: db.session.query(Shift.id).filter(
+        Shift.employee_id.in_([1, 2, 3]), Shift.start_time >= SAMPLE_DATETIME,
+        Shift.start_time < SAMPLE_DATETIME + timedelta(days=7), Shift.end_time > SAMPLE_DATETIME)),
+    ("time off conflicts", lambda: db.session.query(TimeOffRequest.id).filter(
+        TimeOffRequest.employee_id.in_([1, 2, 3]), TimeOffRequest.start_date <= SAMPLE_DATE,
+        TimeOffRequest.end_date >= SAMPLE_DATE, TimeOffRequest.status == "Approved")),
+    ("employee calendar", lambda: calendar_events_query(SAMPLE_DATE, SAMPLE_DATE + timedelta(days=7), employee_id=1)),
+    ("policy coverage", lambda: coverage_statement()),
+    ("outstanding acknowledgements", lambda: outstanding_acks_query()),
+    ("activity log page", lambda: keyset_filter(
+        activity_log_schema.query(), ActivityLog, 1, ActivityLog.timestamp, True,
+        pivot=SAMPLE_DATETIME).limit(100)),
+    ("chat room latest", lambda: chat_history_query(1).limit(50)),
+    ("search", lambda: search_query(["quarterly", "rep"]).limit(21)),
+    ("search tasks", lambda: search_query(["quarterly", "rep"], ["task"]).limit(21)),
+    ("chat room history page", lambda: chat_history_query(1, 1, pivot=SAMPLE_DATETIME).limit(50)),
+    ("export queue", lambda: select(ExportJob.id).where(ExportJob.status == "Queued").order_by(ExportJob.id).limit(1)),
+    ("attendance export batch", lambda: select(Attendance.employee_id, Attendance.date, Attendance.status)
+        .where(Attendance.employee_id.in_([1, 2, 3]), Attendance.date.between(SAMPLE_DATE, SAMPLE_DATE))
+        .order_by(Attendance.employee_id, Attendance.date)),
+]
+
+def explain_problems(stmt):
+    stmt = getattr(stmt, "statement", stmt)
+    dialect = db.engine.dialect
+    # Expanding IN parameters are rendered out so EXPLAIN gets plain placeholders.
+    compiled = stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    problems = []
+    with db.engine.connect() as conn:
+        if dialect.name == "sqlite":
+            for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params):
+                detail = row[-1]
+                if detail.startswith("SCAN") and "INDEX" not in detail and "CONSTANT ROW" not in detail:
+                    problems.append(detail)
+                elif "TEMP B-TREE" in detail:
+                    problems.append(detail)
+        elif dialect.name == "mysql":
+            for row in conn.exec_driver_sql("EXPLAIN " + str(compiled), params).mappings():
+                if row["type"] == "ALL":
+                    problems.append(f"full scan of {row['table']}")
+                if row["Extra"] and "filesort" in row["Extra"]:
+                    problems.append(f"filesort on {row['table']}")
+    return problems
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    failed = False
+    for name, build in PLAN_CHECKS:
+        problems = explain_problems(build())
+        print(f"{'FAIL' if problems else 'ok  '} {name}" + (": " + "; ".join(problems) if problems else ""))
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
 
 ####################################################
 # MAIN & TABLE CREATION
 ####################################################
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        print("Tables created (if not already present).")
+        upgrade_db()
+        print("Database schema is up to date.")
+    start_export_workers()
     socketio.run(app, debug=True, port=5000)
@@ -0,0 +1,356 @@
+# Synthetic data and benchmarks, kept out of the web app. The commands are
+# registered on the app's CLI:
+#   flask --app manage seed
+#   flask --app manage benchmark
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.request
+from datetime import date, datetime, timedelta, time as time_of_day
+
+import click
+import socketio as socketio_lib
+from sqlalchemy import func, select, update
+
+from app import (
+    Attendance, ChatMessage, ChatRoom, ChatRoomMember, Employee, IdSequence, Task, app,
+    apply_rollup_deltas, attendance_totals, batches, bump_resource_versions, db, index_search,
+    invalidate_dashboard, socketio, upgrade_db,
+)
+
+####################################################
+# SYNTHETIC DATA
+####################################################
+# `flask --app manage seed` bulk-inserts realistic volumes (by default 100k
+# employees, 10M attendance rows, 1M tasks and 20 busy chat rooms), one
+# BULK_BATCH_SIZE batch per transaction. The same options always produce the
+# same rows. Rows are added to what is there; attendance rollups and resource
+# versions are kept in step. Run it with the app stopped: seeded chat messages
+# take ids a running chat writer may already have reserved.
+SEED_FIRST_NAMES = ("James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+                    "David", "Elizabeth", "Wei", "Aisha", "Carlos", "Fatima", "Hiroshi", "Priya",
+                    "Olga", "Kwame", "Sofia", "Mateo", "Amara", "Lars", "Noor", "Diego")
+SEED_LAST_NAMES = ("Smith", "Johnson", "Garcia", "Brown", "Nguyen", "Khan", "Müller", "Rossi",
+                   "Kowalski", "Okafor", "Tanaka", "Silva", "Cohen", "Ivanova", "Patel", "Dubois",
+                   "Andersen", "Haddad", "Moreau", "Chen", "Lopez", "Novak", "Mensah", "Larsen")
+SEED_DEPARTMENTS = ("Engineering", "Sales", "Support", "Finance", "Operations", "Marketing",
+                    "Human Resources", "Legal")
+SEED_ROLES = ("Employee",) * 12 + ("Manager", "Manager", "Admin")
+SEED_TASK_VERBS = ("Review", "Update", "Prepare", "Audit", "Migrate", "Draft", "Schedule", "Fix")
+SEED_TASK_OBJECTS = ("quarterly report", "onboarding checklist", "payroll export", "vendor contract",
+                     "release notes", "training plan", "inventory count", "client proposal")
+SEED_TASK_STATUSES = ("Open",) * 3 + ("In Progress",) * 2 + ("Completed",) * 5
+SEED_PRIORITIES = ("Low", "Medium", "Medium", "High")
+SEED_CHAT_LINES = ("Morning all", "Can someone review my PR?", "Lunch at 12?", "Deploy is done",
+                   "Who has the client call today?", "Thanks!", "Running 5 minutes late",
+                   "Updated the shared doc", "Any blockers?", "Let's sync after standup")
+
+def seed_rows(table, rows, on_batch=None):
+    count = 0
+    for batch in batches(rows, app.config['BULK_BATCH_SIZE']):
+        with db.engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+            if on_batch is not None:
+                on_batch(conn, batch)
+        count += len(batch)
+    return count
+
+def new_ids(model, after):
+    return [i for (i,) in db.session.query(model.id).filter(model.id > after).order_by(model.id)]
+
+def max_id(model):
+    return db.session.query(func.max(model.id)).scalar() or 0
+
+def seed_employees(rng, count):
+    for _ in range(count):
+        yield {"first_name": rng.choice(SEED_FIRST_NAMES), "last_name": rng.choice(SEED_LAST_NAMES),
+               "department": rng.choice(SEED_DEPARTMENTS), "is_active": rng.random() < 0.95,
+               "two_factor_enabled": rng.random() < 0.4, "role": rng.choice(SEED_ROLES)}
+
+def seed_attendance(rng, employee_ids, count, until):
+    # The same trailing run of weekdays for every employee, employee by
+    # employee, so each batch only touches a few employees' rollups.
+    per_employee = -(-count // len(employee_ids))
+    days = []
+    day = until
+    while len(days) < per_employee:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    days.reverse()
+    for employee_id, day in itertools.islice(itertools.product(employee_ids, days), count):
+        absent = rng.random() < 0.03
+        yield {"employee_id": employee_id, "date": day, "is_late": not absent and rng.random() < 0.08,
+               "hours_worked": 0.0 if absent else round(min(12.0, max(4.0, rng.gauss(8.0, 0.75))), 2),
+               "break_time": 0.0 if absent else rng.choice((0.5, 0.5, 0.75, 1.0)),
+               "status": "Absent" if absent else "Present"}
+
+def seed_tasks(rng, employee_ids, count, until):
+    for _ in range(count):
+        yield {"title": f"{rng.choice(SEED_TASK_VERBS)} {rng.choice(SEED_TASK_OBJECTS)}",
+               "description": "", "due_date": until + timedelta(days=rng.randint(-180, 60)),
+               "priority": rng.choice(SEED_PRIORITIES), "status": rng.choice(SEED_TASK_STATUSES),
+               "assigned_to": rng.choice(employee_ids) if rng.random() < 0.9 else None}
+
+def seed_chat_messages(rng, members, per_room, until):
+    # Rooms are filled one after another, each over the 30 days before `until`.
+    start = datetime.combine(until - timedelta(days=30), time_of_day(8))
+    step = timedelta(days=30) / max(per_room, 1)
+    for room_id, user_ids in members.items():
+        for i in range(per_room):
+            yield {"room_id": room_id, "sender_id": rng.choice(user_ids),
+                   "content": rng.choice(SEED_CHAT_LINES), "timestamp": start + step * i}
+
+def seed_database(rng, employees, attendance, tasks, rooms, messages_per_room, members_per_room, until):
+    counts = {}
+    first = max_id(Employee)
+    counts["employees"] = seed_rows(Employee.__table__, seed_employees(rng, employees))
+    employee_ids = new_ids(Employee, first) or [i for (i,) in db.session.query(Employee.id)]
+    if not employee_ids:
+        raise click.ClickException("No employees to attach attendance, tasks or chat rooms to")
+    counts["attendance"] = seed_rows(
+        Attendance.__table__, seed_attendance(rng, employee_ids, attendance, until),
+        lambda conn, batch: apply_rollup_deltas(conn, attendance_totals(batch)))
+    first_task = max_id(Task)
+    counts["tasks"] = seed_rows(Task.__table__, seed_tasks(rng, employee_ids, tasks, until))
+
+    first = max_id(ChatRoom)
+    created = datetime.combine(until - timedelta(days=31), time_of_day(8))
+    counts["chat rooms"] = seed_rows(
+        ChatRoom.__table__, ({"name": f"{rng.choice(SEED_DEPARTMENTS)} room {n + 1}", "created_at": created}
+                             for n in range(rooms)))
+    members = {room_id: rng.sample(employee_ids, min(members_per_room, len(employee_ids)))
+               for room_id in new_ids(ChatRoom, first)}
+    counts["chat room members"] = seed_rows(
+        ChatRoomMember.__table__, ({"room_id": room_id, "user_id": user_id}
+                                   for room_id, user_ids in members.items() for user_id in user_ids))
+    first_message = max_id(ChatMessage)
+    counts["chat messages"] = seed_rows(
+        ChatMessage.__table__, seed_chat_messages(rng, members, messages_per_room, until))
+
+    with db.engine.begin() as conn:
+        index_search(conn, Task, Task.id > first_task)
+        index_search(conn, ChatMessage, ChatMessage.id > first_message)
+        bump_resource_versions(conn, {"chat_rooms"})
+        # Keep block-allocated chat ids clear of the seeded ones.
+        seq = IdSequence.__table__
+        top = conn.execute(select(func.max(ChatMessage.id))).scalar() or 0
+        conn.execute(update(seq).where(seq.c.name == ChatMessage.__tablename__, seq.c.next_value <= top)
+                     .values(next_value=top + 1))
+    invalidate_dashboard()
+    return counts
+
+@app.cli.command("seed")
+@click.option("--employees", default=100_000, show_default=True)
+@click.option("--attendance", default=10_000_000, show_default=True, help="Attendance rows in total.")
+@click.option("--tasks", default=1_000_000, show_default=True)
+@click.option("--rooms", default=20, show_default=True, help="Chat rooms.")
+@click.option("--messages-per-room", default=50_000, show_default=True)
+@click.option("--members-per-room", default=25, show_default=True)
+@click.option("--until", type=click.DateTime(formats=["%Y-%m-%d"]), default="2024-12-31",
+              show_default=True, help="Last day of generated attendance and chat.")
+@click.option("--seed", "seed_value", default=1, show_default=True, help="Random seed.")
+def seed_command(employees, attendance, tasks, rooms, messages_per_room, members_per_room, until, seed_value):
+    upgrade_db()
+    started = time.perf_counter()
+    counts = seed_database(random.Random(seed_value), employees, attendance, tasks, rooms,
+                           messages_per_room, members_per_room, until.date())
+    for name, count in counts.items():
+        print(f"{name}: {count}")
+    print(f"Seeded in {time.perf_counter() - started:.1f}s.")
+
+####################################################
+# BENCHMARKS
+####################################################
+# `flask --app manage benchmark` drives the admin endpoints below and the
+# send_message Socket.IO path, in process or against a running server
+# (--url; sending over Socket.IO then needs the websocket-client package),
+# and reports throughput and p50/p99 latency per scenario. Request targets
+# are picked from the configured database, so point both at the same one.
+# --save stores the results as a baseline; --baseline compares against one
+# and exits non-zero when p99 rises, throughput drops or errors appear beyond
+# --tolerance. Sending messages adds them to the seeded chat rooms.
+BENCHMARKS = [
+    ("dashboard summary", "/admin/dashboard/summary"),
+    ("employees page", "/admin/employees?limit=100&after={employee_id}"),
+    ("employee detail", "/admin/employees/{employee_id}"),
+    ("tasks page", "/admin/tasks?limit=100&after={task_id}"),
+    ("task detail", "/admin/tasks/{task_id}"),
+    ("attendance week", "/admin/time/attendance?limit=100&from={week_start}&to={week_end}"),
+    ("attendance analytics", "/admin/time/attendance/analytics?period=week&employee_id={employee_id}"),
+    ("chat history", "/admin/chat/rooms/{room_id}/messages?limit=50"),
+    ("search", "/admin/search?q=quarterly+rep"),
+]
+SEND_MESSAGE_BENCHMARK = "send_message"
+
+class BenchmarkTargets:
+    def __init__(self):
+        self.employee_ids = db.session.query(func.min(Employee.id), func.max(Employee.id)).one()
+        self.task_ids = db.session.query(func.min(Task.id), func.max(Task.id)).one()
+        self.members = db.session.query(ChatRoomMember.room_id, ChatRoomMember.user_id).limit(1000).all()
+        self.last_day = db.session.query(func.max(Attendance.date)).scalar() or date.today()
+        if self.employee_ids[0] is None:
+            raise click.ClickException("Nothing to benchmark: run `flask --app manage seed` first")
+
+    def pick(self, rng):
+        room_id, user_id = rng.choice(self.members) if self.members else (0, 0)
+        week_end = self.last_day - timedelta(days=rng.randint(0, 90))
+        return {"employee_id": rng.randint(*self.employee_ids),
+                "task_id": rng.randint(*self.task_ids) if self.task_ids[0] is not None else 0,
+                "room_id": room_id, "user_id": user_id,
+                "week_start": week_end - timedelta(days=6), "week_end": week_end}
+
+def http_worker(base_url, template, targets, rng):
+    if base_url is None:
+        client = app.test_client()
+
+        def step():
+            resp = client.get(template.format(**targets.pick(rng)))
+            resp.get_data()
+            resp.close()
+            return resp.status_code < 400
+        return step
+
+    def step():
+        try:
+            with urllib.request.urlopen(base_url + template.format(**targets.pick(rng)), timeout=30) as resp:
+                resp.read()
+            return True
+        except OSError:  # urllib's HTTPError and URLError included
+            return False
+    return step
+
+def send_message_worker(base_url, targets, rng):
+    room_id, user_id = rng.choice(targets.members)
+    payload = {"room_id": room_id, "sender_id": user_id}
+    if base_url is None:
+        client = socketio.test_client(app)
+        client.emit("join", {"room_id": room_id, "user_id": user_id})
+
+        def step():
+            client.emit("send_message", dict(payload, content=f"benchmark {rng.random()}"))
+            return any(msg["name"] == "new_message" for msg in client.get_received())
+        return step
+
+    # Against a server a send counts once its broadcast comes back.
+    client = socketio_lib.Client()
+    echoed = threading.Event()
+    expected = [None]
+    client.on("new_message", lambda data: expected[0] == data.get("content") and echoed.set())
+    client.connect(base_url, transports=["websocket"])
+    client.emit("join", {"room_id": room_id, "user_id": user_id})
+
+    def step():
+        echoed.clear()
+        expected[0] = f"benchmark {rng.random()}"
+        client.emit("send_message", dict(payload, content=expected[0]))
+        return echoed.wait(30)
+    return step
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * q + 0.5) - 1))]
+
+def run_benchmark(make_step, total, concurrency, warmup):
+    steps = [make_step(n) for n in range(concurrency)]
+    for step in steps:
+        for _ in range(warmup):
+            step()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def drive(step, count):
+        timings = []
+        failed = 0
+        for _ in range(count):
+            started = time.perf_counter()
+            failed += not step()
+            timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=drive, args=(step, total // concurrency + (n < total % concurrency)))
+               for n, step in enumerate(steps)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {"requests": len(latencies), "errors": errors[0],
+            "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3)}
+
+def benchmark_regressions(results, baseline, tolerance):
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p99 {result['p99_ms']:.2f} ms, baseline {base['p99_ms']:.2f} ms")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: {result['throughput']:.1f}/s, baseline {base['throughput']:.1f}/s")
+        if result["errors"] > base["errors"]:
+            problems.append(f"{name}: {result['errors']} errors, baseline {base['errors']}")
+    return problems
+
+@app.cli.command("benchmark")
+@click.option("--url", default=None, help="Base URL of a running server, e.g. http://127.0.0.1:5000. "
+                                         "Runs in process when omitted.")
+@click.option("--requests", "total", default=500, show_default=True, help="Requests per scenario.")
+@click.option("--concurrency", default=4, show_default=True)
+@click.option("--warmup", default=10, show_default=True, help="Untimed requests per client first.")
+@click.option("--only", multiple=True, help="Run just this scenario (repeatable).")
+@click.option("--save", type=click.Path(dir_okay=False), help="Write the results here as a baseline.")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Compare with this baseline.")
+@click.option("--tolerance", default=0.2, show_default=True, help="Allowed relative slowdown.")
+@click.option("--seed", "seed_value", default=1, show_default=True, help="Random seed for targets.")
+def benchmark_command(url, total, concurrency, warmup, only, save, baseline, tolerance, seed_value):
+    targets = BenchmarkTargets()
+    base_url = url.rstrip("/") if url else None
+    scenarios = [(name, lambda n, template=template: http_worker(
+                     base_url, template, targets, random.Random(f"{seed_value}:{template}:{n}")))
+                 for name, template in BENCHMARKS]
+    if targets.members:
+        scenarios.append((SEND_MESSAGE_BENCHMARK, lambda n: send_message_worker(
+            base_url, targets, random.Random(f"{seed_value}:{SEND_MESSAGE_BENCHMARK}:{n}"))))
+    unknown = set(only) - {name for name, _ in scenarios}
+    if unknown:
+        raise click.ClickException(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    settings = {"target": "server" if base_url else "in-process", "database": db.engine.dialect.name,
+                "requests": total, "concurrency": concurrency}
+    results = {}
+    for name, make_step in scenarios:
+        if only and name not in only:
+            continue
+        try:
+            result = results[name] = run_benchmark(make_step, total, concurrency, warmup)
+        except socketio_lib.exceptions.ConnectionError as exc:
+            print(f"skip {name}: {exc}")
+            continue
+        print(f"{name:<24} {result['throughput']:>9.1f}/s  p50 {result['p50_ms']:>8.2f} ms  "
+              f"p99 {result['p99_ms']:>8.2f} ms  errors {result['errors']}")
+
+    if save:
+        with open(save, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if baseline:
+        with open(baseline) as f:
+            stored = json.load(f)
+        if stored.get("settings") != settings:
+            print(f"warning: baseline was taken with {stored.get('settings')}, this run used {settings}")
+        problems = benchmark_regressions(results, stored.get("results", {}), tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            raise SystemExit(1)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time.
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["AUDIT_LOG"] = "0"
+os.environ["EXPORT_WORKERS"] = "0"
+
+from app import Employee, app as flask_app, db, invalidate_dashboard, upgrade_db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    with flask_app.app_context():
+        upgrade_db()
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def clean_db(app):
+    yield
+    with app.app_context():
+        db.session.remove()
+        with db.engine.begin() as conn:
+            for table in reversed(db.metadata.sorted_tables):
+                if table.name != "schema_migrations":
+                    conn.execute(table.delete())
+        invalidate_dashboard()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def employee(app):
+    def create(**values):
+        with app.app_context():
+            emp = Employee(**dict({"first_name": "Ada", "last_name": "Lovelace", "department": "Engineering",
+                                   "is_active": True, "role": "Employee"}, **values))
+            db.session.add(emp)
+            db.session.commit()
+            return emp.id
+    return create
@@ -0,0 +1,41 @@
+import json
+
+from app import Attendance
+
+
+def import_rows(client, rows):
+    body = "\n".join(json.dumps(row) for row in rows)
+    return client.post("/admin/time/attendance/bulk", data=body, content_type="application/x-ndjson")
+
+
+def attendance(employee_id, day):
+    return {"employee_id": employee_id, "date": f"2031-03-{day:02d}", "hours_worked": 8, "status": "Present"}
+
+
+def test_import_reports_bad_rows(app, client, employee):
+    employee_id = employee()
+    resp = import_rows(client, [attendance(employee_id, 3), {"date": "2031-03-04"}, attendance(999999, 5)])
+    body = resp.get_json()
+    assert resp.status_code == 201
+    assert (body["inserted"], body["failed"], body["stopped_early"]) == (1, 2, False)
+    assert [e["row"] for e in body["errors"]] == [2, 3]
+
+
+def test_import_keeps_only_the_first_errors(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "BULK_MAX_ERRORS", 3)
+    body = import_rows(client, [{"date": "2031-03-04"}] * 10).get_json()
+    assert body["failed"] == 10
+    assert [e["row"] for e in body["errors"]] == [1, 2, 3]
+    assert body["errors_truncated"]
+
+
+def test_import_stops_reading_after_too_many_errors(app, client, employee, monkeypatch):
+    monkeypatch.setitem(app.config, "BULK_ABORT_AFTER_ERRORS", 5)
+    employee_id = employee()
+    rows = [attendance(employee_id, 1)] + [{"date": "2031-03-04"}] * 10 + [attendance(employee_id, 2)]
+    resp = import_rows(client, rows)
+    body = resp.get_json()
+    assert resp.status_code == 201
+    assert (body["received"], body["inserted"], body["failed"], body["stopped_early"]) == (6, 1, 5, True)
+    with app.app_context():
+        assert Attendance.query.count() == 1
@@ -0,0 +1,44 @@
+from sqlalchemy import select
+
+from app import ChatMessage, ChatRoom, IdAllocator, IdSequence, db
+
+
+def take(allocator, count):
+    return [allocator.next_id() for _ in range(count)]
+
+
+def add_message(message_id, sender_id):
+    room = ChatRoom(name="General")
+    db.session.add(room)
+    db.session.flush()
+    db.session.add(ChatMessage(id=message_id, room_id=room.id, sender_id=sender_id, content="hi"))
+    db.session.commit()
+
+
+def test_allocators_get_disjoint_blocks(app):
+    with app.app_context():
+        first = IdAllocator(ChatMessage, 10)
+        second = IdAllocator(ChatMessage, 10)
+        ids = take(first, 15) + take(second, 15)
+    assert len(set(ids)) == 30
+    assert ids[:10] == list(range(ids[0], ids[0] + 10))
+
+
+def test_first_block_starts_above_existing_rows(app, employee):
+    sender_id = employee()
+    with app.app_context():
+        add_message(41, sender_id)
+        assert IdAllocator(ChatMessage, 5).next_id() == 42
+
+
+def test_block_skips_rows_written_past_the_sequence(app, employee):
+    sender_id = employee()
+    with app.app_context():
+        start = IdAllocator(ChatMessage, 5).next_id()
+        add_message(start + 100, sender_id)
+        ids = take(IdAllocator(ChatMessage, 5), 5)
+        assert ids[0] == start + 101
+        seq = IdSequence.__table__
+        assert db.session.execute(
+            select(seq.c.next_value).where(seq.c.name == ChatMessage.__tablename__)
+        ).scalar() == start + 106
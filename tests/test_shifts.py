@@ -0,0 +1,88 @@
+import pytest
+
+from app import Shift, TimeOffRequest, db, parse_date
+
+
+@pytest.fixture
+def employee_id(employee):
+    return employee()
+
+
+def create_shift(client, employee_id, start, end, **extra):
+    return client.post("/admin/time/shifts", json=dict(
+        {"employee_id": employee_id, "start_time": start, "end_time": end}, **extra))
+
+
+def test_create_shift(client, employee_id):
+    resp = create_shift(client, employee_id, "2031-03-03 09:00:00", "2031-03-03 17:00:00")
+    assert resp.status_code == 201
+
+
+def test_overlapping_shift_is_rejected(app, client, employee_id):
+    assert create_shift(client, employee_id, "2031-03-03 09:00:00", "2031-03-03 17:00:00").status_code == 201
+    resp = create_shift(client, employee_id, "2031-03-03 16:00:00", "2031-03-03 20:00:00")
+    assert resp.status_code == 409
+    assert resp.get_json()["message"].startswith("Overlaps shift")
+    with app.app_context():
+        assert Shift.query.count() == 1
+
+
+def test_adjacent_and_cancelled_shifts_do_not_conflict(client, employee_id):
+    assert create_shift(client, employee_id, "2031-03-03 09:00:00", "2031-03-03 17:00:00").status_code == 201
+    assert create_shift(client, employee_id, "2031-03-03 17:00:00", "2031-03-03 21:00:00").status_code == 201
+    assert create_shift(client, employee_id, "2031-03-03 10:00:00", "2031-03-03 12:00:00",
+                        status="Cancelled").status_code == 201
+
+
+def test_shift_during_approved_time_off_is_rejected(app, client, employee_id):
+    with app.app_context():
+        db.session.add(TimeOffRequest(employee_id=employee_id, start_date=parse_date("2031-03-03"),
+                                      end_date=parse_date("2031-03-04"), status="Approved"))
+        db.session.commit()
+    resp = create_shift(client, employee_id, "2031-03-04 09:00:00", "2031-03-04 17:00:00")
+    assert resp.status_code == 409
+    assert resp.get_json()["message"].startswith("Overlaps time off")
+
+
+def test_update_does_not_conflict_with_itself(client, employee_id):
+    shift_id = create_shift(client, employee_id, "2031-03-03 09:00:00", "2031-03-03 17:00:00").get_json()["shift_id"]
+    resp = client.put(f"/admin/time/shifts/{shift_id}", json={"end_time": "2031-03-03 18:00:00"})
+    assert resp.status_code == 200
+
+
+def test_update_into_another_shift_is_rejected(client, employee_id):
+    create_shift(client, employee_id, "2031-03-03 09:00:00", "2031-03-03 17:00:00")
+    shift_id = create_shift(client, employee_id, "2031-03-04 09:00:00", "2031-03-04 17:00:00").get_json()["shift_id"]
+    resp = client.put(f"/admin/time/shifts/{shift_id}",
+                      json={"start_time": "2031-03-03 12:00:00", "end_time": "2031-03-03 20:00:00"})
+    assert resp.status_code == 409
+
+
+def test_bulk_reports_conflicts_and_clashes_within_the_batch(app, client, employee, employee_id):
+    other_id = employee(first_name="Grace")
+    create_shift(client, employee_id, "2031-03-03 09:00:00", "2031-03-03 17:00:00")
+    resp = client.post("/admin/time/shifts/bulk", json={"shifts": [
+        {"employee_id": employee_id, "start_time": "2031-03-03 12:00:00", "end_time": "2031-03-03 14:00:00"},
+        {"employee_id": other_id, "start_time": "2031-03-03 09:00:00", "end_time": "2031-03-03 17:00:00"},
+        {"employee_id": other_id, "start_time": "2031-03-03 16:00:00", "end_time": "2031-03-03 22:00:00"},
+        {"employee_id": employee_id, "start_time": "2031-03-04 09:00:00", "end_time": "2031-03-04 17:00:00"},
+        {"employee_id": 999999, "start_time": "2031-03-04 09:00:00", "end_time": "2031-03-04 17:00:00"},
+    ]})
+    body = resp.get_json()
+    assert resp.status_code == 201
+    assert body["created"] == 2
+    assert [(e["row"], e["message"].split()[0]) for e in body["errors"]] == [
+        (1, "Overlaps"), (3, "Overlaps"), (5, "Unknown")]
+    assert body["errors"][1]["message"] == "Overlaps another shift in this schedule"
+    with app.app_context():
+        assert Shift.query.count() == 3
+
+
+def test_bulk_dry_run_writes_nothing(app, client, employee_id):
+    resp = client.post("/admin/time/shifts/bulk?dry_run=1", json={"shifts": [
+        {"employee_id": employee_id, "start_time": "2031-03-03 09:00:00", "end_time": "2031-03-03 17:00:00"},
+    ]})
+    assert resp.status_code == 200
+    assert resp.get_json()["valid"] == 1
+    with app.app_context():
+        assert Shift.query.count() == 0
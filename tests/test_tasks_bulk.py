@@ -0,0 +1,49 @@
+import pytest
+
+from app import Task, db
+
+
+@pytest.fixture
+def task_ids(app):
+    with app.app_context():
+        tasks = [Task(title=f"Task {n}", status="Open", priority="Low") for n in range(3)]
+        db.session.add_all(tasks)
+        db.session.commit()
+        return [t.id for t in tasks]
+
+
+def bulk_update(client, ids, patch):
+    return client.put("/admin/tasks/bulk", json={"ids": ids, "patch": patch})
+
+
+def test_bulk_update_applies_patch(app, client, task_ids, employee):
+    assignee = employee()
+    resp = bulk_update(client, task_ids, {"status": "Completed", "assigned_to": assignee})
+    assert resp.status_code == 200
+    assert resp.get_json()["updated"] == 3
+    with app.app_context():
+        assert {(t.status, t.assigned_to) for t in Task.query} == {("Completed", assignee)}
+
+
+def test_bulk_update_can_unassign(app, client, task_ids):
+    assert bulk_update(client, task_ids, {"assigned_to": None}).status_code == 200
+
+
+@pytest.mark.parametrize("patch", [
+    {"title": None},
+    {"title": "   "},
+    {"title": "x" * 101},
+    {"status": ["Open"]},
+    {"priority": 3},
+    {"description": {"text": "x"}},
+    {"assigned_to": "7"},
+    {"assigned_to": True},
+    {"assigned_to": 999999},
+    {"id": 5},
+    {},
+])
+def test_bulk_update_rejects_bad_patch(app, client, task_ids, patch):
+    resp = bulk_update(client, task_ids, patch)
+    assert resp.status_code == 400
+    with app.app_context():
+        assert {(t.title.startswith("Task"), t.status) for t in Task.query} == {(True, "Open")}
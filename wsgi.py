@@ -0,0 +1,11 @@
+# Production entry point. Socket.IO needs a single eventlet worker per process:
+#   gunicorn --worker-class eventlet -w 1 wsgi:app
+# Scale out by running more of these processes behind a sticky load balancer
+# with SOCKETIO_MESSAGE_QUEUE pointing all of them at the same queue.
+import eventlet
+
+eventlet.monkey_patch()
+
+from app import app, socketio, start_export_workers  # noqa: E402,F401
+
+start_export_workers()